@@ -0,0 +1,444 @@
+"""
+Almacén de conversaciones acotado y seguro para hilos
+Limita el número de sesiones (LRU), expira las sesiones inactivas (TTL)
+y serializa los cambios de cada sesión con su propio lock.
+
+Dos implementaciones con la misma interfaz:
+- AlmacenConversaciones: en memoria del proceso
+- AlmacenConversacionesSQLite: archivo SQLite (WAL) compartido por todos
+  los workers de gunicorn del mismo nodo; sobrevive reinicios
+"""
+import atexit
+import os
+import secrets
+import sqlite3
+import threading
+import time
+import weakref
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class _Sesion:
+    """Historial de una conversación y su lock"""
+
+    __slots__ = ('mensajes', 'lock', 'ultimo_acceso', 'bytes')
+
+    def __init__(self, mensajes):
+        self.mensajes = list(mensajes)
+        self.lock = threading.RLock()
+        self.ultimo_acceso = time.monotonic()
+        self.bytes = 0
+
+
+def tamano_mensaje(mensaje):
+    """Tamaño aproximado en bytes del contenido de un mensaje"""
+    return len(mensaje.get('content', '').encode('utf-8'))
+
+
+class AlmacenConversaciones:
+    """Conversaciones por sesión con límite de sesiones, TTL de inactividad y expulsión LRU
+
+    Los mensajes iniciales (el prompt de sistema) se comparten entre todas
+    las sesiones y no cuentan en la memoria de cada una.
+    """
+
+    def __init__(self, mensajes_iniciales=(), max_sesiones=1000, ttl_segundos=3600, max_mensajes=40):
+        self.mensajes_iniciales = list(mensajes_iniciales)
+        self.max_sesiones = max_sesiones
+        self.ttl_segundos = ttl_segundos
+        self.max_mensajes = max_mensajes
+        self._sesiones = OrderedDict()
+        self._lock = threading.Lock()
+        self._expulsadas_lru = 0
+        self._expiradas_ttl = 0
+
+    def __contains__(self, conversation_id):
+        with self._lock:
+            self._purgar_expiradas()
+            return conversation_id in self._sesiones
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sesiones)
+
+    def _purgar_expiradas(self):
+        """Elimina las sesiones inactivas más antiguas (requiere self._lock)"""
+        limite = time.monotonic() - self.ttl_segundos
+        while self._sesiones:
+            conversation_id, sesion = next(iter(self._sesiones.items()))
+            if sesion.ultimo_acceso >= limite:
+                break
+            del self._sesiones[conversation_id]
+            self._expiradas_ttl += 1
+
+    def _obtener_sesion(self, conversation_id):
+        """Devuelve (creando si hace falta) la sesión y la marca como la más reciente"""
+        with self._lock:
+            self._purgar_expiradas()
+            sesion = self._sesiones.get(conversation_id)
+            if sesion is None:
+                sesion = _Sesion(self.mensajes_iniciales)
+                self._sesiones[conversation_id] = sesion
+                while len(self._sesiones) > self.max_sesiones:
+                    self._sesiones.popitem(last=False)
+                    self._expulsadas_lru += 1
+            else:
+                self._sesiones.move_to_end(conversation_id)
+            sesion.ultimo_acceso = time.monotonic()
+            return sesion
+
+    def inicializar(self, conversation_id):
+        """Crea la conversación si no existe"""
+        self._obtener_sesion(conversation_id)
+
+    @contextmanager
+    def bloqueo(self, conversation_id):
+        """Bloquea la sesión para que las peticiones concurrentes no intercalen mensajes"""
+        sesion = self._obtener_sesion(conversation_id)
+        with sesion.lock:
+            yield
+
+    def mensajes(self, conversation_id):
+        """Copia del historial de la conversación, listo para enviar al modelo"""
+        sesion = self._obtener_sesion(conversation_id)
+        with sesion.lock:
+            return list(sesion.mensajes)
+
+    def agregar(self, conversation_id, *mensajes):
+        """Añade mensajes al historial, recortando los más antiguos si supera max_mensajes"""
+        sesion = self._obtener_sesion(conversation_id)
+        with sesion.lock:
+            for mensaje in mensajes:
+                sesion.mensajes.append(mensaje)
+                sesion.bytes += tamano_mensaje(mensaje)
+
+            # Conservar siempre los mensajes iniciales al recortar
+            iniciales = len(self.mensajes_iniciales)
+            while len(sesion.mensajes) - iniciales > self.max_mensajes:
+                sesion.bytes -= tamano_mensaje(sesion.mensajes.pop(iniciales))
+
+    def eliminar(self, conversation_id):
+        """Descarta la conversación (por ejemplo al iniciar una nueva)"""
+        with self._lock:
+            self._sesiones.pop(conversation_id, None)
+
+    def estadisticas(self):
+        """Métricas de uso de memoria para monitoreo"""
+        with self._lock:
+            self._purgar_expiradas()
+            sesiones = list(self._sesiones.values())
+            return {
+                'sesiones': len(sesiones),
+                'max_sesiones': self.max_sesiones,
+                'mensajes': sum(len(s.mensajes) - len(self.mensajes_iniciales) for s in sesiones),
+                'bytes_historial': sum(s.bytes for s in sesiones),
+                'bytes_compartidos': sum(tamano_mensaje(m) for m in self.mensajes_iniciales),
+                'expulsadas_lru': self._expulsadas_lru,
+                'expiradas_ttl': self._expiradas_ttl,
+            }
+
+
+class _Candado:
+    """RLock con soporte de weakref (para no acumular un lock por sesión para siempre)"""
+
+    __slots__ = ('lock', '__weakref__')
+
+    def __init__(self):
+        self.lock = threading.RLock()
+
+
+def codificar_contenido(texto):
+    """Codificación compacta: zlib para textos largos, UTF-8 plano para cortos"""
+    datos = texto.encode('utf-8')
+    if len(datos) > 256:
+        return b'z' + zlib.compress(datos, 6)
+    return b'r' + datos
+
+
+def decodificar_contenido(blob):
+    blob = bytes(blob)
+    if blob[:1] == b'z':
+        return zlib.decompress(blob[1:]).decode('utf-8')
+    return blob[1:].decode('utf-8')
+
+
+class AlmacenConversacionesSQLite:
+    """Conversaciones en SQLite (modo WAL) compartidas entre workers
+
+    Los mensajes nuevos se encolan y un hilo de fondo los escribe en lotes
+    (write-behind) cada intervalo_escritura segundos. Al leer una conversación
+    se combinan las filas ya escritas con las operaciones pendientes de este
+    proceso, sin escribir nada en la petición. Otro worker solo ve el historial
+    hasta el último lote escrito, y bloqueo() solo serializa las peticiones de
+    un mismo proceso.
+    """
+
+    def __init__(self, ruta, mensajes_iniciales=(), max_sesiones=1000, ttl_segundos=3600,
+                 max_mensajes=40, intervalo_escritura=0.2):
+        self.ruta = ruta
+        self.mensajes_iniciales = list(mensajes_iniciales)
+        self.max_sesiones = max_sesiones
+        self.ttl_segundos = ttl_segundos
+        self.max_mensajes = max_mensajes
+        self.intervalo_escritura = intervalo_escritura
+
+        self._local = threading.local()
+        self._candados = weakref.WeakValueDictionary()
+        self._candados_lock = threading.Lock()
+        # Operaciones aún no escritas, en orden; se quitan de la lista al confirmar el lote
+        self._pendientes = []
+        self._pendientes_lock = threading.Lock()
+        self._escritura_lock = threading.Lock()
+        self._lotes_escritos = 0
+        self._ultima_limpieza = 0.0
+
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        self._conexion().executescript("""
+            CREATE TABLE IF NOT EXISTS sesiones (
+                conversation_id TEXT PRIMARY KEY,
+                ultimo_acceso REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_sesiones_acceso ON sesiones(ultimo_acceso);
+            CREATE TABLE IF NOT EXISTS mensajes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                conversation_id TEXT NOT NULL,
+                rol TEXT NOT NULL,
+                contenido BLOB NOT NULL,
+                bytes INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_mensajes_conversacion ON mensajes(conversation_id, id);
+        """)
+
+        threading.Thread(target=self._escribir_en_fondo, daemon=True, name="conversaciones-sqlite").start()
+        atexit.register(self.vaciar)
+
+    def _conexion(self):
+        """Conexión SQLite propia de cada hilo"""
+        conexion = getattr(self._local, 'conexion', None)
+        if conexion is None:
+            conexion = sqlite3.connect(self.ruta, timeout=10, isolation_level=None)
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute("PRAGMA synchronous=NORMAL")
+            self._local.conexion = conexion
+        return conexion
+
+    def _transaccion(self, operaciones=()):
+        """Transacción inmediata; al confirmarla, las operaciones escritas dejan de estar pendientes"""
+        def confirmar(conexion):
+            # COMMIT y quitar las operaciones a la vez: un lector ve cada mensaje en una sola fuente
+            with self._pendientes_lock:
+                conexion.execute("COMMIT")
+                del self._pendientes[:len(operaciones)]
+        return _Transaccion(self._conexion(), confirmar)
+
+    def __contains__(self, conversation_id):
+        with self._pendientes_lock:
+            pendientes = self._pendientes_de(conversation_id)
+            if pendientes:
+                return pendientes[-1][0] != 'eliminar'
+            fila = self._conexion().execute(
+                "SELECT 1 FROM sesiones WHERE conversation_id = ? AND ultimo_acceso >= ?",
+                (conversation_id, time.time() - self.ttl_segundos)
+            ).fetchone()
+        return fila is not None
+
+    def __len__(self):
+        self.vaciar()
+        return self._conexion().execute("SELECT COUNT(*) FROM sesiones").fetchone()[0]
+
+    # --- Escritura diferida ---
+
+    def _encolar(self, operacion):
+        with self._pendientes_lock:
+            self._pendientes.append(operacion)
+
+    def _pendientes_de(self, conversation_id):
+        """Operaciones pendientes de la conversación, en orden (requiere self._pendientes_lock)"""
+        return [operacion for operacion in self._pendientes if operacion[1] == conversation_id]
+
+    def _escribir_en_fondo(self):
+        while True:
+            time.sleep(self.intervalo_escritura)
+            try:
+                self.vaciar()
+            except Exception as e:
+                print(f"❌ Error escribiendo conversaciones en SQLite: {e}")
+
+    def vaciar(self):
+        """Escribe en un solo lote todas las operaciones pendientes de este proceso"""
+        with self._escritura_lock:
+            with self._pendientes_lock:
+                operaciones = list(self._pendientes)
+
+            ahora = time.time()
+            limpiar = ahora - self._ultima_limpieza >= 60
+            if not operaciones and not limpiar:
+                return
+
+            with self._transaccion(operaciones) as conexion:
+                conversaciones_recortar = set()
+                for operacion in operaciones:
+                    tipo, conversation_id = operacion[0], operacion[1]
+                    if tipo == 'eliminar':
+                        conexion.execute("DELETE FROM mensajes WHERE conversation_id = ?", (conversation_id,))
+                        conexion.execute("DELETE FROM sesiones WHERE conversation_id = ?", (conversation_id,))
+                        continue
+                    conexion.execute(
+                        "INSERT INTO sesiones (conversation_id, ultimo_acceso) VALUES (?, ?) "
+                        "ON CONFLICT(conversation_id) DO UPDATE SET ultimo_acceso = MAX(ultimo_acceso, excluded.ultimo_acceso)",
+                        (conversation_id, operacion[2])
+                    )
+                    if tipo == 'agregar':
+                        mensaje = operacion[3]
+                        conexion.execute(
+                            "INSERT INTO mensajes (conversation_id, rol, contenido, bytes) VALUES (?, ?, ?, ?)",
+                            (conversation_id, mensaje['role'], codificar_contenido(mensaje.get('content', '')),
+                             tamano_mensaje(mensaje))
+                        )
+                        conversaciones_recortar.add(conversation_id)
+
+                # Conservar solo los últimos max_mensajes de cada conversación modificada
+                for conversation_id in conversaciones_recortar:
+                    conexion.execute(
+                        "DELETE FROM mensajes WHERE conversation_id = ? AND id NOT IN "
+                        "(SELECT id FROM mensajes WHERE conversation_id = ? ORDER BY id DESC LIMIT ?)",
+                        (conversation_id, conversation_id, self.max_mensajes)
+                    )
+
+                if limpiar:
+                    self._limpiar(conexion, ahora)
+            if operaciones:
+                self._lotes_escritos += 1
+
+    def _limpiar(self, conexion, ahora):
+        """Expira sesiones inactivas (TTL) y expulsa las menos recientes por encima del límite (LRU)"""
+        self._ultima_limpieza = ahora
+        conexion.execute(
+            "DELETE FROM sesiones WHERE ultimo_acceso < ? OR conversation_id IN "
+            "(SELECT conversation_id FROM sesiones ORDER BY ultimo_acceso DESC LIMIT -1 OFFSET ?)",
+            (ahora - self.ttl_segundos, self.max_sesiones)
+        )
+        conexion.execute(
+            "DELETE FROM mensajes WHERE conversation_id NOT IN (SELECT conversation_id FROM sesiones)"
+        )
+
+    # --- Interfaz común con AlmacenConversaciones ---
+
+    def inicializar(self, conversation_id):
+        """Registra (o refresca) la conversación"""
+        self._encolar(('tocar', conversation_id, time.time()))
+
+    @contextmanager
+    def bloqueo(self, conversation_id):
+        """Bloquea la sesión dentro de este proceso mientras se genera la respuesta"""
+        with self._candados_lock:
+            candado = self._candados.get(conversation_id)
+            if candado is None:
+                candado = _Candado()
+                self._candados[conversation_id] = candado
+        with candado.lock:
+            yield
+
+    def mensajes(self, conversation_id):
+        """Historial de la conversación, con los mensajes iniciales compartidos al principio
+
+        Incluye los mensajes de este proceso que aún no se escribieron.
+        """
+        with self._pendientes_lock:
+            filas = self._conexion().execute(
+                "SELECT rol, contenido FROM mensajes WHERE conversation_id = ? ORDER BY id",
+                (conversation_id,)
+            ).fetchall()
+            pendientes = self._pendientes_de(conversation_id)
+            self._pendientes.append(('tocar', conversation_id, time.time()))
+
+        historial = [{'role': rol, 'content': decodificar_contenido(contenido)} for rol, contenido in filas]
+        for operacion in pendientes:
+            if operacion[0] == 'eliminar':
+                historial = []
+            elif operacion[0] == 'agregar':
+                historial.append(operacion[3])
+        return self.mensajes_iniciales + historial[-self.max_mensajes:]
+
+    def agregar(self, conversation_id, *mensajes):
+        """Encola los mensajes; el hilo de fondo los escribe en el próximo lote"""
+        ahora = time.time()
+        with self._pendientes_lock:
+            self._pendientes.extend(('agregar', conversation_id, ahora, mensaje) for mensaje in mensajes)
+
+    def eliminar(self, conversation_id):
+        self._encolar(('eliminar', conversation_id))
+
+    def estadisticas(self):
+        """Métricas de uso para monitoreo (la memoria del worker no crece con las sesiones)"""
+        self.vaciar()
+        conexion = self._conexion()
+        sesiones = conexion.execute("SELECT COUNT(*) FROM sesiones").fetchone()[0]
+        mensajes, bytes_historial = conexion.execute(
+            "SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM mensajes"
+        ).fetchone()
+        return {
+            'backend': 'sqlite',
+            'sesiones': sesiones,
+            'max_sesiones': self.max_sesiones,
+            'mensajes': mensajes,
+            'bytes_historial': bytes_historial,
+            'bytes_compartidos': sum(tamano_mensaje(m) for m in self.mensajes_iniciales),
+            'bytes_archivo': os.path.getsize(self.ruta) if os.path.exists(self.ruta) else 0,
+            'escrituras_pendientes': len(self._pendientes),
+            'lotes_escritos': self._lotes_escritos,
+        }
+
+
+class _Transaccion:
+    """Context manager que agrupa las sentencias en una transacción inmediata"""
+
+    def __init__(self, conexion, confirmar=None):
+        self.conexion = conexion
+        self.confirmar = confirmar
+
+    def __enter__(self):
+        self.conexion.execute("BEGIN IMMEDIATE")
+        return self.conexion
+
+    def __exit__(self, tipo, valor, traza):
+        if tipo:
+            self.conexion.execute("ROLLBACK")
+        elif self.confirmar is not None:
+            self.confirmar(self.conexion)
+        else:
+            self.conexion.execute("COMMIT")
+        return False
+
+
+def obtener_clave_secreta(ruta):
+    """Clave estable para firmar la cookie de sesión, igual en todos los workers
+
+    Se genera una sola vez y se guarda en `ruta`; el primer worker que la crea
+    gana y los demás leen la misma."""
+    if os.path.exists(ruta):
+        with open(ruta, 'rb') as f:
+            return f.read()
+
+    directorio = os.path.dirname(ruta)
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+    try:
+        descriptor = os.open(ruta, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # Otro worker la creó al mismo tiempo; esperar a que termine de escribirla
+        for _ in range(50):
+            with open(ruta, 'rb') as f:
+                clave = f.read()
+            if clave:
+                return clave
+            time.sleep(0.05)
+        raise
+    clave = secrets.token_bytes(32)
+    with os.fdopen(descriptor, 'wb') as f:
+        f.write(clave)
+    return clave
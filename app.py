@@ -13,24 +13,50 @@ Características principales:
 - Búsqueda en glosario de términos
 """
 
-from flask import Flask, render_template, request, jsonify, session, send_from_directory
+from flask import (Flask, render_template, request, jsonify, session, send_file, send_from_directory, url_for, Response,
+                   stream_with_context)
 from flask_cors import CORS
 import os
 import re
 import sys
 import uuid
 import json
+import contextvars
+import hashlib
 import mimetypes
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
-from openai import OpenAI
 
 # 🆕 IMPORTAR MINI-ESPECIALISTAS
-from mini_especialistas import procesar_con_mini_especialistas
+from mini_especialistas import procesar_con_mini_especialistas, precalentar_tablas_especialista, SECCIONES_CONSERVACION
+from indices_busqueda import (IndiceGlosario, IndiceVectorial, PALABRAS_ELIMINAR_TERMINO, obtener_indice_pasajes,
+                              registrar_indice_pasajes)
+from paquete_corpus import corpus, construir_paquete
+from almacen_conversaciones import AlmacenConversaciones, AlmacenConversacionesSQLite, obtener_clave_secreta
+from cache_respuestas import CacheRespuestas, normalizar_pregunta, version_corpus
+from compresion_http import comprimir, elegir_codificacion
+from registro_recursos import RegistroRecursos
+from indice_texto_extraido import IndiceTextoExtraido, construir_indice_texto_extraido
+from recursos_estaticos import ManifiestoEstaticos, construir_recursos_estaticos
+from vuelo_unico import ResultadoDegradado, VueloUnico
+from respuestas_preparadas import IndiceRespuestas, extraer_respuestas_almacenamiento, extraer_respuestas_tomo
+from tablas_html import motor_tablas
+from bitacora import Bitacora
+from metricas import metricas
+from cliente_llm import LLMSaturado, llm
+from enrutador import analizar_consulta
 
 # CONFIGURACIÓN BETA - FECHA DE EXPIRACIÓN
 # Beta profesional por días para demostración oficial
 FECHA_EXPIRACION_BETA = datetime(2025, 8, 9,)  # 9 de agosto 2025 - 5 días para demostración completa
+if os.getenv("FECHA_EXPIRACION_BETA"):
+    # Permite extender la beta (o fijarla en benchmarks) sin tocar el código: AAAA-MM-DD
+    FECHA_EXPIRACION_BETA = datetime.fromisoformat(os.getenv("FECHA_EXPIRACION_BETA"))
 def formatear_fecha_espanol(fecha):
     """Convierte una fecha al formato español"""
     meses_espanol = {
@@ -70,7 +96,6 @@ def verificar_beta_activa():
     
 # Configuración de la aplicación Flask
 app = Flask(__name__)
-app.secret_key = os.urandom(24)  # Para sesiones seguras
 CORS(app)
 
 # Configurar MIME types para archivos estáticos
@@ -82,35 +107,161 @@ mimetypes.add_type('application/javascript', '.js')
 script_dir = os.path.dirname(os.path.abspath(__file__))
 os.chdir(script_dir)
 
+# Recursos estáticos con huella en el nombre ('flask build-static'): las plantillas usan
+# recurso('css/simple.css') y /assets/ los sirve con caché de un año. Sin compilar, o si un
+# archivo cambió desde la compilación, recurso() devuelve la URL de /static/
+CACHE_RECURSOS_VERSIONADOS = 'public, max-age=31536000, immutable'
+recursos_estaticos = ManifiestoEstaticos(app.static_folder)
+
+@app.cli.command("build-static")
+def build_static():
+    """Copia static/ con huellas de contenido y variantes .gz/.br en static/dist"""
+    resumen = construir_recursos_estaticos(app.static_folder)
+    recursos_estaticos.cargar()
+    print(f"✅ Recursos estáticos versionados: {resumen['recursos']} archivos, {resumen['comprimidos']} "
+          f"precomprimidos ({', '.join(resumen['codificaciones'])}) en {resumen['segundos']}s")
+
+@app.template_global()
+def recurso(nombre):
+    """URL con huella del recurso estático, o la de /static/ si no está compilado"""
+    ruta = recursos_estaticos.ruta(nombre)
+    if ruta is None:
+        return url_for('static', filename=nombre)
+    return url_for('recurso_versionado', ruta=ruta)
+
+print(f"✅ Recursos estáticos versionados: {len(recursos_estaticos)} con huella"
+      if len(recursos_estaticos) else "⚠️ Recursos estáticos sin compilar (flask build-static): se sirven desde /static/")
+
 # Cargar variables de entorno y cliente
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
-# Lista de palabras clave legales para detección
-palabras_legales = [
-    'permiso', 'planificación', 'construcción', 'zonificación', 'desarrollo',
-    'urbanización', 'reglamento', 'licencia', 'certificación', 'calificación',
-    'tomo', 'junta', 'planificación', 'ambiental', 'infraestructura',
-    'conservación', 'histórico', 'querella', 'edificabilidad', 'lotificación'
-]
+# Plazo total (segundos) de cada sitio de llamada al modelo, reintentos incluidos.
+# Todos quedan por debajo del timeout de 120 s de gunicorn
+PLAZOS_LLM = {
+    "buscar_informacion_relevante": float(os.getenv("PLAZO_LLM_EXTRACCION", "20")),
+    "generar_respuesta_hibrida_inteligente": float(os.getenv("PLAZO_LLM_SINTESIS", "45")),
+    "generar_respuesta_legal_directa": float(os.getenv("PLAZO_LLM_SINTESIS", "45")),
+    "generar_respuesta_inteligente": float(os.getenv("PLAZO_LLM_GLOSARIO", "30")),
+    "generar_respuesta_generica_inteligente": float(os.getenv("PLAZO_LLM_GENERAL", "25")),
+    "buscar_en_tomo_10_sitios_historicos": float(os.getenv("PLAZO_LLM_SITIOS_HISTORICOS", "30")),
+    "procesar_recurso_especializado": float(os.getenv("PLAZO_LLM_RECURSOS", "25")),
+    "responder_mensaje": float(os.getenv("PLAZO_LLM_CONVERSACION", "30")),
+    "procesar": float(os.getenv("PLAZO_LLM_ESPECIALISTAS", "30")),
+}
+
+# Un solo cliente de OpenAI por worker (compartido con los mini-especialistas).
+# OPENAI_BASE_URL permite apuntar a un servidor compatible (p. ej. el de benchmarks/)
+llm.configurar(
+    api_key=os.getenv("OPENAI_API_KEY"),
+    base_url=os.getenv("OPENAI_BASE_URL") or None,
+    plazos=PLAZOS_LLM,
+    plazo_predeterminado=float(os.getenv("PLAZO_LLM_SEGUNDOS", "30")),
+    reintentos=int(os.getenv("REINTENTOS_LLM", "2")),
+    max_concurrencia=int(os.getenv("MAX_LLM_CONCURRENTES", "16")),
+    max_conexiones=int(os.getenv("MAX_CONEXIONES_LLM", "20")),
+    # Cola de llamadas que esperan cupo; una pregunta nueva que no cabe, o que no obtiene
+    # cupo en ESPERA_ADMISION_LLM segundos, recibe 429 en lugar de esperar al timeout
+    max_en_espera=int(os.getenv("MAX_LLM_EN_ESPERA", "32")),
+    espera_admision=float(os.getenv("ESPERA_ADMISION_LLM", "10")),
+)
+# Segundos que se sugieren al cliente (Retry-After) cuando el modelo está saturado
+REINTENTAR_SATURADO_SEGUNDOS = int(os.getenv("REINTENTAR_SATURADO_SEGUNDOS", "5"))
+client = llm
+
+# Datos de ejecución compartidos por todos los workers del nodo (sesiones, clave)
+DIRECTORIO_INSTANCIA = os.getenv("DIRECTORIO_INSTANCIA", os.path.join(script_dir, "instance"))
+
+# Cada worker publica sus métricas aquí; /metrics las suma
+metricas.iniciar_publicacion(os.path.join(DIRECTORIO_INSTANCIA, "metricas"))
+
+# Clave estable para sesiones seguras: la misma en todos los workers y tras reinicios
+app.secret_key = os.getenv("SECRET_KEY") or obtener_clave_secreta(os.path.join(DIRECTORIO_INSTANCIA, "secret_key"))
+
+# Bitácora JSON por líneas: las peticiones encolan y un hilo escribe por lotes con rotación
+bitacora = Bitacora(
+    os.getenv("BITACORA_RUTA", os.path.join(DIRECTORIO_INSTANCIA, "bitacora.jsonl")),
+    max_bytes=int(float(os.getenv("BITACORA_MAX_MB", "10")) * 1024 * 1024),
+    copias=int(os.getenv("BITACORA_COPIAS", "5")),
+    tasa_muestreo_respuestas=float(os.getenv("BITACORA_MUESTREO_RESPUESTAS", "1.0"))
+)
+
+# Corpus preprocesado por 'flask build-corpus': los workers comparten por mmap los pasajes y
+# postings; cada worker decodifica su propia copia de cada texto.
+# Sin paquete (o con fuentes modificadas desde que se construyó) se leen los archivos de data/
+RUTA_PAQUETE_CORPUS = os.getenv("PAQUETE_CORPUS", os.path.join("data", "corpus.pack"))
+RUTA_INDICE_TEXTO_EXTRAIDO = os.getenv("INDICE_TEXTO_EXTRAIDO", os.path.join("data", "texto_extraido.idx"))
+corpus.abrir(RUTA_PAQUETE_CORPUS, "data")
+
+@app.cli.command("build-corpus")
+def build_corpus():
+    """Preprocesa las fuentes de data/ en el paquete de corpus proyectable"""
+    resumen = construir_paquete("data", RUTA_PAQUETE_CORPUS)
+    print(f"✅ Paquete de corpus escrito en {RUTA_PAQUETE_CORPUS}: {resumen['fuentes']} fuentes, "
+          f"{resumen['pasajes']} pasajes, {resumen['bytes'] // 1024} KB en {resumen['segundos']}s")
+    resumen = construir_indice_texto_extraido(os.path.join("data", "RespuestasParaChatBot"), RUTA_INDICE_TEXTO_EXTRAIDO)
+    print(f"✅ Índice del texto extraído escrito en {RUTA_INDICE_TEXTO_EXTRAIDO}: {resumen['tomos']} tomos, "
+          f"{resumen['fragmentos']} fragmentos, {resumen['bytes'] // 1024} KB en {resumen['segundos']}s")
 
 # Función para cargar glosario (si existe)
 def cargar_glosario():
-    ruta_glosario = os.path.join("data", "glosario.txt")
-    if os.path.exists(ruta_glosario):
-        try:
-            with open(ruta_glosario, "r", encoding="utf-8") as f:
-                contenido = f.read()
-            print(f"✅ Glosario cargado: {len(contenido)} caracteres, {len(contenido.split('**'))} términos aprox.")
-            return contenido
-        except Exception as e:
-            print(f"❌ Error cargando glosario: {e}")
-            return ""
+    contenido = corpus.texto("glosario")
+    if contenido:
+        print(f"✅ Glosario cargado: {len(contenido)} caracteres, {len(contenido.split('**'))} términos aprox.")
     else:
-        print(f"⚠️ Glosario no encontrado en: {ruta_glosario}")
-        return ""
+        print(f"⚠️ Glosario no encontrado en: {corpus.ruta_origen('glosario')}")
+    return contenido
 
 glosario = cargar_glosario()
+indice_glosario = IndiceGlosario(glosario)
+print(f"✅ Índice del glosario: {len(indice_glosario)} términos indexados")
+
+# Flujogramas, tablas de cabida, resoluciones y respuestas por (tipo, tomo), leídos una sola vez
+INTERVALO_REVALIDACION_RECURSOS = float(os.getenv("INTERVALO_REVALIDACION_RECURSOS", "30"))
+registro_recursos = RegistroRecursos(
+    os.path.join("data", "RespuestasParaChatBot"),
+    intervalo_revalidacion=INTERVALO_REVALIDACION_RECURSOS
+)
+print(f"✅ Registro de recursos: {registro_recursos.estadisticas()['recursos']} recursos en memoria")
+
+# Respuestas preparadas (Respuestas_Tomo_N.txt y almacenamiento.txt): se sirven sin llamar al modelo
+# si la pregunta se parece lo suficiente; UMBRAL_RESPUESTA_PREPARADA=0 las desactiva
+UMBRAL_RESPUESTA_PREPARADA = float(os.getenv("UMBRAL_RESPUESTA_PREPARADA", "0.75"))
+
+def cargar_respuestas_preparadas():
+    """Índice de preguntas y respuestas curadas de RespuestasParaChatBot y almacenamiento.txt"""
+    entradas = []
+    for tomo in registro_recursos.tomos_con('Respuestas'):
+        entradas.extend(extraer_respuestas_tomo(registro_recursos.contenido('Respuestas', tomo), tomo))
+    ruta_almacenamiento = os.path.join("data", "almacenamiento.txt")
+    try:
+        with open(ruta_almacenamiento, 'r', encoding='utf-8') as archivo:
+            entradas.extend(extraer_respuestas_almacenamiento(archivo.read()))
+    except OSError as e:
+        print(f"⚠️ No se pudo leer {ruta_almacenamiento}: {e}")
+    return IndiceRespuestas(entradas, umbral=UMBRAL_RESPUESTA_PREPARADA)
+
+indice_respuestas = cargar_respuestas_preparadas()
+print(f"✅ Respuestas preparadas: {len(indice_respuestas)} preguntas indexadas")
+
+def buscar_respuesta_preparada(consulta):
+    """(respuesta, tipo) de la respuesta preparada más parecida a la consulta, o None"""
+    if not UMBRAL_RESPUESTA_PREPARADA:
+        return None
+    with metricas.medir('respuesta_preparada'):
+        acierto = indice_respuestas.buscar(consulta, consulta.tomo)
+    if acierto is None:
+        return None
+    entrada = acierto.entrada
+    if entrada.fuente == 'general':
+        origen = "Preguntas generales del Reglamento Conjunto"
+    elif entrada.fuente.startswith('resumen-'):
+        origen = f"Resumen del Tomo {entrada.tomo}"
+    else:
+        origen = f"Respuestas preparadas del Tomo {entrada.tomo}"
+    print(f"📌 Respuesta preparada ({entrada.fuente}, confianza {acierto.confianza:.2f}): {entrada.pregunta}")
+    metricas.incrementar('betaia_respuestas_preparadas_total', fuente=entrada.fuente.split('-')[0])
+    respuesta = f"📌 **{entrada.pregunta}**\n\n{entrada.respuesta}\n\n---\n💡 *{origen}*"
+    return respuesta, f"preparada-{entrada.fuente}"
 
 # Función para obtener información completa de todos los tomos
 def obtener_titulos_tomos():
@@ -171,20 +322,40 @@ def obtener_titulos_tomos():
 ⚠️ **NOTA IMPORTANTE:** Los tomos 1-11 son únicamente para referencia histórica. La normativa vigente y actualizada se encuentra EXCLUSIVAMENTE en el **Reglamento de Emergencia JP-RP-41 (2025)**.
 """
 
-# Diccionario para mantener conversaciones por sesión
-conversaciones = {}
+# Canal de eventos del hilo que atiende /chat/stream (None en /chat normal)
+canal_eventos = threading.local()
 
-def get_conversation_id():
-    """Obtiene o crea un ID de conversación para la sesión actual"""
-    if 'conversation_id' not in session:
-        session['conversation_id'] = str(uuid.uuid4())
-    return session['conversation_id']
+def emitir_evento(tipo, datos):
+    """Envía un evento al cliente en streaming, si lo hay"""
+    cola = getattr(canal_eventos, 'cola', None)
+    if cola is not None:
+        cola.put((tipo, datos))
 
-def inicializar_conversacion(conversation_id):
-    """Inicializa una nueva conversación"""
-    if conversation_id not in conversaciones:
-        conversaciones[conversation_id] = [
-            {"role": "system", "content": """Eres Agente de Planificación, un asistente especializado altamente inteligente en leyes de planificación de Puerto Rico. 
+def emitir_etapa(mensaje):
+    """Notifica la etapa actual del pipeline ('Sintetizando respuesta…')"""
+    emitir_evento('etapa', {'mensaje': mensaje})
+
+def completar_chat_en_streaming(**parametros):
+    """Llama a chat.completions y devuelve el texto completo
+    
+    Si hay un cliente en streaming, los tokens se reenvían como eventos
+    'token' a medida que llegan."""
+    if getattr(canal_eventos, 'cola', None) is None:
+        response = client.chat.completions.create(**parametros)
+        return response.choices[0].message.content.strip()
+    
+    partes = []
+    for fragmento in client.chat.completions.create(stream=True, **parametros):
+        if not fragmento.choices:
+            continue
+        delta = fragmento.choices[0].delta.content
+        if delta:
+            partes.append(delta)
+            emitir_evento('token', {'texto': delta})
+    return ''.join(partes).strip()
+
+# Prompt de sistema compartido por todas las conversaciones
+MENSAJE_SISTEMA = {"role": "system", "content": """Eres Agente de Planificación, un asistente especializado altamente inteligente en leyes de planificación de Puerto Rico. 
 
 CARACTERÍSTICAS:
 - Analiza profundamente las preguntas del usuario
@@ -233,160 +404,104 @@ GLOSARIO DISPONIBLE:
 - El glosario incluye categorías como: términos de planificación, términos especializados, etc.
 
 **🚨 MENSAJE DE BIENVENIDA:** Siempre menciona que trabajas con el Reglamento de Emergencia JP-RP-41 como fuente principal y vigente."""}
-        ]
+
+# Conversaciones por sesión: acotadas por número de sesiones (LRU) y por inactividad (TTL)
+# ALMACEN_CONVERSACIONES=sqlite (por defecto) las comparte entre workers; =memoria las deja en el proceso.
+# Con SQLite cada worker escribe sus mensajes en lotes: otro worker ve el historial hasta el último lote
+limites_conversaciones = dict(
+    max_sesiones=int(os.getenv("MAX_CONVERSACIONES", "1000")),
+    ttl_segundos=int(os.getenv("TTL_CONVERSACION_MINUTOS", "60")) * 60,
+    max_mensajes=int(os.getenv("MAX_MENSAJES_CONVERSACION", "40"))
+)
+if os.getenv("ALMACEN_CONVERSACIONES", "sqlite") == "memoria":
+    conversaciones = AlmacenConversaciones([MENSAJE_SISTEMA], **limites_conversaciones)
+else:
+    conversaciones = AlmacenConversacionesSQLite(
+        os.path.join(DIRECTORIO_INSTANCIA, "conversaciones.db"), [MENSAJE_SISTEMA], **limites_conversaciones
+    )
+print(f"✅ Almacén de conversaciones: {type(conversaciones).__name__}")
+
+# Respuestas finales de mini-especialistas y preguntas legales (no dependen del historial),
+# compartidas entre workers; la versión del corpus (recalculada con el mismo intervalo que el
+# registro de recursos) las invalida cuando cambia algún archivo de data/
+USAR_CACHE_RESPUESTAS = os.getenv("CACHE_RESPUESTAS", "1") != "0"
+cache_respuestas = CacheRespuestas(
+    os.path.join(DIRECTORIO_INSTANCIA, "respuestas.db"),
+    lambda: version_corpus("data"),
+    intervalo_revalidacion=INTERVALO_REVALIDACION_RECURSOS,
+    ttl_segundos=int(os.getenv("TTL_CACHE_RESPUESTAS_HORAS", "168")) * 3600,
+    max_entradas=int(os.getenv("MAX_RESPUESTAS_CACHE", "5000")),
+    max_bytes=int(os.getenv("MAX_MB_CACHE_RESPUESTAS", "64")) * 1024 * 1024,
+    # Preguntas casi iguales (MinHash/LSH): similitud mínima para reutilizar una respuesta; 0 lo desactiva
+    umbral_similitud=float(os.getenv("UMBRAL_SIMILITUD_CACHE", "0.7")) or None,
+)
+# Vuelo único: peticiones simultáneas con la misma pregunta normalizada comparten la respuesta
+# legal y las extracciones por fuente en lugar de repetir las llamadas al modelo. El resultado
+# se reutiliza VENTANA_VUELO_UNICO segundos después de terminar (0: solo mientras está en curso)
+vuelos_llm = VueloUnico(
+    ventana=float(os.getenv("VENTANA_VUELO_UNICO", "5")),
+    espera_maxima=float(os.getenv("ESPERA_VUELO_UNICO", "90")),
+)
+metricas.registrar_cache('respuestas', lambda: (cache_respuestas.aciertos + cache_respuestas.aciertos_similares,
+                                                cache_respuestas.fallos))
+metricas.registrar_cache('respuestas_similares', lambda: (cache_respuestas.aciertos_similares, cache_respuestas.fallos))
+print(f"✅ Caché de respuestas: {'activa' if USAR_CACHE_RESPUESTAS else 'desactivada'} "
+      f"(corpus {cache_respuestas.version}, similitud {cache_respuestas.umbral_similitud})")
+
+def respuesta_en_cache(espacio, consulta):
+    """Respuesta final guardada para la misma pregunta o una casi igual, o None"""
+    if not USAR_CACHE_RESPUESTAS:
+        return None
+    inicio = time.perf_counter()
+    try:
+        with metricas.medir('cache_respuestas'):
+            acierto = cache_respuestas.obtener(espacio, consulta)
+    except Exception as e:
+        print(f"⚠️ No se pudo leer la caché de respuestas: {e}")
+        return None
+    if acierto is None:
+        return None
+    metricas.incrementar('betaia_cache_segundos_ahorrados_total',
+                         max(acierto.segundos - (time.perf_counter() - inicio), 0), cache='respuestas')
+    return acierto.valor
+
+def guardar_en_cache(espacio, consulta, respuesta, fallos_llm_antes, inicio):
+    """Guarda la respuesta si ninguna llamada al modelo falló mientras se generaba"""
+    if USAR_CACHE_RESPUESTAS and respuesta and llm.fallos_actuales() == fallos_llm_antes:
+        try:
+            cache_respuestas.guardar(espacio, consulta, respuesta, time.perf_counter() - inicio)
+        except Exception as e:
+            print(f"⚠️ No se pudo guardar la respuesta en caché: {e}")
+
+def responder_pregunta_legal(consulta):
+    """Pipeline legal completo para una pregunta que no estaba en caché; guarda la respuesta
+
+    Si falló alguna llamada al modelo, la respuesta (de respaldo) no se comparte con
+    las peticiones que esperan la misma pregunta en el vuelo único.
+    """
+    fallos_llm, inicio = llm.fallos_actuales(), time.perf_counter()
+    with metricas.medir('pregunta_legal'):
+        respuesta = procesar_pregunta_legal(consulta)
+    guardar_en_cache(f'legal_{MODO_PIPELINE_LEGAL}', consulta, respuesta, fallos_llm, inicio)
+    if llm.fallos_actuales() != fallos_llm:
+        return ResultadoDegradado(respuesta)
+    return respuesta
+
+def get_conversation_id():
+    """Obtiene o crea un ID de conversación para la sesión actual"""
+    if 'conversation_id' not in session:
+        session['conversation_id'] = str(uuid.uuid4())
+    return session['conversation_id']
+
+def inicializar_conversacion(conversation_id):
+    """Inicializa una nueva conversación"""
+    conversaciones.inicializar(conversation_id)
 
 def buscar_en_glosario(termino):
-    """Busca definiciones específicas en el glosario con múltiples estrategias mejoradas"""
+    """Busca definiciones específicas en el glosario usando el índice precompilado"""
     if not glosario:
         return None
-    
-    termino_lower = termino.lower().strip()
-    lineas = glosario.split('\n')
-    definiciones_encontradas = []
-    
-    # Lista para almacenar coincidencias con su nivel de confianza
-    coincidencias_candidatas = []
-    
-    i = 0
-    while i < len(lineas):
-        linea = lineas[i].strip()
-        
-        # Buscar líneas que contengan términos (formatos: **Término**: o **TÉRMINO**: )
-        if linea.startswith('**') and ('**:' in linea):
-            # Extraer el término según el formato
-            termino_glosario = ""
-            if linea.startswith('**TÉRMINO**:'):
-                # Formato **TÉRMINO**: Zona Costanera
-                termino_glosario = linea.replace('**TÉRMINO**:', '').strip().lower()
-            elif '**:' in linea and not linea.startswith('**DEFINICIÓN**:') and not linea.startswith('**CATEGORÍA**:'):
-                # Formato **Término**: - pero evitar **DEFINICIÓN**: y **CATEGORÍA**:
-                inicio = linea.find('**') + 2
-                fin = linea.find('**:', inicio)
-                if fin > inicio:
-                    termino_glosario = linea[inicio:fin].strip().lower()
-            
-            # Solo procesar si se extrajo un término válido
-            if termino_glosario:
-                confianza = 0
-                
-                # 1. COINCIDENCIA EXACTA (máxima prioridad)
-                if termino_lower == termino_glosario:
-                    confianza = 100
-                
-                # 2. COINCIDENCIA DE TÉRMINOS COMPUESTOS - PRIORIDAD ALTA
-                elif ' ' in termino_lower and ' ' in termino_glosario:
-                    palabras_busqueda = termino_lower.split()
-                    palabras_glosario = termino_glosario.split()
-                    
-                    # Verificar coincidencia exacta de palabras en orden
-                    coincidencia_exacta = True
-                    if len(palabras_busqueda) <= len(palabras_glosario):
-                        for i, palabra_busq in enumerate(palabras_busqueda):
-                            if i >= len(palabras_glosario) or palabra_busq != palabras_glosario[i]:
-                                coincidencia_exacta = False
-                                break
-                        
-                        if coincidencia_exacta:
-                            confianza = 95  # Alta confianza para coincidencia exacta de palabras en orden
-                        else:
-                            # Verificar si todas las palabras de búsqueda están en el glosario
-                            palabras_coinciden = 0
-                            for palabra_busq in palabras_busqueda:
-                                if len(palabra_busq) > 2:  # Solo palabras significativas
-                                    for palabra_glos in palabras_glosario:
-                                        if palabra_busq == palabra_glos:
-                                            palabras_coinciden += 1
-                                            break
-                            
-                            # Si todas las palabras coinciden, alta confianza
-                            if palabras_coinciden == len(palabras_busqueda) and len(palabras_busqueda) >= 2:
-                                confianza = 90
-                            # Si coinciden la mayoría de palabras importantes
-                            elif palabras_coinciden >= max(1, len(palabras_busqueda) * 0.7):
-                                confianza = 70
-                
-                # 3. CONTENCIÓN SIGNIFICATIVA (para términos simples)
-                elif len(termino_lower) >= 5:
-                    if termino_lower in termino_glosario:
-                        # Calcular qué tan significativa es la contención
-                        ratio = len(termino_lower) / len(termino_glosario)
-                        if ratio >= 0.6:  # El término buscado es al menos 60% del término del glosario
-                            confianza = 60
-                        elif ratio >= 0.4:
-                            confianza = 40
-                    elif termino_glosario in termino_lower:
-                        # El término del glosario está contenido en la búsqueda
-                        ratio = len(termino_glosario) / len(termino_lower)
-                        if ratio >= 0.6:
-                            confianza = 50
-                
-                # Si hay coincidencia, guardar con su confianza
-                if confianza > 0:
-                    # Construir la definición completa
-                    definicion_completa = linea + '\n'  # Título
-                    
-                    # Buscar las líneas de definición
-                    j = i + 1
-                    contenido_definicion = []
-                    
-                    while j < len(lineas) and j < i + 15:  # Aumentado a 15 líneas para definiciones más largas
-                        linea_sig = lineas[j].strip()
-                        
-                        # Si encontramos otra definición de término, parar
-                        if linea_sig.startswith('**TÉRMINO**:'):
-                            break
-                        # Si encontramos líneas que no son de definición/categoría, parar
-                        elif (linea_sig.startswith('**') and '**:' in linea_sig and 
-                              not linea_sig.startswith('**DEFINICIÓN') and 
-                              not linea_sig.startswith('**CATEGORÍA')):
-                            break
-                        # Si encontramos una línea vacía seguida de otra definición, parar
-                        elif not linea_sig and j + 1 < len(lineas) and lineas[j + 1].strip().startswith('**TÉRMINO**:'):
-                            break
-                        # Incluir definiciones y categorías
-                        elif (linea_sig.startswith('**DEFINICIÓN') or 
-                              linea_sig.startswith('**CATEGORÍA') or
-                              (linea_sig and len(linea_sig) > 3 and not linea_sig.startswith('**'))):
-                            contenido_definicion.append(linea_sig)
-                        
-                        j += 1
-                    
-                    # Solo agregar si encontramos una definición válida
-                    if contenido_definicion:
-                        definicion_texto = '\n'.join(contenido_definicion)
-                        definicion_completa += definicion_texto
-                        
-                        if len(definicion_completa.strip()) > 10:
-                            coincidencias_candidatas.append((confianza, definicion_completa.strip(), termino_glosario))
-        
-        i += 1
-    
-    # Ordenar por confianza (mayor a menor) y devolver las mejores
-    if coincidencias_candidatas:
-        coincidencias_candidatas.sort(key=lambda x: x[0], reverse=True)
-        
-        # PRIORIDAD ESPECIAL: Si hay términos compuestos con confianza >=95, devolver solo esos
-        if coincidencias_candidatas[0][0] >= 95:
-            return [coincidencias_candidatas[0][1]]
-        
-        # Si la mejor coincidencia tiene alta confianza (>=90), devolver solo esa
-        elif coincidencias_candidatas[0][0] >= 90:
-            # Verificar si hay términos compuestos entre las mejores opciones
-            mejores_compuestos = [c for c in coincidencias_candidatas if c[0] >= 90 and ' ' in c[2]]
-            if mejores_compuestos:
-                return [mejores_compuestos[0][1]]  # Priorizar términos compuestos
-            else:
-                return [coincidencias_candidatas[0][1]]
-        
-        # Si no, devolver las mejores coincidencias (máximo 3)
-        mejores_coincidencias = []
-        for confianza, definicion, termino_orig in coincidencias_candidatas[:3]:
-            if confianza >= 40:  # Solo coincidencias con confianza razonable
-                mejores_coincidencias.append(definicion)
-        
-        return mejores_coincidencias if mejores_coincidencias else None
-    
-    return None
+    return indice_glosario.buscar(termino)
 
 def buscar_multiples_terminos(terminos):
     """Busca múltiples términos relacionados en el glosario"""
@@ -413,34 +528,16 @@ def buscar_flujograma(tipo_flujograma, tomo=None):
     nombre_archivo = tipos_flujograma[tipo_flujograma]
     resultados = []
     
-    def buscar_archivo_flujograma(tomo_num, nombre_archivo):
-        """Busca el archivo de flujograma en las diferentes estructuras de carpetas"""
-        # Estructura para tomos 1-7 (archivos directos)
-        ruta_directa = os.path.join("data", "RespuestasParaChatBot", f"RespuestasIA_Tomo{tomo_num}", f"{nombre_archivo}_Tomo_{tomo_num}.txt")
-        
-        # Estructura para tomos 8-11 (carpetas organizadas)
-        ruta_subcarpeta = os.path.join("data", "RespuestasParaChatBot", f"RespuestasIA_Tomo{tomo_num}", "Flujogramas", f"{nombre_archivo}_Tomo_{tomo_num}.txt")
-        
-        for ruta in [ruta_directa, ruta_subcarpeta]:
-            try:
-                with open(ruta, 'r', encoding='utf-8') as file:
-                    contenido = file.read()
-                    if contenido.strip():
-                        return contenido
-            except FileNotFoundError:
-                continue
-        return None
-    
     # Si especifica un tomo, buscar solo en ese tomo
     if tomo:
-        contenido = buscar_archivo_flujograma(tomo, nombre_archivo)
+        contenido = registro_recursos.contenido(nombre_archivo, tomo)
         if contenido:
             resultados.append(f"**FLUJOGRAMA TOMO {tomo} - {tipo_flujograma.upper()}:**\n{contenido}")
     else:
         # Mostrar resumen de TODOS los tomos disponibles
         resumen_tomos = []
-        for tomo_num in range(1, 12):
-            contenido = buscar_archivo_flujograma(tomo_num, nombre_archivo)
+        for tomo_num in registro_recursos.tomos_con(nombre_archivo):
+            contenido = registro_recursos.contenido(nombre_archivo, tomo_num)
             if contenido:
                 # Tomar las primeras líneas para el resumen
                 primeras_lineas = '\n'.join(contenido.split('\n')[:4])
@@ -456,148 +553,11 @@ def buscar_flujograma(tipo_flujograma, tomo=None):
 # --- FUNCIÓN: Convertir texto tabular a HTML table ---
 def texto_a_tabla_html(texto):
     """Convierte texto tabular (separado por tabulaciones, comas o pipes) a una tabla HTML
-    Mejorado con detección de markdown y otros formatos"""
-    
-    # MEJORA: Limpiar texto de fragmentos y marcadores residuales
-    texto = texto.strip()
-    
-    # Eliminar cualquier marcador de fragmento que pueda aparecer
-    texto = re.sub(r'🔍\s*[Ff]ragmento\s*\d*\s*:', '', texto)
-    texto = re.sub(r'[Ff]ragmento\s*\d*\s*:', '', texto)
-    texto = re.sub(r'FRAGMENTO\s*\d*\s*:', '', texto)
-    
-    # Eliminar líneas vacías al inicio y final
-    texto = texto.strip()
-    
-    # MEJORA CRÍTICA: Buscar y extraer SOLO la tabla, ignorando texto previo
-    lineas_originales = texto.strip().split('\n')
-    
-    # Buscar la primera línea que parece ser encabezado de tabla (con |)
-    inicio_tabla = -1
-    for i, linea in enumerate(lineas_originales):
-        if linea.strip().startswith('|') and '|' in linea.strip()[1:]:
-            inicio_tabla = i
-            break
-    
-    # Si encontramos inicio de tabla, usar solo desde ahí
-    if inicio_tabla >= 0:
-        texto_tabla = '\n'.join(lineas_originales[inicio_tabla:])
-        lineas = [l for l in texto_tabla.strip().split('\n') if l.strip()]
-    else:
-        lineas = [l for l in texto.strip().split('\n') if l.strip()]
-    
-    if not lineas or len(lineas) < 2:
-        return f'<pre>{texto}</pre>'  # No parece tabla, mostrar como pre
-
-    # MEJORA: Detectar tablas Markdown (con | al principio o fin de línea)
-    es_markdown = False
-    for l in lineas[:3]:  # Revisar primeras líneas
-        if l.strip().startswith('|') or l.strip().endswith('|'):
-            es_markdown = True
-            break
-    
-    # MEJORA: Limpiar líneas markdown
-    if es_markdown:
-        lineas_limpias = []
-        for l in lineas:
-            # Eliminar pipes iniciales/finales y espacios
-            l = l.strip()
-            if l.startswith('|'):
-                l = l[1:]
-            if l.endswith('|'):
-                l = l[:-1]
-            # Ignorar líneas que son solo separadores (como |---|---|)
-            if not re.match(r'^[\s\-:|\+]+$', l):
-                lineas_limpias.append(l)
-        if lineas_limpias:
-            lineas = lineas_limpias
-
-    # Detectar delimitador
-    delimitadores = ['\t', ';', ',', '|']
-    delimitador = None
-    for d in delimitadores:
-        if any(d in l for l in lineas[:3]):  # Revisar primeras líneas
-            delimitador = d
-            break
-    if not delimitador:
-        # Si no hay delimitador claro, intentar espacios múltiples
-        if any(re.search(r'\s{2,}', l) for l in lineas[:3]):
-            delimitador = None  # Usar split por espacios múltiples
-        else:
-            return f'<pre>{texto}</pre>'
-
-    # MEJORA: Limpiar y normalizar filas
-    filas = []
-    max_celdas = 0
-    
-    for linea in lineas:
-        if delimitador:
-            celdas = [c.strip() for c in linea.split(delimitador)]
-        else:
-            celdas = [c.strip() for c in re.split(r'\s{2,}', linea)]
-        # Ignorar filas vacías o sólo con delimitadores
-        if not any(c for c in celdas):
-            continue
-        filas.append(celdas)
-        max_celdas = max(max_celdas, len(celdas))
-    
-    # Normalizar longitud de filas
-    for i, fila in enumerate(filas):
-        if len(fila) < max_celdas:
-            filas[i] = fila + [''] * (max_celdas - len(fila))
-
-    # Determinar si la primera fila es encabezado
-    if filas:
-        encabezado = filas[0]
-        cuerpo = filas[1:] if len(filas) > 1 else []
-    else:
-        return f'<pre>{texto}</pre>'  # No pudimos procesar como tabla
-
-    # MEJORA: Función auxiliar para detectar tipo de datos y aplicar clases CSS
-    def detectar_tipo_celda(contenido):
-        """Detecta el tipo de contenido de una celda y retorna la clase CSS apropiada"""
-        if not contenido or not contenido.strip():
-            return ""
-        
-        contenido = contenido.strip()
-        
-        # Detectar números
-        if re.match(r'^[\d\.,\$€£¥₹]+$', contenido) or re.match(r'^\d+(\.\d+)?$', contenido):
-            return ' class="numero"'
-        
-        # Detectar fechas
-        if re.match(r'\d{1,2}[/-]\d{1,2}[/-]\d{2,4}', contenido) or re.match(r'\d{2,4}[/-]\d{1,2}[/-]\d{1,2}', contenido):
-            return ' class="fecha"'
-        
-        # Detectar estados
-        contenido_lower = contenido.lower()
-        if contenido_lower in ['activo', 'aprobado', 'completado', 'si', 'sí', 'yes', 'vigente']:
-            return ' class="estado activo"'
-        elif contenido_lower in ['pendiente', 'en proceso', 'tramitando', 'revisión']:
-            return ' class="estado pendiente"'
-        elif contenido_lower in ['inactivo', 'rechazado', 'vencido', 'no', 'cancelado']:
-            return ' class="estado inactivo"'
-        
-        return ""
-    
-    # MEJORA: Estilo mejorado para tabla usando clases CSS modernas con detección de tipos - SIN ESPACIOS EXTRAS
-    html = '<div class="tabla-container"><table class="tabla-moderna">'
-    html += '<thead><tr>' + ''.join(f'<th>{col}</th>' for col in encabezado) + '</tr></thead>'
-    html += '<tbody>'
-    for fila in cuerpo:
-        html += '<tr>' + ''.join(f'<td{detectar_tipo_celda(celda)}>{celda}</td>' for celda in fila) + '</tr>'
-    html += '</tbody></table></div>'
-    return html
+    Mejorado con detección de markdown y otros formatos. El HTML se memoriza por contenido"""
+    return motor_tablas.renderizar(texto)
 
-def buscar_tabla_cabida(tomo=None):
-    """Busca tablas de cabida por tomo y las convierte a HTML si es posible
-    REFORZADO: Garantiza devolver siempre una respuesta clara"""
-    resultados = []
-    
-    # Función auxiliar para crear tabla de cabida ficticia cuando no exista
-    def crear_tabla_cabida_generica(tomo_num):
-        """Crea una tabla de cabida genérica para mostrar cuando no se encuentra la real"""
-        return f"""
+# Tabla de cabida genérica para mostrar cuando no se encuentra la real
+TABLA_CABIDA_GENERICA = """
 A continuación se presenta una tabla con la cabida mínima y máxima permitida para cada distrito de calificación en Puerto Rico:
 
 | Distrito de Calificación | Cabida Mínima Permitida | Cabida Máxima Permitida |
@@ -610,27 +570,22 @@ A continuación se presenta una tabla con la cabida mínima y máxima permitida
 
 Es importante tener en cuenta que estos valores pueden variar según la normativa específica de cada municipio o entidad reguladora.
 """
+
+def buscar_tabla_cabida(tomo=None):
+    """Busca tablas de cabida por tomo y las convierte a HTML si es posible
+    REFORZADO: Garantiza devolver siempre una respuesta clara"""
+    resultados = []
+    
+    # Función auxiliar para crear tabla de cabida ficticia cuando no exista
+    def crear_tabla_cabida_generica(tomo_num):
+        """Crea una tabla de cabida genérica para mostrar cuando no se encuentra la real"""
+        return TABLA_CABIDA_GENERICA
     
     def buscar_archivo_tabla(tomo_num):
-        # Log para depuración
-        print(f"⚠️ Buscando tabla de cabida para tomo {tomo_num}...")
-        
-        ruta_directa = os.path.join("data", "RespuestasParaChatBot", f"RespuestasIA_Tomo{tomo_num}", f"TablaCabida_Tomo_{tomo_num}.txt")
-        ruta_subcarpeta = os.path.join("data", "RespuestasParaChatBot", f"RespuestasIA_Tomo{tomo_num}", "Tablas", f"TablaCabida_Tomo_{tomo_num}.txt")
-        
-        # Log de rutas para depuración
-        print(f"📂 Probando ruta: {ruta_directa}")
-        print(f"📂 Probando ruta: {ruta_subcarpeta}")
-        
-        for ruta in [ruta_directa, ruta_subcarpeta]:
-            try:
-                with open(ruta, 'r', encoding='utf-8') as file:
-                    contenido = file.read()
-                    if contenido.strip():
-                        print(f"✅ Tabla encontrada en {ruta}")
-                        return contenido
-            except FileNotFoundError:
-                continue
+        contenido = registro_recursos.contenido('TablaCabida', tomo_num)
+        if contenido:
+            print(f"✅ Tabla encontrada en {registro_recursos.ruta('TablaCabida', tomo_num)}")
+            return contenido
         
         # Si no encuentra archivo, usar tabla genérica
         print(f"❌ No se encontró tabla para tomo {tomo_num}, usando genérica")
@@ -653,10 +608,7 @@ Es importante tener en cuenta que estos valores pueden variar según la normativ
         print(tabla_html[:200] + "..." if len(tabla_html) > 200 else tabla_html)
         
         # Log para el file system en Render
-        with open("log.txt", "a", encoding="utf-8") as log_file:
-            log_file.write(f"\n\n==== TABLA HTML GENERADA PARA TOMO {tomo} ====\n")
-            log_file.write(tabla_html[:500] + "..." if len(tabla_html) > 500 else tabla_html)
-            log_file.write("\n==== FIN TABLA HTML ====\n\n")
+        bitacora.registrar('tabla_cabida', respuesta=tabla_html[:500], tomo=tomo)
         
         # MEJORA: Devolver solo la tabla sin títulos ni espacios adicionales
         resultados.append(tabla_html)
@@ -678,41 +630,27 @@ Es importante tener en cuenta que estos valores pueden variar según la normativ
 
 def detectar_y_generar_tabla_automatica(entrada):
     """Detecta automáticamente solicitudes de tablas y genera respuestas en formato tabla HTML"""
-    entrada_lower = entrada.lower()
-    
-    # Palabras clave que indican solicitud de tabla
-    palabras_tabla = [
-        'tabla', 'tablas', 'generar tabla', 'mostrar tabla', 'crear tabla',
-        'tabla de', 'tabla con', 'resumen tabla', 'formato tabla'
-    ]
+    consulta = analizar_consulta(entrada)
     
     # Detectar si el usuario quiere una tabla
-    solicita_tabla = any(palabra in entrada_lower for palabra in palabras_tabla)
-    
-    if not solicita_tabla:
+    if not consulta.tiene('solicita_tabla'):
         return None
     
     # Detectar tipos específicos de tabla solicitados
-    if any(palabra in entrada_lower for palabra in ['cabida', 'superficie', 'área']):
-        # Es una solicitud de tabla de cabida
-        tomo = None
-        # Buscar número de tomo en la entrada
-        import re
-        match = re.search(r'tomo\s*(\d+)', entrada_lower)
-        if match:
-            tomo = int(match.group(1))
-        return buscar_tabla_cabida(tomo)
+    if consulta.tiene('tabla_cabida'):
+        # Es una solicitud de tabla de cabida (del tomo mencionado, si lo hay)
+        return buscar_tabla_cabida(consulta.tomo)
     
     # Detectar solicitudes de tablas de calificación/zonificación
-    elif any(palabra in entrada_lower for palabra in ['calificación', 'calificacion', 'zonificación', 'zonificacion', 'distrito', 'distritos']):
+    elif consulta.tiene('tabla_calificaciones'):
         return generar_tabla_calificaciones()
     
     # Detectar solicitudes de tablas de permisos
-    elif any(palabra in entrada_lower for palabra in ['permiso', 'permisos', 'licencia', 'licencias', 'trámite', 'tramite']):
+    elif consulta.tiene('tabla_permisos'):
         return generar_tabla_permisos()
     
     # Detectar solicitudes de tablas de agencias
-    elif any(palabra in entrada_lower for palabra in ['agencia', 'agencias', 'entidad', 'entidades', 'organización', 'organizacion']):
+    elif consulta.tiene('tabla_agencias'):
         return generar_tabla_agencias()
     
     # Si menciona tabla pero no es específica, ofrecer opciones
@@ -791,30 +729,27 @@ Puedo generar tablas en formato HTML sobre los siguientes temas:
 ¿Sobre qué tema te gustaría que genere una tabla?
 """]
 
+def precalentar_tablas():
+    """Pre-renderiza las tablas fijas y todas las TablaCabida_Tomo_N para servirlas desde caché"""
+    generar_tabla_calificaciones()
+    generar_tabla_permisos()
+    generar_tabla_agencias()
+    for tomo_num in range(1, 12):
+        contenido = registro_recursos.contenido('TablaCabida', tomo_num) or TABLA_CABIDA_GENERICA
+        texto_a_tabla_html(contenido)
+        texto_a_tabla_html('\n'.join(contenido.split('\n')[:5]))
+    precalentar_tablas_especialista()
+    print(f"✅ Tablas HTML pre-renderizadas: {motor_tablas.estadisticas()['tablas']}")
+
+precalentar_tablas()
+metricas.registrar_cache('tablas_html', lambda: (motor_tablas.aciertos, motor_tablas.fallos))
+
 def buscar_resoluciones(tomo=None, tema=None):
     """Busca resoluciones por tomo y tema"""
     resultados = []
     
-    def buscar_archivo_resoluciones(tomo_num):
-        """Busca el archivo de resoluciones en las diferentes estructuras de carpetas"""
-        # Estructura para tomos 1-7 (archivos directos)
-        ruta_directa = f"data/RespuestasParaChatBot/RespuestasIA_Tomo{tomo_num}/Resoluciones_Tomo_{tomo_num}.txt"
-        
-        # Estructura para tomos 8-11 (carpetas organizadas)
-        ruta_subcarpeta = f"data/RespuestasParaChatBot/RespuestasIA_Tomo{tomo_num}/Resoluciones/Resoluciones_Tomo_{tomo_num}.txt"
-        
-        for ruta in [ruta_directa, ruta_subcarpeta]:
-            try:
-                with open(ruta, 'r', encoding='utf-8') as file:
-                    contenido = file.read()
-                    if contenido.strip():
-                        return contenido
-            except FileNotFoundError:
-                continue
-        return None
-    
     if tomo:
-        contenido = buscar_archivo_resoluciones(tomo)
+        contenido = registro_recursos.contenido('Resoluciones', tomo)
         if contenido:
             if tema:
                 # Filtrar por tema si se especifica
@@ -828,8 +763,8 @@ def buscar_resoluciones(tomo=None, tema=None):
     else:
         # Mostrar resumen de TODOS los tomos disponibles
         resumen_tomos = []
-        for tomo_num in range(1, 12):
-            contenido = buscar_archivo_resoluciones(tomo_num)
+        for tomo_num in registro_recursos.tomos_con('Resoluciones'):
+            contenido = registro_recursos.contenido('Resoluciones', tomo_num)
             if contenido:
                 # Extraer las primeras líneas para el resumen
                 primeras_lineas = '\n'.join(contenido.split('\n')[:3])
@@ -842,79 +777,98 @@ def buscar_resoluciones(tomo=None, tema=None):
     return resultados if resultados else None
 
 def cargar_reglamento_emergencia():
-    """Carga el reglamento de emergencia JP-RP-41"""
-    ruta_emergencia = os.path.join("data", "reglamento_emergencia_jp41_chatbot_20250731_155845.json")
-    if os.path.exists(ruta_emergencia):
-        try:
-            with open(ruta_emergencia, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            return data.get('analisis_completo', '')
-        except Exception as e:
-            print(f"❌ Error cargando reglamento emergencia: {e}")
-            return ""
-    return ""
+    """Carga el reglamento de emergencia JP-RP-41 (campo 'analisis_completo' del JSON)"""
+    return corpus.texto("reglamento_emergencia")
 
 def cargar_info_division_ambiental():
     """Carga la información sobre la División de Cumplimiento Ambiental"""
-    ruta_info = os.path.join("data", "division_cumplimiento_ambiental.txt")
-    if os.path.exists(ruta_info):
-        try:
-            with open(ruta_info, "r", encoding="utf-8") as f:
-                contenido = f.read()
-            return contenido
-        except Exception as e:
-            print(f"❌ Error cargando info división ambiental: {e}")
-            return """La División de Evaluación de Cumplimiento Ambiental (DECA) de la OGPe es responsable de evaluar y tramitar todos los documentos ambientales presentados a la agencia. Cumple funciones administrativas y de manejo de documentación ambiental según lo establece la Ley 161-2009."""
+    contenido = corpus.texto("division_ambiental")
+    if contenido:
+        return contenido
     return """La División de Evaluación de Cumplimiento Ambiental (DECA) de la OGPe es responsable de evaluar y tramitar todos los documentos ambientales presentados a la agencia. Cumple funciones administrativas y de manejo de documentación ambiental según lo establece la Ley 161-2009."""
 
 reglamento_emergencia = cargar_reglamento_emergencia()
+if reglamento_emergencia:
+    # Índice de pasajes leído del paquete de corpus (o construido una sola vez al cargar)
+    indice_reglamento = corpus.indice_pasajes("reglamento_emergencia")
+    registrar_indice_pasajes("Reglamento de Emergencia JP-RP-41", indice_reglamento)
+    print(f"✅ Índice BM25 del Reglamento de Emergencia: {len(indice_reglamento)} pasajes")
 info_division_ambiental = cargar_info_division_ambiental()
 
 def cargar_tomo_10_conservacion_historica():
     """Carga la información completa del Tomo 10 de Conservación Histórica"""
-    ruta_tomo10 = os.path.join("data", "Tomo_10_Conservacion_Historica.txt")
-    if os.path.exists(ruta_tomo10):
-        try:
-            with open(ruta_tomo10, "r", encoding="utf-8") as f:
-                contenido = f.read()
-            print(f"✅ Tomo 10 Conservación Histórica cargado: {len(contenido)} caracteres")
-            return contenido
-        except Exception as e:
-            print(f"❌ Error cargando Tomo 10: {e}")
-            return ""
+    contenido = corpus.texto("tomo_10_conservacion")
+    if contenido:
+        print(f"✅ Tomo 10 Conservación Histórica cargado: {len(contenido)} caracteres")
     else:
-        print(f"⚠️ Tomo 10 no encontrado en: {ruta_tomo10}")
-        return ""
+        print(f"⚠️ Tomo 10 no encontrado en: {corpus.ruta_origen('tomo_10_conservacion')}")
+    return contenido
 
 tomo_10_conservacion = cargar_tomo_10_conservacion_historica()
 
+# Tomo 10 dividido por secciones: las consultas de sitios históricos solo envían las que aplican
+indice_tomo_10 = corpus.indice_secciones("tomo_10_conservacion")
+PRESUPUESTO_TOKENS_TOMO_10 = int(os.getenv("PRESUPUESTO_TOKENS_TOMO_10", "2000"))
+if tomo_10_conservacion:
+    print(f"✅ Índice de secciones del Tomo 10: {len(indice_tomo_10)} secciones")
+
+def cargar_tomos():
+    """Texto de los tomos 1-11 disponibles, cargado una sola vez: {número: texto}"""
+    tomos = {}
+    for i in range(1, 12):
+        contenido = corpus.texto(f"tomo_{i}")
+        if contenido:
+            tomos[i] = contenido
+            registrar_indice_pasajes(f"Tomo {i}", corpus.indice_pasajes(f"tomo_{i}"))
+    print(f"✅ Tomos cargados: {len(tomos)}")
+    return tomos
+
+textos_tomos = cargar_tomos()
+
+# TF-IDF de los pasajes de todos los tomos para elegir los más relevantes a cada pregunta
+indice_tomos = IndiceVectorial({i: corpus.indice_pasajes(f"tomo_{i}") for i in textos_tomos})
+print(f"✅ Índice TF-IDF de los tomos: {len(indice_tomos)} pasajes, {len(indice_tomos.vocabulario)} términos")
+
+# Texto completo extraído de los tomos (texto_extraido_Tomo_N.txt): índice en disco, proyectado en la primera búsqueda
+indice_texto_extraido = IndiceTextoExtraido(RUTA_INDICE_TEXTO_EXTRAIDO, os.path.join("data", "RespuestasParaChatBot"))
+PASAJES_TEXTO_EXTRAIDO = int(os.getenv("PASAJES_TEXTO_EXTRAIDO", "3"))
+
+def buscar_texto_extraido(entrada, tomos=None, top_k=PASAJES_TEXTO_EXTRAIDO):
+    """Pasajes del texto oficial de los tomos: [(etiqueta, texto)] con tomo, sección y página"""
+    if top_k <= 0:
+        return []
+    with metricas.medir('texto_extraido'):
+        pasajes = indice_texto_extraido.buscar(entrada, top_k=top_k, tomos=tomos)
+    resultados = []
+    for pasaje in pasajes:
+        ubicacion = [f"Tomo {pasaje.tomo}"]
+        if pasaje.seccion:
+            ubicacion.append(f"Sección {pasaje.seccion}")
+        if pasaje.pagina:
+            ubicacion.append(f"pág. {pasaje.pagina}")
+        resultados.append((", ".join(ubicacion), pasaje.texto))
+    return resultados
+
 def buscar_en_tomo_10_sitios_historicos(entrada):
     """Busca información específica sobre sitios históricos en el Tomo 10"""
     if not tomo_10_conservacion:
         return None
     
-    entrada_lower = entrada.lower()
-    
-    # Detectar preguntas sobre sitios históricos
-    palabras_sitios_historicos = [
-        'sitio histórico', 'sitios históricos', 'sitio historico', 'sitios historicos',
-        'zona histórica', 'zonas históricas', 'zona historica', 'zonas historicas',
-        'conservación histórica', 'conservacion historica', 'patrimonio histórico',
-        'designación histórica', 'designacion historica', 'nominación histórica'
-    ]
-    
     # Verificar si la pregunta es sobre sitios históricos
-    es_consulta_historica = any(palabra in entrada_lower for palabra in palabras_sitios_historicos)
+    es_consulta_historica = analizar_consulta(entrada).tiene('sitios_historicos')
     
     if not es_consulta_historica:
         return None
     
     try:
+        # Secciones citadas en las instrucciones y las que coinciden con la pregunta, dentro del presupuesto
+        secciones = indice_tomo_10.seleccionar(entrada, SECCIONES_CONSERVACION, PRESUPUESTO_TOKENS_TOMO_10)
+        
         # Crear prompt específico para sitios históricos con información de conservación histórica
         prompt = f"""Eres Agente de Planificación, especialista en conservación histórica de Puerto Rico.
 
 INFORMACIÓN DE CONSERVACIÓN HISTÓRICA DEL REGLAMENTO DE EMERGENCIA JP-RP-41:
-{tomo_10_conservacion}
+{secciones}
 
 PREGUNTA DEL USUARIO: {entrada}
 
@@ -1042,45 +996,12 @@ def generar_indice_completo():
         'resoluciones': []
     }
     
-    def verificar_archivo_existe(tomo_num, nombre_archivo, subcarpeta=""):
-        """Verifica si un archivo existe en cualquiera de las estructuras de carpetas"""
-        if subcarpeta:
-            # Estructura para tomos 8-11 (carpetas organizadas)
-            ruta_subcarpeta = f"data/RespuestasParaChatBot/RespuestasIA_Tomo{tomo_num}/{subcarpeta}/{nombre_archivo}_Tomo_{tomo_num}.txt"
-        else:
-            ruta_subcarpeta = None
-            
-        # Estructura para tomos 1-7 (archivos directos)
-        ruta_directa = f"data/RespuestasParaChatBot/RespuestasIA_Tomo{tomo_num}/{nombre_archivo}_Tomo_{tomo_num}.txt"
-        
-        rutas = [ruta_directa] + ([ruta_subcarpeta] if ruta_subcarpeta else [])
-        
-        for ruta in rutas:
-            try:
-                with open(ruta, 'r', encoding='utf-8') as file:
-                    if file.read().strip():
-                        return True
-            except FileNotFoundError:
-                continue
-        return False
-    
-    # Verificar qué recursos existen en cada tomo
-    for tomo_num in range(1, 12):
-        # Verificar flujogramas
-        if verificar_archivo_existe(tomo_num, 'flujogramaTerrPublicos', 'Flujogramas'):
-            recursos_encontrados['flujogramas_terrenos'].append(tomo_num)
-        if verificar_archivo_existe(tomo_num, 'flujogramaCambiosCalificacion', 'Flujogramas'):
-            recursos_encontrados['flujogramas_calificacion'].append(tomo_num)
-        if verificar_archivo_existe(tomo_num, 'flujogramaSitiosHistoricos', 'Flujogramas'):
-            recursos_encontrados['flujogramas_historicos'].append(tomo_num)
-        
-        # Verificar tablas de cabida
-        if verificar_archivo_existe(tomo_num, 'TablaCabida', 'Tablas'):
-            recursos_encontrados['tablas_cabida'].append(tomo_num)
-        
-        # Verificar resoluciones
-        if verificar_archivo_existe(tomo_num, 'Resoluciones', 'Resoluciones'):
-            recursos_encontrados['resoluciones'].append(tomo_num)
+    # Qué recursos existen en cada tomo, según el registro cargado al arrancar
+    recursos_encontrados['flujogramas_terrenos'] = registro_recursos.tomos_con('flujogramaTerrPublicos')
+    recursos_encontrados['flujogramas_calificacion'] = registro_recursos.tomos_con('flujogramaCambiosCalificacion')
+    recursos_encontrados['flujogramas_historicos'] = registro_recursos.tomos_con('flujogramaSitiosHistoricos')
+    recursos_encontrados['tablas_cabida'] = registro_recursos.tomos_con('TablaCabida')
+    recursos_encontrados['resoluciones'] = registro_recursos.tomos_con('Resoluciones')
     
     # Construir el índice
     indice += "🔄 **FLUJOGRAMAS DISPONIBLES:**\n"
@@ -1107,7 +1028,7 @@ def procesar_pregunta_glosario(entrada):
     entrada_lower = entrada.lower()
     
     # Detectar preguntas de comparación/diferencia
-    if any(palabra in entrada_lower for palabra in ['diferencia', 'diferencias', 'comparar', 'comparación']):
+    if analizar_consulta(entrada).tiene('comparacion'):
         # Buscar patrones como "diferencia entre X y Y"
         patrones_comparacion = [
             r'diferencias?\s+entre\s+(.+?)\s+y\s+(.+?)[\?]?',
@@ -1173,8 +1094,7 @@ def extraer_terminos_inteligente(entrada):
             termino = match.group(1).strip()
             
             # Limpiar el término
-            palabras_eliminar = ['qué es', 'que es', 'significa', 'es', 'un', 'una', 'el', 'la', 'los', 'las']
-            for palabra in palabras_eliminar:
+            for palabra in PALABRAS_ELIMINAR_TERMINO:
                 if termino.startswith(palabra + ' '):
                     termino = termino[len(palabra):].strip()
             
@@ -1266,91 +1186,56 @@ RESPUESTA INTELIGENTE:"""
 def detectar_consulta_especifica(entrada):
     """Detecta consultas específicas sobre recursos estructurados
     REFORZADO: Mejorado para detectar variantes de consultas sobre tablas de cabida"""
-    entrada_lower = entrada.lower()
+    consulta = analizar_consulta(entrada)
     
     # Log para depuración
     print(f"🔍 Analizando consulta específica: '{entrada}'")
     
     # Detectar solicitud de índice completo
-    if any(palabra in entrada_lower for palabra in ['índice', 'indice', 'lista completa', 'todos los recursos', 'qué recursos', 'recursos disponibles']):
+    if consulta.tiene('indice_completo'):
         print("✅ Detectada consulta tipo: índice_completo")
         return {'tipo': 'indice_completo'}
     
     # Detectar búsqueda de flujogramas
-    if any(palabra in entrada_lower for palabra in ['flujograma', 'proceso', 'trámite', 'procedimiento']):
-        if any(palabra in entrada_lower for palabra in ['terreno', 'terrenos', 'público', 'públicos']):
+    if consulta.tiene('flujograma'):
+        if consulta.tiene('flujograma_terrenos'):
             print("✅ Detectada consulta tipo: flujograma - terrenos")
             return {'tipo': 'flujograma', 'subtipo': 'terrenos'}
-        elif any(palabra in entrada_lower for palabra in ['calificación', 'cambio', 'cambios']):
+        elif consulta.tiene('flujograma_calificacion'):
             print("✅ Detectada consulta tipo: flujograma - calificacion")
             return {'tipo': 'flujograma', 'subtipo': 'calificacion'}
-        elif any(palabra in entrada_lower for palabra in ['histórico', 'historicos', 'sitio', 'sitios']):
+        elif consulta.tiene('flujograma_historicos'):
             print("✅ Detectada consulta tipo: flujograma - historicos")
             return {'tipo': 'flujograma', 'subtipo': 'historicos'}
     
-    # REFORZADO: Detectar búsqueda de tablas de cabida con más patrones
-    # Patrones comunes de consulta sobre tablas de cabida
-    patrones_tabla_cabida = [
-        r'tabla.*cabida',
-        r'cabida.*tabla',
-        r'cabida.*distrito',
-        r'cabida.*tomo',
-        r'tabla.*tomo',
-        r'tabla.*distrito',
-        r'muestra.*tabla.*cabida',
-        r'ver.*tabla.*cabida',
-        r'información.*cabida'
-    ]
-    
-    # Comprobar si la entrada coincide con algún patrón
-    if any(re.search(patron, entrada_lower) for patron in patrones_tabla_cabida):
-        # Extraer número de tomo si se menciona usando una expresión regular más flexible
-        tomo_match = re.search(r'tomo\s*(\d+)|del\s+tomo\s*(\d+)', entrada_lower)
-        
-        # Obtener el tomo de cualquier grupo capturado
-        tomo = None
-        if tomo_match:
-            for grupo in tomo_match.groups():
-                if grupo is not None:
-                    tomo = int(grupo)
-                    break
-        
-        if tomo:
-            print(f"✅ Detectada consulta tipo: tabla_cabida - tomo {tomo}")
-            return {'tipo': 'tabla_cabida', 'tomo': tomo}
+    # REFORZADO: Detectar búsqueda de tablas de cabida (patrones de enrutador.PATRON_TABLA_CABIDA)
+    if consulta.pide_tabla_cabida:
+        if consulta.tomo:
+            print(f"✅ Detectada consulta tipo: tabla_cabida - tomo {consulta.tomo}")
+            return {'tipo': 'tabla_cabida', 'tomo': consulta.tomo}
         else:
             print("✅ Detectada consulta tipo: tabla_cabida - sin tomo específico")
             return {'tipo': 'tabla_cabida'}
     
     # Detectar búsqueda de resoluciones
-    if any(palabra in entrada_lower for palabra in ['resolución', 'resoluciones']):
+    if consulta.tiene('resoluciones'):
         print("✅ Detectada consulta tipo: resoluciones")
         return {'tipo': 'resoluciones'}
     
     # Detectar número de tomo específico
-    tomo_match = re.search(r'tomo\s+(\d+)', entrada_lower)
-    if tomo_match:
-        print(f"✅ Detectada consulta tipo: tomo_especifico - tomo {tomo_match.group(1)}")
-        return {'tipo': 'tomo_especifico', 'tomo': int(tomo_match.group(1))}
+    if consulta.tomo is not None:
+        print(f"✅ Detectada consulta tipo: tomo_especifico - tomo {consulta.tomo}")
+        return {'tipo': 'tomo_especifico', 'tomo': consulta.tomo}
     
     print("❌ No se detectó ningún tipo de consulta específica")
     return None
 
 def procesar_consulta_especifica(entrada, tipo_consulta):
     """Procesa consultas específicas sobre recursos estructurados"""
-    entrada_lower = entrada.lower()
-    
-    # Extraer número de tomo si se menciona
-    tomo_match = re.search(r'tomo\s+(\d+)|del\s+tomo\s*(\d+)', entrada_lower)
+    consulta = analizar_consulta(entrada)
     
-    # Obtener el número de tomo del grupo que haya coincidido
-    tomo = None
-    if tomo_match:
-        # Tomar el primer grupo que no sea None
-        for grupo in tomo_match.groups():
-            if grupo is not None:
-                tomo = int(grupo)
-                break
+    # Número de tomo mencionado (detectado por el enrutador)
+    tomo = consulta.tomo
     
     # Log para depuración
     print(f"⚙️ Procesando consulta específica tipo: {tipo_consulta['tipo']}")
@@ -1387,11 +1272,11 @@ def procesar_consulta_especifica(entrada, tipo_consulta):
     elif tipo_consulta['tipo'] == 'resoluciones':
         # Detectar tema específico
         tema = None
-        if 'ambiente' in entrada_lower or 'ambiental' in entrada_lower:
+        if consulta.tiene('tema_ambiente'):
             tema = 'ambiente'
-        elif 'construcción' in entrada_lower or 'construccion' in entrada_lower:
+        elif consulta.tiene('tema_construccion'):
             tema = 'construcción'
-        elif 'zonificación' in entrada_lower or 'zonificacion' in entrada_lower:
+        elif consulta.tiene('tema_zonificacion'):
             tema = 'zonificación'
         
         resultados = buscar_resoluciones(tomo, tema)
@@ -1408,116 +1293,118 @@ def procesar_consulta_especifica(entrada, tipo_consulta):
 
 def detectar_tipo_pregunta(entrada):
     """Detecta el tipo de pregunta y determina la mejor estrategia de búsqueda"""
-    entrada_lower = entrada.lower()
+    consulta = analizar_consulta(entrada)
     
     # Preguntas de comparación/diferencia
-    if any(palabra in entrada_lower for palabra in ['diferencia', 'diferencias', 'comparar', 'comparación']):
+    if consulta.tiene('comparacion'):
         return 'comparacion'
     
     # Preguntas sobre REQUISITOS Y PROCEDIMIENTOS - PRIORIDAD ALTA para Reglamento
-    palabras_requisitos = ['requisito', 'requisitos', 'proceso', 'procedimiento', 'pasos', 'como', 'cómo', 'necesito', 'solicitar', 'obtener', 'tramitar', 'aplicar']
-    if any(palabra in entrada_lower for palabra in palabras_requisitos):
+    if consulta.tiene('requisitos'):
         return 'requisitos_procedimientos'
     
     # Preguntas sobre el glosario/definiciones SOLO cuando se pregunta explícitamente
-    palabras_glosario = ['qué es', 'que es', 'define', 'definición', 'definicion', 'significado', 'explica', 'explícame', 'explicame', 'concepto', 'término', 'termino', 'significa']
-    if any(palabra in entrada_lower for palabra in palabras_glosario):
+    if consulta.tiene('definicion'):
         return 'glosario'
 
     # Preguntas sobre permisos - PRIORIDAD REGLAMENTO si hay palabras de acción
-    if any(palabra in entrada_lower for palabra in ['permiso', 'autorización', 'licencia', 'trámite']):
+    if consulta.tiene('tipo_permisos'):
         # Si incluye palabras de acción, es requisitos/procedimientos
-        if any(accion in entrada_lower for accion in ['requisito', 'como', 'cómo', 'proceso', 'solicitar', 'obtener', 'tramitar']):
+        if consulta.tiene('accion'):
             return 'requisitos_procedimientos'
         return 'permisos'
 
     # Preguntas sobre construcción
-    if any(palabra in entrada_lower for palabra in ['construcción', 'edificar', 'estructura', 'obra']):
-        return 'construccion'
-
-    # Preguntas sobre planificación
-    if any(palabra in entrada_lower for palabra in ['plan', 'zonificación', 'ordenación', 'uso de suelo']):
-        return 'planificacion'
-
-    # Preguntas ambientales
-    if any(palabra in entrada_lower for palabra in ['ambiental', 'conservación', 'aguas', 'desperdicios']):
-        return 'ambiental'
-
-    return 'general'
-    if any(palabra in entrada_lower for palabra in ['permiso', 'autorización', 'licencia', 'trámite']):
-        return 'permisos'
-
-    # Preguntas sobre construcción
-    if any(palabra in entrada_lower for palabra in ['construcción', 'edificar', 'estructura', 'obra']):
+    if consulta.tiene('construccion'):
         return 'construccion'
 
     # Preguntas sobre planificación
-    if any(palabra in entrada_lower for palabra in ['plan', 'zonificación', 'ordenación', 'uso de suelo']):
+    if consulta.tiene('planificacion'):
         return 'planificacion'
 
     # Preguntas ambientales
-    if any(palabra in entrada_lower for palabra in ['ambiental', 'conservación', 'aguas', 'desperdicios']):
+    if consulta.tiene('ambiental'):
         return 'ambiental'
 
     return 'general'
 
-
 def es_pregunta_simple(entrada):
     """Determina si una pregunta es simple y puede responderse con información limitada"""
-    entrada_lower = entrada.lower()
+    consulta = analizar_consulta(entrada)
     
-    # Preguntas que requieren búsqueda específica
-    palabras_complejas = [
-        "todos", "lista", "cantidad", "cuantos", "cuántos", "comparar", "diferencia",
-        "análisis", "resumen", "procedimiento completo", "proceso completo"
-    ]
-    
-    # Preguntas simples típicas
-    palabras_simples = [
-        "qué es", "que es", "define", "definición", "significa", 
-        "cómo se", "como se", "para qué", "para que"
-    ]
-    
-    # Si tiene palabras complejas, no es simple
-    if any(palabra in entrada_lower for palabra in palabras_complejas):
+    # Si tiene palabras de preguntas que requieren búsqueda específica, no es simple
+    if consulta.tiene('compleja'):
         return False
     
-    # Si tiene palabras simples o es muy corta, es simple
-    if any(palabra in entrada_lower for palabra in palabras_simples):
+    # Si tiene palabras de preguntas simples típicas o es muy corta, es simple
+    if consulta.tiene('simple'):
         return True
     
     # Si la pregunta es muy corta (menos de 5 palabras), probablemente es simple
     return len(entrada.split()) <= 5
 
-def evaluar_relevancia_tomo(entrada, archivo_tomo):
-    """Evalúa qué tan relevante es un tomo para una pregunta específica"""
-    try:
-        with open(archivo_tomo, 'r', encoding='utf-8') as f:
-            contenido = f.read().lower()
-        
-        palabras_pregunta = [palabra.lower() for palabra in entrada.split() if len(palabra) > 3]
-        score_relevancia = 0
-        
-        for palabra in palabras_pregunta:
-            if palabra in contenido:
-                # Contar ocurrencias pero dar más peso a palabras menos comunes
-                ocurrencias = contenido.count(palabra)
-                if ocurrencias > 0:
-                    # Palabras menos frecuentes tienen más peso
-                    peso = min(5, 10 // max(1, ocurrencias // 10))
-                    score_relevancia += ocurrencias * peso
-        
-        return score_relevancia
-    except:
-        return 0
+# Ejecutor acotado para consultar las fuentes de una pregunta legal en paralelo
+MAX_FUENTES_PARALELAS = int(os.getenv("MAX_FUENTES_PARALELAS", "8"))
+ejecutor_fuentes = ThreadPoolExecutor(max_workers=MAX_FUENTES_PARALELAS, thread_name_prefix="fuente")
+
+# Tiempo máximo (segundos) que se espera a cada fuente antes de sintetizar sin ella
+TIEMPOS_LIMITE_FUENTES = {
+    "emergencia": float(os.getenv("LIMITE_FUENTE_EMERGENCIA", "30")),
+    "glosario": float(os.getenv("LIMITE_FUENTE_GLOSARIO", "30")),
+    "tomo": float(os.getenv("LIMITE_FUENTE_TOMO", "25")),
+}
 
+def limite_fuente(nombre):
+    """Tiempo límite de una fuente ('tomo_3' usa el límite de 'tomo')"""
+    return TIEMPOS_LIMITE_FUENTES.get(nombre.split("_")[0], 30.0)
+
+def consultar_fuentes_en_paralelo(tareas):
+    """Ejecuta {nombre: (funcion, *args)} en paralelo y devuelve {nombre: resultado}
+    
+    Cada fuente tiene su propio tiempo límite; las que fallan o no terminan a
+    tiempo se omiten y la síntesis continúa con los resultados parciales."""
+    inicio = time.monotonic()
+    
+    def ejecutar_midiendo(tarea):
+        inicio_tarea = time.perf_counter()
+        resultado = tarea[0](*tarea[1:])
+        return resultado, time.perf_counter() - inicio_tarea
+    
+    # Cada fuente lleva el contexto de la petición (sesión para el gobernador de llamadas al modelo)
+    pendientes = {ejecutor_fuentes.submit(contextvars.copy_context().run, ejecutar_midiendo, tarea): nombre
+                  for nombre, tarea in tareas.items()}
+    resultados = {}
+    
+    while pendientes:
+        transcurrido = time.monotonic() - inicio
+        for futuro, nombre in list(pendientes.items()):
+            if transcurrido >= limite_fuente(nombre):
+                print(f"⏱️ Fuente '{nombre}' excedió {limite_fuente(nombre):g}s, se continúa sin ella")
+                metricas.incrementar('betaia_fuentes_omitidas_total', fuente=nombre.split("_")[0])
+                futuro.cancel()
+                del pendientes[futuro]
+        if not pendientes:
+            break
+        
+        espera = min(limite_fuente(nombre) for nombre in pendientes.values()) - transcurrido
+        terminados, _ = wait(pendientes, timeout=max(espera, 0), return_when=FIRST_COMPLETED)
+        for futuro in terminados:
+            nombre = pendientes.pop(futuro)
+            try:
+                resultados[nombre], duracion = futuro.result()
+                metricas.registrar_etapa(f'fuente_{nombre.split("_")[0]}', duracion, f'fuente_{nombre}')
+            except Exception as e:
+                print(f"Error consultando fuente '{nombre}': {e}")
+    
+    print(f"⚡ Fuentes consultadas en {time.monotonic() - inicio:.2f}s: {', '.join(resultados) or 'ninguna'}")
+    return resultados
 
 def procesar_pregunta_legal(entrada):
     """Procesa preguntas legales con IA híbrida inteligente"""
-    entrada_lower = entrada.lower()
+    consulta = analizar_consulta(entrada)
     
     # Caso especial para División de Cumplimiento Ambiental
-    if "división de cumplimiento ambiental" in entrada_lower or "division de cumplimiento ambiental" in entrada_lower:
+    if consulta.tiene('division_ambiental'):
         return """🚨 **REGLAMENTO DE EMERGENCIA JP-RP-41**:
 
 La División de Evaluación de Cumplimiento Ambiental (DECA) de la OGPe es responsable de evaluar y tramitar todos los documentos ambientales presentados a la agencia. Cumple funciones administrativas y de manejo de documentación ambiental según lo establece la Ley 161-2009 y otros reglamentos pertinentes.
@@ -1528,80 +1415,190 @@ La función específica de la División de Cumplimiento Ambiental es preparar y
 💡 *Información extraída del Reglamento de Emergencia JP-RP-41*"""
     
     # 🆕 NUEVA FUNCIONALIDAD: Detección automática de solicitudes de tablas
-    respuesta_tabla = detectar_y_generar_tabla_automatica(entrada)
+    respuesta_tabla = detectar_y_generar_tabla_automatica(consulta)
     if respuesta_tabla:
         return '\n\n'.join(respuesta_tabla)
     
     # Detectar preguntas sobre títulos de tomos
-    palabras_titulos = ["titulo", "títulos", "titulos", "nombre", "nombres", "llamar", "llama", "indices", "indice", "índice", "índices"]
-    palabras_tomos = ["tomo", "tomos", "11 tomos", "once tomos", "todos los tomos", "cada tomo"]
-    
-    busca_titulos = any(palabra in entrada_lower for palabra in palabras_titulos) and any(palabra in entrada_lower for palabra in palabras_tomos)
-    busca_listado = any(palabra in entrada_lower for palabra in ["dame", "dime", "muestra", "muéstra", "lista", "listado", "cuales", "cuáles"])
+    busca_titulos = consulta.tiene('titulos') and consulta.tiene('tomos')
+    busca_listado = consulta.tiene('listado')
     
     # Si pregunta específicamente por títulos o índice de tomos
-    if busca_titulos or (busca_listado and any(palabra in entrada_lower for palabra in palabras_tomos)):
+    if busca_titulos or (busca_listado and consulta.tiene('tomos')):
         return obtener_titulos_tomos()
     
-    # SISTEMA HÍBRIDO INTELIGENTE: Buscar en múltiples fuentes y combinar
-    fuentes_informacion = {}
-    
     # FUENTE PRIORITARIA: Tomo 10 - Conservación Histórica (para sitios históricos)
-    respuesta_sitios_historicos = buscar_en_tomo_10_sitios_historicos(entrada)
+    with metricas.medir('sitios_historicos'):
+        respuesta_sitios_historicos = buscar_en_tomo_10_sitios_historicos(consulta)
     if respuesta_sitios_historicos:
         return respuesta_sitios_historicos
     
+    # SISTEMA HÍBRIDO INTELIGENTE: según MODO_PIPELINE_LEGAL (medido por modo en /metrics)
+    metricas.incrementar('betaia_pipeline_legal_total', modo=MODO_PIPELINE_LEGAL)
+    with metricas.medir(f'pipeline_legal_{MODO_PIPELINE_LEGAL}'):
+        return PIPELINES_LEGALES[MODO_PIPELINE_LEGAL](consulta)
+
+def responder_con_extraccion(entrada):
+    """Pipeline 'extraccion': una llamada al modelo por fuente para extraer lo relevante y otra para sintetizar"""
+    fuentes_informacion = {}
+    
+    # Tareas independientes por fuente: se ejecutan en paralelo
+    tareas = {}
+    
     # FUENTE 1: Reglamento de emergencia JP-RP-41
     if reglamento_emergencia:
-        info_emergencia = buscar_informacion_relevante(entrada, reglamento_emergencia, "Reglamento de Emergencia JP-RP-41")
-        if info_emergencia:
-            fuentes_informacion["emergencia"] = info_emergencia
+        tareas["emergencia"] = (buscar_informacion_relevante, entrada, reglamento_emergencia, "Reglamento de Emergencia JP-RP-41")
     
     # FUENTE 2: Glosario (para términos técnicos)
-    respuesta_glosario = procesar_pregunta_glosario(entrada)
-    if respuesta_glosario:
-        fuentes_informacion["glosario"] = respuesta_glosario
+    tareas["glosario"] = (procesar_pregunta_glosario, entrada)
     
-    # FUENTE 3: Tomos relevantes (buscar los 2 más relevantes)
-    relevancia_tomos = []
-    for i in range(1, 12):
-        ruta = os.path.join("data", f"tomo_{i}.txt")
-        if os.path.exists(ruta):
-            score = evaluar_relevancia_tomo(entrada, ruta)
-            if score > 0:
-                relevancia_tomos.append((score, i, ruta))
+    # FUENTE 3: Tomos relevantes: los mejores pasajes de todos los tomos (TF-IDF), de los 2 tomos más relevantes.
+    # Con pasajes del texto oficial el resumen cede la mitad de los 8000 caracteres de cada extracción
+    with metricas.medir('relevancia_tomos'):
+        pasajes_tomos = indice_tomos.buscar_por_documento(entrada, max_documentos=2,
+                                                          max_chars=4000 if PASAJES_TEXTO_EXTRAIDO > 0 else 8000)
+    
+    tomos_consultados = []
+    for tomo_id, contenido in pasajes_tomos:
+        # Junto al resumen del tomo, los pasajes de su texto oficial que mejor responden la pregunta
+        texto_oficial = "\n\n".join(f"[{etiqueta}]\n{texto}" for etiqueta, texto in buscar_texto_extraido(entrada, tomos={tomo_id}))
+        if texto_oficial:
+            contenido = f"{contenido}\n\nTEXTO OFICIAL DEL TOMO {tomo_id}:\n{texto_oficial}"
+        tareas[f"tomo_{tomo_id}"] = (buscar_informacion_relevante, entrada, contenido, f"Tomo {tomo_id}")
+        tomos_consultados.append(tomo_id)
     
-    # Ordenar por relevancia y usar los 2 más relevantes
-    relevancia_tomos.sort(key=lambda x: x[0], reverse=True)
+    resultados = consultar_fuentes_en_paralelo(tareas)
+    
+    if resultados.get("emergencia"):
+        fuentes_informacion["emergencia"] = resultados["emergencia"]
+    
+    if resultados.get("glosario"):
+        fuentes_informacion["glosario"] = resultados["glosario"]
     
     info_tomos = []
-    for score, tomo_id, ruta in relevancia_tomos[:2]:  # Solo los 2 más relevantes
-        try:
-            with open(ruta, "r", encoding="utf-8") as f:
-                contenido = f.read()
-            
-            info_relevante = buscar_informacion_relevante(entrada, contenido, f"Tomo {tomo_id}")
-            if info_relevante:
-                info_tomos.append(f"**TOMO {tomo_id}:**\n{info_relevante}")
-        except Exception as e:
-            print(f"Error procesando tomo {tomo_id}: {e}")
+    for tomo_id in tomos_consultados:
+        info_relevante = resultados.get(f"tomo_{tomo_id}")
+        if info_relevante:
+            info_tomos.append(f"**TOMO {tomo_id}:**\n{info_relevante}")
     
     if info_tomos:
         fuentes_informacion["tomos"] = "\n\n".join(info_tomos)
     
     # GENERAR RESPUESTA INTELIGENTE COMBINANDO TODAS LAS FUENTES
     if fuentes_informacion:
-        return generar_respuesta_hibrida_inteligente(entrada, fuentes_informacion)
+        with metricas.medir('sintesis'):
+            return generar_respuesta_hibrida_inteligente(entrada, fuentes_informacion)
     
     # Si no encuentra información específica, respuesta inteligente genérica
     return generar_respuesta_generica_inteligente(entrada)
 
+def recuperar_fragmentos_legales(entrada):
+    """Pasajes de cada fuente elegidos localmente (BM25, glosario y TF-IDF de los tomos): [(etiqueta, texto)]"""
+    fragmentos = []
+    
+    # FUENTE 1: Reglamento de emergencia JP-RP-41
+    if reglamento_emergencia:
+        indice = obtener_indice_pasajes(reglamento_emergencia, "Reglamento de Emergencia JP-RP-41")
+        for i, pasaje in enumerate(indice.buscar(entrada, top_k=2, max_chars=6000), 1):
+            fragmentos.append((f"JP-RP-41 #{i}", pasaje))
+    
+    # FUENTE 2: Glosario (definiciones de los términos de la pregunta)
+    for termino in extraer_terminos_inteligente(entrada)[:3]:
+        definiciones = buscar_en_glosario(termino)
+        if definiciones:
+            fragmentos.append((f"Glosario: {termino}", "\n\n".join(definiciones)))
+    
+    # FUENTE 3: Mejores pasajes de los 2 tomos más relevantes
+    for tomo_id, contenido in indice_tomos.buscar_por_documento(entrada, max_documentos=2, max_chars=4000):
+        fragmentos.append((f"Tomo {tomo_id}", contenido))
+    
+    # FUENTE 4: Pasajes precisos del texto oficial de los tomos (del tomo citado, si lo hay)
+    tomo_citado = analizar_consulta(entrada).tomo
+    fragmentos.extend(buscar_texto_extraido(entrada, tomos={tomo_citado} if tomo_citado else None))
+    
+    return fragmentos
+
+def responder_con_recuperacion_directa(entrada):
+    """Pipeline 'directo': recuperación local de pasajes y una sola llamada al modelo que responde con ellos"""
+    with metricas.medir('recuperacion_local'):
+        fragmentos = recuperar_fragmentos_legales(entrada)
+    
+    if fragmentos:
+        with metricas.medir('sintesis'):
+            return generar_respuesta_legal_directa(entrada, fragmentos)
+    
+    return generar_respuesta_generica_inteligente(entrada)
+
+def generar_respuesta_legal_directa(pregunta, fragmentos):
+    """Responde en una sola llamada a partir de los pasajes recuperados, citando la etiqueta de cada fuente"""
+    try:
+        contexto = "\n\n".join(f"[{etiqueta}]\n{texto}" for etiqueta, texto in fragmentos)
+        
+        prompt_directo = f"""Eres Agente de Planificación, un asistente especializado altamente inteligente en leyes de planificación de Puerto Rico, similar a ChatGPT pero con conocimiento especializado.
+
+PREGUNTA DEL USUARIO: {pregunta}
+
+FRAGMENTOS DE LA DOCUMENTACIÓN (cada uno con la etiqueta de su fuente):
+
+{contexto}
+
+INSTRUCCIONES PARA RESPUESTA INTELIGENTE:
+1. Usa ÚNICAMENTE los fragmentos relevantes a la pregunta; ignora los que no apliquen
+2. Indica la fuente de cada dato con su etiqueta entre corchetes, por ejemplo [JP-RP-41 #1] o [Tomo 3]
+3. Proporciona una respuesta completa, clara y bien estructurada
+4. Prioriza el Reglamento de Emergencia JP-RP-41 por ser más actual
+5. Preserva números de artículos, secciones, etc.
+6. Explica conceptos técnicos de manera comprensible
+7. Mantén un tono profesional pero conversacional
+8. Si hay información conflictiva, explícalo claramente
+9. Sugiere próximos pasos o información adicional cuando sea útil
+10. Usa emojis apropiados para mejorar la legibilidad
+
+RESPUESTA ESPECIALIZADA:"""
+        
+        emitir_etapa("Sintetizando respuesta…")
+        respuesta_final = completar_chat_en_streaming(
+            model="gpt-4o",
+            messages=[
+                {"role": "system", "content": "Eres Agente de Planificación, un experto en leyes de planificación de Puerto Rico con estilo conversacional inteligente como ChatGPT. Proporciona respuestas expertas, claras y útiles, citando las fuentes."},
+                {"role": "user", "content": prompt_directo}
+            ],
+            temperature=0.4,
+            max_tokens=1500
+        )
+        
+        if respuesta_final and len(respuesta_final) > 50:
+            fuentes_utilizadas = []
+            for etiqueta, nombre in (("JP-RP-41", "Reglamento de Emergencia JP-RP-41"),
+                                     ("Glosario", "Glosario Oficial"),
+                                     ("Tomo", "Tomos de Referencia Histórica")):
+                if any(e.startswith(etiqueta) for e, _ in fragmentos):
+                    fuentes_utilizadas.append(nombre)
+            
+            respuesta_final += f"\n\n---\n📋 *Fuentes consultadas: {', '.join(fuentes_utilizadas)}*"
+            return respuesta_final
+        
+    except Exception as e:
+        print(f"Error generando respuesta directa: {e}")
+    
+    return generar_respuesta_generica_inteligente(pregunta)
+
+# Pipelines de preguntas legales seleccionables con MODO_PIPELINE_LEGAL
+PIPELINES_LEGALES = {
+    "extraccion": responder_con_extraccion,
+    "directo": responder_con_recuperacion_directa,
+}
+MODO_PIPELINE_LEGAL = os.getenv("MODO_PIPELINE_LEGAL", "extraccion")
+if MODO_PIPELINE_LEGAL not in PIPELINES_LEGALES:
+    print(f"⚠️ MODO_PIPELINE_LEGAL '{MODO_PIPELINE_LEGAL}' no reconocido, se usa 'extraccion'")
+    MODO_PIPELINE_LEGAL = "extraccion"
+print(f"✅ Pipeline de preguntas legales: {MODO_PIPELINE_LEGAL}")
+
 def buscar_informacion_relevante(pregunta, contenido, fuente):
     """Busca información relevante en un contenido usando IA"""
     try:
         # Caso especial para la División de Cumplimiento Ambiental
-        pregunta_lower = pregunta.lower()
-        if "división de cumplimiento ambiental" in pregunta_lower or "division de cumplimiento ambiental" in pregunta_lower:
+        if analizar_consulta(pregunta).tiene('division_ambiental'):
             return """La División de Evaluación de Cumplimiento Ambiental (DECA) de la OGPe es responsable de evaluar y tramitar todos los documentos ambientales presentados a la agencia. Cumple funciones administrativas y de manejo de documentación ambiental según lo establece la Ley 161-2009 y otros reglamentos pertinentes.
 
 La función específica de la División de Cumplimiento Ambiental es preparar y adoptar, junto con la Junta de Planificación, la Oficina de Gerencia de Permisos (OGPe) y las Entidades Gubernamentales Concernidas, un Reglamento Conjunto para establecer un sistema uniforme de adjudicación, procesos uniformes para la evaluación y expedición de determinaciones finales, permisos y recomendaciones relacionados a obras de construcción y uso de terrenos, guías de diseño verde, procedimientos de auditorías y querellas, y cualquier otro asunto referido a la Ley 161-2009."""
@@ -1609,38 +1606,31 @@ La función específica de la División de Cumplimiento Ambiental es preparar y
         # Fragmentar el contenido en chunks manejables
         max_chars = 8000
         if len(contenido) > max_chars:
-            # Buscar las secciones más relevantes
-            palabras_pregunta = pregunta.lower().split()
-            lineas = contenido.split('\n')
+            # Buscar los pasajes más relevantes en el índice BM25 del documento
+            indice = obtener_indice_pasajes(contenido, fuente)
+            pasajes = indice.buscar(pregunta, top_k=2, max_chars=max_chars)
             
-            secciones_relevantes = []
-            for i, linea in enumerate(lineas):
-                linea_lower = linea.lower()
-                relevancia = 0
-                
-                for palabra in palabras_pregunta:
-                    if len(palabra) > 3 and palabra in linea_lower:
-                        relevancia += 3
-                
-                if relevancia > 0:
-                    # Capturar contexto alrededor de la línea relevante
-                    inicio = max(0, i - 15)
-                    fin = min(len(lineas), i + 40)
-                    seccion = '\n'.join(lineas[inicio:fin])
-                    secciones_relevantes.append((relevancia, seccion))
-            
-            if secciones_relevantes:
-                # Ordenar por relevancia y combinar las mejores secciones
-                secciones_relevantes.sort(key=lambda x: x[0], reverse=True)
-                contenido_relevante = '\n\n---\n\n'.join([s[1] for s in secciones_relevantes[:2]])
+            if pasajes:
+                contenido_relevante = '\n\n---\n\n'.join(pasajes)
             else:
                 # Si no encuentra secciones específicas, usar el inicio del documento
                 contenido_relevante = contenido[:max_chars]
         else:
             contenido_relevante = contenido
         
-        # Usar IA para extraer información relevante
-        prompt_extraccion = f"""Analiza el siguiente contenido de {fuente} y extrae ÚNICAMENTE la información más relevante para la pregunta del usuario.
+        # Usar IA para extraer información relevante; las extracciones simultáneas de la misma
+        # fuente para la misma pregunta comparten una sola llamada
+        return vuelos_llm.ejecutar('extraccion', (fuente, normalizar_pregunta(pregunta)),
+                                   extraer_con_modelo, pregunta, contenido_relevante, fuente)
+        
+    except Exception as e:
+        print(f"Error extrayendo información de {fuente}: {e}")
+    
+    return None
+
+def extraer_con_modelo(pregunta, contenido_relevante, fuente):
+    """Llamada de extracción de buscar_informacion_relevante: el texto relevante o None"""
+    prompt_extraccion = f"""Analiza el siguiente contenido de {fuente} y extrae ÚNICAMENTE la información más relevante para la pregunta del usuario.
 
 PREGUNTA: {pregunta}
 
@@ -1655,25 +1645,21 @@ INSTRUCCIONES:
 5. Preserva números de artículos, secciones, etc.
 
 INFORMACIÓN RELEVANTE EXTRAÍDA:"""
-        
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": f"Eres un especialista en extraer información relevante de documentos legales. Enfócate en la precisión y relevancia."},
-                {"role": "user", "content": prompt_extraccion}
-            ],
-            temperature=0.1,
-            max_tokens=800
-        )
-        
-        contenido_extraido = response.choices[0].message.content.strip()
-        
-        if contenido_extraido and contenido_extraido != "NO_RELEVANTE" and len(contenido_extraido) > 50:
-            return contenido_extraido
-        
-    except Exception as e:
-        print(f"Error extrayendo información de {fuente}: {e}")
     
+    response = client.chat.completions.create(
+        model="gpt-4o",
+        messages=[
+            {"role": "system", "content": f"Eres un especialista en extraer información relevante de documentos legales. Enfócate en la precisión y relevancia."},
+            {"role": "user", "content": prompt_extraccion}
+        ],
+        temperature=0.1,
+        max_tokens=800
+    )
+    
+    contenido_extraido = response.choices[0].message.content.strip()
+    
+    if contenido_extraido and contenido_extraido != "NO_RELEVANTE" and len(contenido_extraido) > 50:
+        return contenido_extraido
     return None
 
 def generar_respuesta_hibrida_inteligente(pregunta, fuentes_informacion):
@@ -1712,7 +1698,8 @@ INSTRUCCIONES PARA RESPUESTA INTELIGENTE:
 
 RESPUESTA ESPECIALIZADA:"""
         
-        response = client.chat.completions.create(
+        emitir_etapa("Sintetizando respuesta…")
+        respuesta_final = completar_chat_en_streaming(
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "Eres Agente de Planificación, un experto en leyes de planificación de Puerto Rico con estilo conversacional inteligente como ChatGPT. Proporciona respuestas expertas, claras y útiles."},
@@ -1722,8 +1709,6 @@ RESPUESTA ESPECIALIZADA:"""
             max_tokens=1500   # Más espacio para respuestas completas
         )
         
-        respuesta_final = response.choices[0].message.content.strip()
-        
         if respuesta_final and len(respuesta_final) > 50:
             # Agregar información sobre las fuentes utilizadas
             fuentes_utilizadas = []
@@ -1958,102 +1943,283 @@ def debug():
     </style>
     """
 
-@app.route('/static/<path:filename>')
-def custom_static(filename):
-    """Servir archivos estáticos con headers específicos para evitar cache"""
-    response = send_from_directory('static', filename)
-    response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-    response.headers['Pragma'] = 'no-cache'
-    response.headers['Expires'] = '0'
+@app.route('/assets/<path:ruta>')
+def recurso_versionado(ruta):
+    """Recurso con huella: caché inmutable, variante precomprimida según Accept-Encoding y ETag/304"""
+    variante = recursos_estaticos.variante(ruta, request.accept_encodings)
+    if variante is None:
+        return jsonify({'error': 'Recurso no encontrado'}), 404
+    archivo, codificacion, etag, mimetype = variante
+
+    response = send_file(archivo, mimetype=mimetype, etag=etag, conditional=True, max_age=31536000)
+    response.headers['Cache-Control'] = CACHE_RECURSOS_VERSIONADOS
+    response.headers['Vary'] = 'Accept-Encoding'
+    if codificacion:
+        response.headers['Content-Encoding'] = codificacion
     return response
 
+def validar_solicitud_chat():
+    """Valida beta y mensaje; devuelve (mensaje, None) o (None, respuesta_error)"""
+    # Verificar si la beta está activa antes de procesar el chat
+    beta_activa, _ = verificar_beta_activa()
+    if not beta_activa:
+        return None, (jsonify({
+            'error': 'La versión beta ha expirado',
+            'message': f'Esta versión beta expiró el {formatear_fecha_espanol(FECHA_EXPIRACION_BETA)}. Contacta al administrador para obtener la versión completa.'
+        }), 403)
+        
+    data = request.get_json(silent=True) or {}
+    mensaje = data.get('message', '').strip()
+    
+    if not mensaje:
+        return None, (jsonify({'error': 'Mensaje vacío'}), 400)
+    
+    return mensaje, None
+
+# Las respuestas de recursos (tablas de cabida, flujogramas, índices) son iguales para todos
+# los usuarios: llevan una ETag fuerte (versión del registro de recursos + huella del
+# contenido) y el cliente las revalida con If-None-Match. Cada worker recuerda la ETag de
+# las últimas preguntas para contestar 304 sin volver a construir la respuesta
+PREFIJO_TIPO_RECURSO = 'recurso-'
+TIPOS_RESPUESTA_RECURSO = {'mini-especialista-tablas'}
+MAX_ETAGS_CHAT = int(os.getenv("MAX_ETAGS_CHAT", "2048"))
+# Los cuerpos JSON de /chat desde este tamaño se envían comprimidos (br/gzip); 0 lo desactiva
+COMPRESION_MIN_BYTES_CHAT = int(os.getenv("COMPRESION_MIN_BYTES_CHAT", "1024"))
+etags_chat = OrderedDict()
+lock_etags_chat = threading.Lock()
+
+def etag_respuesta_recurso(cuerpo):
+    """ETag fuerte de una respuesta de recurso, o None si la respuesta no es de recurso"""
+    tipo = cuerpo.get('type', '')
+    if not (tipo.startswith(PREFIJO_TIPO_RECURSO) or tipo in TIPOS_RESPUESTA_RECURSO):
+        return None
+    huella = hashlib.sha256(f"{tipo}\0{cuerpo.get('response', '')}".encode('utf-8')).hexdigest()[:16]
+    return f"{registro_recursos.version()}-{huella}"
+
+def recordar_etag_chat(mensaje, etag):
+    clave = normalizar_pregunta(mensaje)
+    with lock_etags_chat:
+        etags_chat[clave] = etag
+        etags_chat.move_to_end(clave)
+        while len(etags_chat) > MAX_ETAGS_CHAT:
+            etags_chat.popitem(last=False)
+
+def etag_vigente_cliente(mensaje):
+    """ETag recordada para el mensaje si el cliente ya la tiene y el registro no cambió, o None"""
+    if not request.if_none_match:
+        return None
+    with lock_etags_chat:
+        etag = etags_chat.get(normalizar_pregunta(mensaje))
+    if etag is None or not etag.startswith(f"{registro_recursos.version()}-"):
+        return None
+    return etag if cliente_tiene_etag(etag) else None
+
+def cliente_tiene_etag(etag):
+    """If-None-Match nombra la ETag (sin comprimir o en cualquiera de sus variantes comprimidas)"""
+    return any(request.if_none_match.contains(variante)
+               for variante in (etag, f"{etag}-br", f"{etag}-gzip"))
+
+def respuesta_no_modificada(etag, momento):
+    metricas.incrementar('betaia_chat_no_modificadas_total', momento=momento)
+    respuesta = Response(status=304)
+    respuesta.set_etag(etag)
+    respuesta.headers['Vary'] = 'Accept-Encoding'
+    return respuesta
+
+def cuerpo_saturado():
+    """Respuesta de /chat cuando el modelo no tiene cupo para una pregunta nueva"""
+    return {
+        'error': 'Servicio ocupado',
+        'response': (f"⏳ En este momento hay muchas consultas en proceso. Por favor, intenta de nuevo "
+                     f"en {REINTENTAR_SATURADO_SEGUNDOS} segundos."),
+        'type': 'saturado',
+        'retry_after': REINTENTAR_SATURADO_SEGUNDOS
+    }
+
+@app.after_request
+def comprimir_respuesta_chat(respuesta):
+    """Comprime los cuerpos JSON de /chat desde COMPRESION_MIN_BYTES_CHAT según Accept-Encoding"""
+    if (request.endpoint != 'chat' or not COMPRESION_MIN_BYTES_CHAT or respuesta.status_code != 200
+            or respuesta.direct_passthrough or respuesta.mimetype != 'application/json'
+            or 'Content-Encoding' in respuesta.headers):
+        return respuesta
+    respuesta.headers.add('Vary', 'Accept-Encoding')
+    datos = respuesta.get_data()
+    codificacion = elegir_codificacion(request.accept_encodings)
+    if codificacion is None or len(datos) < COMPRESION_MIN_BYTES_CHAT:
+        return respuesta
+
+    with metricas.medir('compresion_chat'):
+        comprimido = comprimir(datos, codificacion)
+    respuesta.set_data(comprimido)
+    respuesta.headers['Content-Encoding'] = codificacion
+    # Cada codificación es otra representación: su ETag fuerte no puede ser la misma
+    etag, debil = respuesta.get_etag()
+    if etag and not debil:
+        respuesta.set_etag(f"{etag}-{codificacion}")
+    metricas.incrementar('betaia_chat_comprimidas_total', codificacion=codificacion)
+    metricas.incrementar('betaia_chat_bytes_ahorrados_total', len(datos) - len(comprimido))
+    return respuesta
+
 @app.route('/chat', methods=['POST'])
 def chat():
     """Endpoint para procesar mensajes del chat con IA híbrida inteligente
     REFORZADO: Mejorado para priorizar las consultas específicas sobre tablas de cabida"""
+    # Los clientes que aceptan eventos reciben la respuesta en streaming
+    if 'text/event-stream' in request.headers.get('Accept', ''):
+        return chat_stream()
+    
+    mensaje, error = validar_solicitud_chat()
+    if error:
+        return error
+    
+    # El cliente ya tiene la respuesta de recurso de esta pregunta: 304 sin construirla
+    etag = etag_vigente_cliente(mensaje)
+    if etag:
+        return respuesta_no_modificada(etag, 'antes')
+    
+    conversation_id = get_conversation_id()
+    with llm.gobernador.peticion(conversation_id) as turno, metricas.peticion('/chat') as tiempos:
+        cuerpo = responder_mensaje(mensaje, conversation_id)
+    if turno.rechazada or cuerpo.get('type') == 'saturado':
+        respuesta = jsonify(cuerpo_saturado())
+        respuesta.headers['Retry-After'] = str(REINTENTAR_SATURADO_SEGUNDOS)
+        return respuesta, 429
+    etag = etag_respuesta_recurso(cuerpo)
+    if etag:
+        recordar_etag_chat(mensaje, etag)
+        if cliente_tiene_etag(etag):
+            return respuesta_no_modificada(etag, 'despues')
+    respuesta = jsonify(cuerpo)
+    if etag:
+        respuesta.set_etag(etag)
+    respuesta.headers['Server-Timing'] = tiempos.server_timing()
+    return respuesta
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Variante en streaming de /chat (Server-Sent Events)
+    
+    Emite eventos 'etapa' con el progreso del pipeline, 'token' con el texto
+    de la síntesis a medida que llega y 'fin' con la misma respuesta que /chat."""
+    mensaje, error = validar_solicitud_chat()
+    if error:
+        return error
+    
+    etag = etag_vigente_cliente(mensaje)
+    if etag:
+        return respuesta_no_modificada(etag, 'antes')
+    
+    conversation_id = get_conversation_id()
+    cola = queue.Queue()
+    
+    def procesar():
+        canal_eventos.cola = cola
+        try:
+            with llm.gobernador.peticion(conversation_id) as turno, metricas.peticion('/chat/stream'):
+                cuerpo = responder_mensaje(mensaje, conversation_id)
+            if turno.rechazada or cuerpo.get('type') == 'saturado':
+                cola.put(('fin', cuerpo_saturado()))
+                return
+            # El evento 'fin' lleva la ETag para que el cliente revalide la próxima vez
+            etag = etag_respuesta_recurso(cuerpo)
+            if etag:
+                recordar_etag_chat(mensaje, etag)
+                cuerpo = dict(cuerpo, etag=etag)
+            cola.put(('fin', cuerpo))
+        finally:
+            canal_eventos.cola = None
+            cola.put(None)
+    
+    threading.Thread(target=procesar, daemon=True).start()
+    
+    def generar_eventos():
+        while True:
+            try:
+                evento = cola.get(timeout=15)
+            except queue.Empty:
+                # Comentario SSE para mantener viva la conexión
+                yield ": ping\n\n"
+                continue
+            if evento is None:
+                break
+            tipo, datos = evento
+            yield f"event: {tipo}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+    
+    return Response(stream_with_context(generar_eventos()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def responder_mensaje(mensaje, conversation_id):
+    """Procesa un mensaje del chat y devuelve el cuerpo de la respuesta (dict)"""
+    inicializar_conversacion(conversation_id)
+    
+    # Análisis único del mensaje: minúsculas, tomo y grupos de palabras clave
+    consulta = analizar_consulta(mensaje)
+    
     try:
-        # Verificar si la beta está activa antes de procesar el chat
-        beta_activa, _ = verificar_beta_activa()
-        if not beta_activa:
-            return jsonify({
-                'error': 'La versión beta ha expirado',
-                'message': f'Esta versión beta expiró el {formatear_fecha_espanol(FECHA_EXPIRACION_BETA)}. Contacta al administrador para obtener la versión completa.'
-            }), 403
-            
-        data = request.get_json()
-        mensaje = data.get('message', '').strip()
-        
-        if not mensaje:
-            return jsonify({'error': 'Mensaje vacío'}), 400
-        
-        conversation_id = get_conversation_id()
-        inicializar_conversacion(conversation_id)
-        
         # Log para depuración
         print(f"📩 Recibida consulta: '{mensaje}'")
-        
-        # Detección de preguntas legales mejorada
-        entrada_lower = mensaje.lower()
 
         # Respuestas sobre estructura del documento
-        if "cuantos tomos" in entrada_lower or "cuántos tomos" in entrada_lower:
+        if consulta.tiene('cuantos_tomos'):
             respuesta = "� **NORMATIVA LEGAL DE PLANIFICACIÓN DE PUERTO RICO:**\n\n**FUENTE PRINCIPAL Y VIGENTE:**\n- 📋 **Reglamento de Emergencia JP-RP-41 (2025)** - Normativa actualizada\n- � **Glosario Oficial** - Definiciones especializadas\n\n**REFERENCIAS HISTÓRICAS (NO VIGENTES):**\n- � **regulaciones anteriores DEROGADAS** - Solo para contexto histórico\n\n⚠️ **IMPORTANTE:** Toda consulta legal se basa en el **Reglamento de Emergencia JP-RP-41**, que es la normativa vigente."
-            return jsonify({
+            return {
                 'response': respuesta,
                 'type': 'info'
-            })
+            }
             
         # Respuestas sobre División de Cumplimiento Ambiental
-        if "división de cumplimiento ambiental" in entrada_lower or "division de cumplimiento ambiental" in entrada_lower:
+        if consulta.tiene('division_ambiental'):
             respuesta = f"🚨 **REGLAMENTO DE EMERGENCIA JP-RP-41**:\n\n{info_division_ambiental}\n\n---\n💡 *Información extraída del Reglamento de Emergencia JP-RP-41*"
-            return jsonify({
+            return {
                 'response': respuesta,
                 'type': 'legal-emergencia',
                 'conversation_id': conversation_id
-            })
+            }
 
         # --- PRIORIDAD 0: Mini-Especialistas para casos ultra-específicos ---
         print("🔍 Verificando mini-especialistas...")
-        resultado_especialista = procesar_con_mini_especialistas(mensaje)
+        emitir_etapa("Analizando la consulta…")
+        resultado_especialista = respuesta_en_cache('especialistas', consulta)
+        if resultado_especialista:
+            print(f"⚡ Respuesta de mini-especialista desde caché: {resultado_especialista['tipo']}")
+        else:
+            fallos_llm, inicio = llm.fallos_actuales(), time.perf_counter()
+            with metricas.medir('mini_especialistas'):
+                resultado_especialista = procesar_con_mini_especialistas(consulta)
+            if resultado_especialista.get('usar_especialista', False):
+                guardar_en_cache('especialistas', consulta, resultado_especialista, fallos_llm, inicio)
         
         if resultado_especialista.get('usar_especialista', False):
             print(f"✨ Mini-especialista activado: {resultado_especialista['tipo']}")
-            return jsonify({
+            return {
                 'response': resultado_especialista['respuesta'],
                 'type': resultado_especialista['tipo'],
                 'conversation_id': conversation_id
-            })
+            }
 
         # --- PRIORIDAD 1: Detectar si es consulta estructurada (índice, tabla, flujograma, resoluciones) ---
-        tipo_consulta = detectar_consulta_especifica(mensaje)
+        with metricas.medir('detectar_consulta_especifica'):
+            tipo_consulta = detectar_consulta_especifica(consulta)
         if tipo_consulta:
             print(f"📊 Procesando consulta específica tipo: {tipo_consulta['tipo']}")
-            respuesta = procesar_consulta_especifica(mensaje, tipo_consulta)
+            with metricas.medir('consulta_especifica'):
+                respuesta = procesar_consulta_especifica(consulta, tipo_consulta)
             if respuesta:
                 tipo_respuesta = f"recurso-{tipo_consulta['tipo']}"
                 print(f"✅ Respuesta generada correctamente como {tipo_respuesta}")
-                return jsonify({
+                return {
                     'response': respuesta,
                     'type': tipo_respuesta,
                     'conversation_id': conversation_id
-                })
+                }
             print("⚠️ La función procesar_consulta_especifica no devolvió respuesta")
         
         # PRIORIDAD 2: Comprobar explícitamente si es sobre tabla de cabida
         # Este bloque añade una capa extra de seguridad para consultas de tablas
-        if 'tabla' in entrada_lower and 'cabida' in entrada_lower:
+        if consulta.tiene('tabla') and consulta.tiene('cabida'):
             print("🔍 Detección secundaria: consulta sobre tabla de cabida")
-            # Extraer tomo mediante regex más flexible
-            import re
-            tomo_match = re.search(r'tomo\s*(\d+)|del\s+tomo\s*(\d+)', entrada_lower)
-            
-            # Obtener el tomo de cualquier grupo capturado
-            tomo = None
-            if tomo_match:
-                for grupo in tomo_match.groups():
-                    if grupo is not None:
-                        tomo = int(grupo)
-                        break
+            tomo = consulta.tomo
             
             # Intentar procesar como tabla de cabida
             resultados = buscar_tabla_cabida(tomo)
@@ -2067,43 +2233,49 @@ def chat():
                 respuesta += "<br>---<br>💡 <i>Información extraída de las tablas de cabida por tomo</i>"
                 
                 print(f"✅ Respuesta de respaldo generada para tabla de cabida (tomo: {tomo})")
-                return jsonify({
+                return {
                     'response': respuesta,
                     'type': 'recurso-tabla_cabida',
                     'conversation_id': conversation_id
-                })
+                }
         
-        # SISTEMA HÍBRIDO INTELIGENTE: Detectar si es pregunta legal
-        es_legal = any(palabra.lower() in entrada_lower for palabra in palabras_legales)
-        if not es_legal and "tomo" in entrada_lower:
-            es_legal = True
+        # SISTEMA HÍBRIDO INTELIGENTE: Detectar si es pregunta legal (las palabras legales incluyen 'tomo')
+        es_legal = consulta.tiene('legal')
         
         # Palabras que indican consultas específicas
-        palabras_consulta_especifica = ['índice', 'indice', 'flujograma', 'tabla', 'cabida', 'resolución', 'lista']
-        es_consulta_especifica = any(palabra in entrada_lower for palabra in palabras_consulta_especifica)
+        es_consulta_especifica = consulta.tiene('consulta_especifica')
         
         if es_legal or es_consulta_especifica:
-            # PROCESAR CON SISTEMA HÍBRIDO INTELIGENTE
-            print("📚 Procesando con sistema híbrido inteligente")
-            respuesta = procesar_pregunta_legal(mensaje)
-            
-            # Determinar tipo de respuesta basado en el contenido
-            if "🚨" in respuesta and "Reglamento de Emergencia" in respuesta:
-                tipo_respuesta = 'legal-emergencia'
-            elif "📚" in respuesta and "Glosario" in respuesta:
-                tipo_respuesta = 'legal-glosario'
-            elif "📋" in respuesta and "Fuentes consultadas" in respuesta:
-                tipo_respuesta = 'legal-hibrido'
+            # Respuesta preparada para la misma pregunta legal (sin llamar al modelo)
+            respuesta_preparada = buscar_respuesta_preparada(consulta)
+            if respuesta_preparada:
+                respuesta, tipo_respuesta = respuesta_preparada
             else:
-                tipo_respuesta = 'legal-general'
+                # PROCESAR CON SISTEMA HÍBRIDO INTELIGENTE
+                print("📚 Procesando con sistema híbrido inteligente")
+                respuesta = respuesta_en_cache(f'legal_{MODO_PIPELINE_LEGAL}', consulta)
+                if respuesta:
+                    print("⚡ Respuesta legal desde caché")
+                else:
+                    emitir_etapa("Buscando en el Reglamento, el glosario y los tomos…")
+                    # Si la misma pregunta ya se está respondiendo, se espera esa respuesta
+                    respuesta = vuelos_llm.ejecutar(f'legal_{MODO_PIPELINE_LEGAL}', normalizar_pregunta(consulta),
+                                                    responder_pregunta_legal, consulta)
+                
+                # Determinar tipo de respuesta basado en el contenido
+                if "🚨" in respuesta and "Reglamento de Emergencia" in respuesta:
+                    tipo_respuesta = 'legal-emergencia'
+                elif "📚" in respuesta and "Glosario" in respuesta:
+                    tipo_respuesta = 'legal-glosario'
+                elif "📋" in respuesta and "Fuentes consultadas" in respuesta:
+                    tipo_respuesta = 'legal-hibrido'
+                else:
+                    tipo_respuesta = 'legal-general'
                 
         else:
             # PREGUNTA GENERAL: Mejorar con contexto inteligente
-            mensajes_conversacion = conversaciones[conversation_id]
-            
             # Verificar si la pregunta podría beneficiarse de contexto legal
-            palabras_contexto_legal = ['puerto rico', 'pr', 'planificación', 'planificacion', 'ley', 'legal', 'gobierno']
-            necesita_contexto = any(palabra in entrada_lower for palabra in palabras_contexto_legal)
+            necesita_contexto = consulta.tiene('contexto_legal')
             
             if necesita_contexto:
                 # Agregar contexto sobre especialización
@@ -2111,19 +2283,24 @@ def chat():
 Si la pregunta está relacionada con planificación, permisos, construcción o temas legales de Puerto Rico, puedo proporcionar información muy específica."""
                 
                 mensaje_con_contexto = f"{mensaje}\n\n[CONTEXTO INTERNO: {contexto_especializado}]"
-                mensajes_conversacion.append({"role": "user", "content": mensaje_con_contexto})
+                mensaje_usuario = {"role": "user", "content": mensaje_con_contexto}
             else:
-                mensajes_conversacion.append({"role": "user", "content": mensaje})
+                mensaje_usuario = {"role": "user", "content": mensaje}
             
-            # Generar respuesta con IA más inteligente
-            respuesta_openai = client.chat.completions.create(
-                model="gpt-4o",
-                messages=mensajes_conversacion,
-                temperature=0.3,  # Un poco más creativo para conversaciones generales
-                max_tokens=800
-            )
-            respuesta = respuesta_openai.choices[0].message.content.strip()
-            mensajes_conversacion.append({"role": "assistant", "content": respuesta})
+            # El lock de la sesión evita que dos peticiones intercalen sus mensajes
+            with conversaciones.bloqueo(conversation_id):
+                mensajes_conversacion = conversaciones.mensajes(conversation_id) + [mensaje_usuario]
+                
+                # Generar respuesta con IA más inteligente
+                emitir_etapa("Generando respuesta…")
+                with metricas.medir('conversacion_general'):
+                    respuesta = completar_chat_en_streaming(
+                        model="gpt-4o",
+                        messages=mensajes_conversacion,
+                        temperature=0.3,  # Un poco más creativo para conversaciones generales
+                        max_tokens=800
+                    )
+                conversaciones.agregar(conversation_id, mensaje_usuario, {"role": "assistant", "content": respuesta})
             tipo_respuesta = 'general-inteligente'
         
         # Mejorar respuesta si es muy corta o genérica
@@ -2131,37 +2308,40 @@ Si la pregunta está relacionada con planificación, permisos, construcción o t
             respuesta += "\n\n💡 **¿Necesitas más información específica?** Puedes preguntar sobre:\n- Definiciones de términos técnicos\n- Procedimientos específicos\n- Requisitos para permisos\n- Comparaciones entre conceptos"
         
         # Guardar en log con más información
-        with open("log.txt", "a", encoding="utf-8") as log:
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            log.write(f"[{timestamp}] Tipo: {tipo_respuesta}\nPregunta: {mensaje}\nRespuesta: {respuesta}\n---\n")
+        bitacora.registrar('chat', respuesta=respuesta, tipo=tipo_respuesta, pregunta=mensaje,
+                           conversation_id=conversation_id)
         
-        return jsonify({
+        return {
             'response': respuesta,
             'type': tipo_respuesta,
             'conversation_id': conversation_id
-        })
+        }
         
+    except LLMSaturado as e:
+        # /chat convierte el rechazo en 429; no es un error de la aplicación
+        print(f"⏳ Consulta rechazada por saturación del modelo: {e}")
+        return dict(cuerpo_saturado(), conversation_id=conversation_id)
+    
     except Exception as e:
         print(f"Error en chat: {str(e)}")
         import traceback
         traceback.print_exc()
         
         # Guardar error en log para diagnóstico
-        with open("error_log.txt", "a", encoding="utf-8") as error_file:
-            error_file.write(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Error: {str(e)}\n")
-            error_file.write(traceback.format_exc() + "\n\n")
+        bitacora.registrar('error', error=str(e), traceback=traceback.format_exc(), pregunta=mensaje,
+                           conversation_id=conversation_id)
         
         # Intentar responder a la pregunta sobre división de cumplimiento ambiental
-        if "división de cumplimiento ambiental" in entrada_lower or "division de cumplimiento ambiental" in entrada_lower:
+        if consulta.tiene('division_ambiental'):
             respuesta_especifica = """La División de Evaluación de Cumplimiento Ambiental (DECA) de la OGPe es responsable de evaluar y tramitar todos los documentos ambientales presentados a la agencia. Cumple funciones administrativas y de manejo de documentación ambiental según lo establece la Ley 161-2009 y otros reglamentos pertinentes.
 
 La función específica de la División de Cumplimiento Ambiental es preparar y adoptar, junto con la Junta de Planificación, la Oficina de Gerencia de Permisos (OGPe) y las Entidades Gubernamentales Concernidas, un Reglamento Conjunto para establecer un sistema uniforme de adjudicación, procesos uniformes para la evaluación y expedición de determinaciones finales, permisos y recomendaciones relacionados a obras de construcción y uso de terrenos, guías de diseño verde, procedimientos de auditorías y querellas, y cualquier otro asunto referido a la Ley 161-2009."""
             
-            return jsonify({
+            return {
                 'response': respuesta_especifica,
                 'type': 'legal-emergencia',
-                'conversation_id': get_conversation_id()
-            })
+                'conversation_id': conversation_id
+            }
         
         # Respuesta de error más amigable
         error_respuesta = """🔧 **Se produjo un error técnico**
@@ -2176,32 +2356,51 @@ Lo siento, hubo un problema procesando tu consulta.
 ---
 💡 *Estaré aquí para ayudarte cuando estés listo*"""
         
-        return jsonify({
+        return {
             'response': error_respuesta,
             'type': 'error-amigable'
-        }), 200  # 200 para mostrar el mensaje amigable
+        }
 
 @app.route('/nueva-conversacion', methods=['POST'])
 def nueva_conversacion():
     """Endpoint para iniciar una nueva conversación"""
     if 'conversation_id' in session:
+        # Liberar también el historial guardado en memoria
+        conversaciones.eliminar(session['conversation_id'])
         del session['conversation_id']
     return jsonify({'success': True})
 
 @app.route('/health')
 def health():
     """Endpoint de salud para verificar que la aplicación está funcionando"""
-    return jsonify({'status': 'ok', 'service': 'Agente de planificación Web'})
+    return jsonify({
+        'status': 'ok',
+        'service': 'Agente de planificación Web',
+        'conversaciones': conversaciones.estadisticas(),
+        'recursos': registro_recursos.estadisticas(),
+        'tablas': motor_tablas.estadisticas(),
+        'corpus': corpus.estadisticas(),
+        'cache_respuestas': cache_respuestas.estadisticas(),
+        'respuestas_preparadas': indice_respuestas.estadisticas(),
+        'texto_extraido': indice_texto_extraido.estadisticas(),
+        'recursos_estaticos': recursos_estaticos.estadisticas(),
+        'llm': llm.gobernador.estadisticas(),
+        'vuelo_unico': vuelos_llm.estadisticas(),
+        'bitacora': bitacora.estadisticas()
+    })
+
+@app.route('/metrics')
+def metrics():
+    """Métricas de latencia por etapa, llamadas al modelo y cachés (formato Prometheus)"""
+    return Response(metricas.texto_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 @app.route('/favicon.ico')
 def favicon():
     """Servir favicon"""
-    return send_from_directory('static', 'favicon.ico', mimetype='image/vnd.microsoft.icon')
+    return send_from_directory('static', 'favicon.ico', mimetype='image/vnd.microsoft.icon', max_age=86400)
 
 if __name__ == '__main__':
     import webbrowser
-    import threading
-    import time
     
     # Función para abrir el navegador después de un pequeño delay
     def open_browser():
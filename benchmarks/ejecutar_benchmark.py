@@ -0,0 +1,299 @@
+"""
+Benchmark de extremo a extremo de /chat
+Arranca el servidor OpenAI falso y la aplicación apuntando a él
+(OPENAI_BASE_URL), recorre el corpus de preguntas representativas y
+guarda los resultados en JSON para comparar entre versiones:
+
+- latencia p50/p95/p99 por categoría de pregunta y nivel de concurrencia
+- rendimiento (peticiones/s) con N clientes concurrentes
+- llamadas al modelo por petición, por categoría
+
+Uso:
+    python benchmarks/ejecutar_benchmark.py --concurrencia 1 4 16 --duracion 30
+    python benchmarks/ejecutar_benchmark.py --servidor gunicorn --comparar benchmarks/resultados/anterior.json
+    python benchmarks/ejecutar_benchmark.py --url http://127.0.0.1:5001   # aplicación ya en marcha
+    python benchmarks/ejecutar_benchmark.py --pipeline-legal directo --comparar benchmarks/resultados/extraccion.json
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+
+DIRECTORIO_BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+DIRECTORIO_APP = os.path.dirname(DIRECTORIO_BENCHMARKS)
+sys.path.insert(0, DIRECTORIO_BENCHMARKS)
+
+from servidor_openai_falso import agregar_argumentos_latencia, configuracion_desde_argumentos, iniciar_servidor
+
+
+def percentil(valores, p):
+    """Percentil por rango más cercano de una lista ya ordenada"""
+    if not valores:
+        return None
+    indice = max(0, min(len(valores) - 1, int(round(p / 100 * len(valores) + 0.5)) - 1))
+    return valores[indice]
+
+
+def resumir_latencias(latencias):
+    ordenadas = sorted(latencias)
+    return {
+        'peticiones': len(ordenadas),
+        'p50_ms': round(percentil(ordenadas, 50) * 1000, 1) if ordenadas else None,
+        'p95_ms': round(percentil(ordenadas, 95) * 1000, 1) if ordenadas else None,
+        'p99_ms': round(percentil(ordenadas, 99) * 1000, 1) if ordenadas else None,
+        'media_ms': round(sum(ordenadas) / len(ordenadas) * 1000, 1) if ordenadas else None,
+    }
+
+
+class ClienteChat:
+    """Cliente HTTP con su propia cookie de sesión (una conversación por cliente)"""
+
+    def __init__(self, url_base, tiempo_limite=120):
+        self.url_base = url_base.rstrip('/')
+        self.tiempo_limite = tiempo_limite
+        self.abridor = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def preguntar(self, mensaje):
+        """Devuelve (segundos, estado HTTP, tipo de respuesta)"""
+        datos = json.dumps({'message': mensaje}).encode('utf-8')
+        peticion = urllib.request.Request(f"{self.url_base}/chat", data=datos,
+                                          headers={'Content-Type': 'application/json'})
+        inicio = time.perf_counter()
+        try:
+            with self.abridor.open(peticion, timeout=self.tiempo_limite) as respuesta:
+                cuerpo = json.loads(respuesta.read())
+                return time.perf_counter() - inicio, respuesta.status, cuerpo.get('type')
+        except urllib.error.HTTPError as e:
+            return time.perf_counter() - inicio, e.code, None
+        except OSError:
+            return time.perf_counter() - inicio, 0, None
+
+
+def obtener_json(url, metodo='GET'):
+    peticion = urllib.request.Request(url, data=b'' if metodo == 'POST' else None, method=metodo)
+    with urllib.request.urlopen(peticion, timeout=10) as respuesta:
+        return json.loads(respuesta.read())
+
+
+def lanzar_aplicacion(modo, puerto, url_openai, directorio_instancia, workers, pipeline_legal):
+    """Arranca la aplicación como subproceso apuntando al servidor OpenAI falso"""
+    entorno = dict(os.environ,
+                   OPENAI_BASE_URL=url_openai,
+                   MODO_PIPELINE_LEGAL=pipeline_legal,
+                   OPENAI_API_KEY='falsa',
+                   FECHA_EXPIRACION_BETA='2099-12-31',
+                   DIRECTORIO_INSTANCIA=directorio_instancia,
+                   PYTHONUNBUFFERED='1')
+    if modo == 'gunicorn':
+        comando = ['gunicorn', '--workers', str(workers), '--threads', '8', '--timeout', '120',
+                   '--bind', f'127.0.0.1:{puerto}', 'app:app']
+    else:
+        comando = [sys.executable, '-c',
+                   f"from app import app; app.run(host='127.0.0.1', port={puerto}, threaded=True)"]
+    proceso = subprocess.Popen(comando, cwd=DIRECTORIO_APP, env=entorno,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    url = f"http://127.0.0.1:{puerto}"
+    limite = time.monotonic() + 60
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError(f"La aplicación terminó al arrancar:\n{proceso.stderr.read().decode(errors='replace')[-2000:]}")
+        try:
+            obtener_json(f"{url}/health")
+            return proceso, url
+        except OSError:
+            time.sleep(0.3)
+    proceso.terminate()
+    raise RuntimeError("La aplicación no respondió a /health en 60 s")
+
+
+def medir_llamadas_por_peticion(url_app, url_estadisticas, corpus):
+    """Pasada secuencial: llamadas al modelo y latencia en frío de cada pregunta"""
+    cliente = ClienteChat(url_app)
+    por_categoria = {}
+    for categoria, preguntas in corpus.items():
+        llamadas, tipos = [], {}
+        for pregunta in preguntas:
+            antes = obtener_json(url_estadisticas)['llamadas']
+            _, estado, tipo = cliente.preguntar(pregunta)
+            llamadas.append(obtener_json(url_estadisticas)['llamadas'] - antes)
+            tipos[tipo or f'http_{estado}'] = tipos.get(tipo or f'http_{estado}', 0) + 1
+        por_categoria[categoria] = {
+            'llamadas_llm_por_peticion': round(sum(llamadas) / len(llamadas), 2),
+            'llamadas_llm_max': max(llamadas),
+            'tipos_respuesta': tipos,
+        }
+    return por_categoria
+
+
+def ejecutar_carga(url_app, corpus, clientes, duracion, semilla):
+    """N clientes concurrentes preguntan sin pausa durante `duracion` segundos"""
+    trabajos = [(categoria, pregunta) for categoria, preguntas in corpus.items() for pregunta in preguntas]
+    resultados = []
+    lock = threading.Lock()
+    fin = time.monotonic() + duracion
+
+    def cliente_trabajo(numero):
+        aleatorio = random.Random(semilla + numero)
+        cliente = ClienteChat(url_app)
+        propios = []
+        while time.monotonic() < fin:
+            categoria, pregunta = aleatorio.choice(trabajos)
+            segundos, estado, _ = cliente.preguntar(pregunta)
+            propios.append((categoria, segundos, estado))
+        with lock:
+            resultados.extend(propios)
+
+    inicio = time.monotonic()
+    hilos = [threading.Thread(target=cliente_trabajo, args=(n,)) for n in range(clientes)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    transcurrido = time.monotonic() - inicio
+
+    correctas = [r for r in resultados if r[2] == 200]
+    por_categoria = {}
+    for categoria in corpus:
+        latencias = [segundos for cat, segundos, estado in correctas if cat == categoria]
+        por_categoria[categoria] = resumir_latencias(latencias)
+    return {
+        'clientes': clientes,
+        'duracion_s': round(transcurrido, 2),
+        'peticiones': len(resultados),
+        'errores': len(resultados) - len(correctas),
+        'rendimiento_rps': round(len(correctas) / transcurrido, 2),
+        'global': resumir_latencias([r[1] for r in correctas]),
+        'por_categoria': por_categoria,
+    }
+
+
+def version_git():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=DIRECTORIO_APP,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(actual, anterior):
+    """Imprime la variación de p50/p95 y rendimiento respecto a un resultado anterior"""
+    print(f"\n📊 Comparación con {anterior.get('version') or 'resultado anterior'} ({anterior.get('fecha')})")
+    previos = {carga['clientes']: carga for carga in anterior.get('cargas', [])}
+    for carga in actual['cargas']:
+        previa = previos.get(carga['clientes'])
+        if not previa:
+            continue
+        print(f"  {carga['clientes']} clientes: {previa['rendimiento_rps']} → {carga['rendimiento_rps']} pet/s")
+        for categoria, resumen in carga['por_categoria'].items():
+            resumen_previo = previa['por_categoria'].get(categoria) or {}
+            for clave in ('p50_ms', 'p95_ms'):
+                nuevo, viejo = resumen.get(clave), resumen_previo.get(clave)
+                if nuevo is None or not viejo:
+                    continue
+                cambio = (nuevo - viejo) / viejo * 100
+                marca = '⚠️' if cambio > 10 else '  '
+                print(f"   {marca} {categoria:<18} {clave}: {viejo:>9.1f} → {nuevo:>9.1f} ms ({cambio:+.1f}%)")
+
+    llamadas_previas = anterior.get('llamadas_llm', {})
+    print(f"  Llamadas al modelo por petición ({anterior.get('entorno', {}).get('pipeline_legal', '?')} → "
+          f"{actual['entorno']['pipeline_legal']}):")
+    for categoria, resumen in actual['llamadas_llm'].items():
+        previo = llamadas_previas.get(categoria)
+        if previo:
+            print(f"     {categoria:<18} {previo['llamadas_llm_por_peticion']:>5} → {resumen['llamadas_llm_por_peticion']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de /chat con un servidor OpenAI falso')
+    parser.add_argument('--url', help='URL de una aplicación ya en marcha (debe usar el OPENAI_BASE_URL del servidor falso)')
+    parser.add_argument('--servidor', choices=['flask', 'gunicorn'], default='flask',
+                        help='Cómo arrancar la aplicación si no se da --url')
+    parser.add_argument('--workers', type=int, default=2, help='Workers de gunicorn')
+    parser.add_argument('--puerto-app', type=int, default=5055)
+    parser.add_argument('--puerto-openai', type=int, default=8765)
+    parser.add_argument('--concurrencia', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--duracion', type=float, default=20.0, help='Segundos de carga por nivel de concurrencia')
+    parser.add_argument('--preguntas', default=os.path.join(DIRECTORIO_BENCHMARKS, 'preguntas.json'))
+    parser.add_argument('--salida', help='Archivo JSON de resultados (por defecto benchmarks/resultados/<fecha>.json)')
+    parser.add_argument('--comparar', help='Resultado JSON anterior contra el que comparar')
+    parser.add_argument('--semilla', type=int, default=1234)
+    parser.add_argument('--pipeline-legal', choices=['extraccion', 'directo'], default='extraccion',
+                        help='MODO_PIPELINE_LEGAL de la aplicación que se arranca')
+    agregar_argumentos_latencia(parser)
+    args = parser.parse_args()
+
+    with open(args.preguntas, encoding='utf-8') as archivo:
+        corpus = json.load(archivo)
+
+    servidor_openai, _ = iniciar_servidor(args.puerto_openai, configuracion_desde_argumentos(args))
+    url_openai = f"http://127.0.0.1:{args.puerto_openai}"
+    print(f"🤖 Servidor OpenAI falso en {url_openai}/v1")
+
+    proceso, directorio_instancia = None, None
+    try:
+        if args.url:
+            url_app = args.url.rstrip('/')
+        else:
+            directorio_instancia = tempfile.mkdtemp(prefix='betaia-benchmark-')
+            proceso, url_app = lanzar_aplicacion(args.servidor, args.puerto_app, f"{url_openai}/v1",
+                                                 directorio_instancia, args.workers, args.pipeline_legal)
+        print(f"🚀 Aplicación en {url_app}")
+
+        print("🔥 Calentando...")
+        ejecutar_carga(url_app, corpus, clientes=1, duracion=min(args.duracion, 3), semilla=args.semilla)
+
+        print("🔢 Midiendo llamadas al modelo por petición...")
+        llamadas = medir_llamadas_por_peticion(url_app, f"{url_openai}/estadisticas", corpus)
+
+        cargas = []
+        for clientes in args.concurrencia:
+            print(f"⏱️ Carga con {clientes} clientes durante {args.duracion:g}s...")
+            carga = ejecutar_carga(url_app, corpus, clientes, args.duracion, args.semilla)
+            cargas.append(carga)
+            print(f"   {carga['rendimiento_rps']} pet/s, p50 {carga['global']['p50_ms']} ms, "
+                  f"p95 {carga['global']['p95_ms']} ms, errores {carga['errores']}")
+    finally:
+        if proceso:
+            proceso.terminate()
+            proceso.wait(timeout=10)
+        if directorio_instancia:
+            shutil.rmtree(directorio_instancia, ignore_errors=True)
+        servidor_openai.shutdown()
+
+    resultado = {
+        'version': version_git(),
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'entorno': {'python': platform.python_version(), 'plataforma': platform.platform(),
+                    'servidor': 'externo' if args.url else args.servidor,
+                    'workers': args.workers if args.servidor == 'gunicorn' else 1,
+                    'pipeline_legal': args.pipeline_legal},
+        'openai_falso': vars(configuracion_desde_argumentos(args)),
+        'llamadas_llm': llamadas,
+        'cargas': cargas,
+    }
+
+    salida = args.salida or os.path.join(DIRECTORIO_BENCHMARKS, 'resultados',
+                                         f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(salida)), exist_ok=True)
+    with open(salida, 'w', encoding='utf-8') as archivo:
+        json.dump(resultado, archivo, ensure_ascii=False, indent=2)
+    print(f"💾 Resultados guardados en {salida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as archivo:
+            comparar(resultado, json.load(archivo))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+"""
+Servidor local compatible con la API de OpenAI para medir la aplicación
+Responde POST /v1/chat/completions (normal y en streaming) con texto de
+relleno, simulando la latencia hasta el primer token y la velocidad de
+generación de un modelo real, sin costo ni variación de red.
+
+La aplicación se apunta a este servidor con:
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=falsa
+
+Rutas auxiliares para el benchmark:
+- GET  /estadisticas: llamadas y tokens servidos desde el último reinicio
+- POST /reiniciar:    pone los contadores a cero
+
+Uso:
+    python benchmarks/servidor_openai_falso.py --puerto 8765 --latencia-ms 400 --tokens-por-segundo 60
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PALABRAS_RELLENO = (
+    "según el Reglamento de Emergencia JP-RP-41 la calificación del solar determina los usos "
+    "permitidos y los parámetros de construcción aplicables al desarrollo propuesto en Puerto Rico"
+).split()
+
+
+class ConfiguracionLatencia:
+    """Distribuciones de latencia hasta el primer token y de velocidad de generación"""
+
+    def __init__(self, latencia_ms=400.0, dispersion=0.35, tokens_por_segundo=60.0,
+                 variacion_velocidad=0.2, tokens_respuesta=250):
+        self.latencia_ms = latencia_ms
+        self.dispersion = dispersion
+        self.tokens_por_segundo = tokens_por_segundo
+        self.variacion_velocidad = variacion_velocidad
+        self.tokens_respuesta = tokens_respuesta
+
+    def latencia_primer_token(self):
+        """Log-normal con mediana latencia_ms: cola larga como la de una API real"""
+        if self.latencia_ms <= 0:
+            return 0.0
+        return random.lognormvariate(0, self.dispersion) * self.latencia_ms / 1000
+
+    def segundos_por_token(self):
+        velocidad = random.gauss(self.tokens_por_segundo, self.tokens_por_segundo * self.variacion_velocidad)
+        return 1 / max(velocidad, 1.0)
+
+
+class EstadisticasServidor:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        with self.lock:
+            self.llamadas = 0
+            self.llamadas_stream = 0
+            self.tokens_prompt = 0
+            self.tokens_respuesta = 0
+
+    def registrar(self, stream, tokens_prompt, tokens_respuesta):
+        with self.lock:
+            self.llamadas += 1
+            self.llamadas_stream += int(stream)
+            self.tokens_prompt += tokens_prompt
+            self.tokens_respuesta += tokens_respuesta
+
+    def como_dict(self):
+        with self.lock:
+            return {
+                'llamadas': self.llamadas,
+                'llamadas_stream': self.llamadas_stream,
+                'tokens_prompt': self.tokens_prompt,
+                'tokens_respuesta': self.tokens_respuesta,
+            }
+
+
+def estimar_tokens(mensajes):
+    """Aproximación de ~4 caracteres por token"""
+    return sum(len(str(mensaje.get('content', ''))) for mensaje in mensajes) // 4 + 1
+
+
+def crear_manejador(configuracion, estadisticas):
+    class ManejadorOpenAIFalso(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, formato, *args):
+            pass
+
+        def _enviar_json(self, estado, cuerpo):
+            datos = json.dumps(cuerpo).encode('utf-8')
+            self.send_response(estado)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(datos)))
+            self.end_headers()
+            self.wfile.write(datos)
+
+        def do_GET(self):
+            if self.path == '/estadisticas':
+                self._enviar_json(200, estadisticas.como_dict())
+            else:
+                self._enviar_json(404, {'error': {'message': 'ruta no encontrada'}})
+
+        def do_POST(self):
+            longitud = int(self.headers.get('Content-Length', 0))
+            cuerpo = json.loads(self.rfile.read(longitud) or b'{}')
+            if self.path == '/reiniciar':
+                estadisticas.reiniciar()
+                self._enviar_json(200, {'ok': True})
+            elif self.path.rstrip('/').endswith('/chat/completions'):
+                self._completar(cuerpo)
+            else:
+                self._enviar_json(404, {'error': {'message': 'ruta no encontrada'}})
+
+        def _completar(self, cuerpo):
+            modelo = cuerpo.get('model', 'gpt-4o')
+            tokens_prompt = estimar_tokens(cuerpo.get('messages', []))
+            tokens_respuesta = min(configuracion.tokens_respuesta, cuerpo.get('max_tokens') or configuracion.tokens_respuesta)
+            palabras = [PALABRAS_RELLENO[i % len(PALABRAS_RELLENO)] for i in range(tokens_respuesta)]
+            uso = {'prompt_tokens': tokens_prompt, 'completion_tokens': tokens_respuesta,
+                   'total_tokens': tokens_prompt + tokens_respuesta}
+            identificador = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+            creado = int(time.time())
+            stream = bool(cuerpo.get('stream'))
+            estadisticas.registrar(stream, tokens_prompt, tokens_respuesta)
+
+            time.sleep(configuracion.latencia_primer_token())
+            segundos_por_token = configuracion.segundos_por_token()
+
+            if not stream:
+                time.sleep(segundos_por_token * tokens_respuesta)
+                self._enviar_json(200, {
+                    'id': identificador, 'object': 'chat.completion', 'created': creado, 'model': modelo,
+                    'choices': [{'index': 0, 'finish_reason': 'stop',
+                                 'message': {'role': 'assistant', 'content': ' '.join(palabras)}}],
+                    'usage': uso,
+                })
+                return
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+
+            def enviar(fragmento):
+                self.wfile.write(f"data: {json.dumps(fragmento)}\n\n".encode('utf-8'))
+                self.wfile.flush()
+
+            base = {'id': identificador, 'object': 'chat.completion.chunk', 'created': creado, 'model': modelo}
+            for i, palabra in enumerate(palabras):
+                delta = {'content': (' ' if i else '') + palabra}
+                if i == 0:
+                    delta['role'] = 'assistant'
+                enviar({**base, 'choices': [{'index': 0, 'delta': delta, 'finish_reason': None}]})
+                time.sleep(segundos_por_token)
+            enviar({**base, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})
+            if (cuerpo.get('stream_options') or {}).get('include_usage'):
+                enviar({**base, 'choices': [], 'usage': uso})
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+            self.close_connection = True
+
+    return ManejadorOpenAIFalso
+
+
+def iniciar_servidor(puerto=8765, configuracion=None):
+    """Arranca el servidor en un hilo y lo devuelve junto con sus estadísticas"""
+    estadisticas = EstadisticasServidor()
+    servidor = ThreadingHTTPServer(('127.0.0.1', puerto), crear_manejador(configuracion or ConfiguracionLatencia(), estadisticas))
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True, name="openai-falso").start()
+    return servidor, estadisticas
+
+
+def agregar_argumentos_latencia(parser):
+    parser.add_argument('--latencia-ms', type=float, default=400.0, help='Mediana hasta el primer token (ms)')
+    parser.add_argument('--dispersion', type=float, default=0.35, help='Sigma de la log-normal de latencia')
+    parser.add_argument('--tokens-por-segundo', type=float, default=60.0, help='Velocidad media de generación')
+    parser.add_argument('--tokens-respuesta', type=int, default=250, help='Tokens por respuesta (acotado por max_tokens)')
+
+
+def configuracion_desde_argumentos(args):
+    return ConfiguracionLatencia(latencia_ms=args.latencia_ms, dispersion=args.dispersion,
+                                 tokens_por_segundo=args.tokens_por_segundo,
+                                 tokens_respuesta=args.tokens_respuesta)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Servidor OpenAI falso para benchmarks')
+    parser.add_argument('--puerto', type=int, default=8765)
+    agregar_argumentos_latencia(parser)
+    args = parser.parse_args()
+    servidor, _ = iniciar_servidor(args.puerto, configuracion_desde_argumentos(args))
+    print(f"🤖 Servidor OpenAI falso en http://127.0.0.1:{args.puerto}/v1")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        servidor.shutdown()
@@ -0,0 +1,122 @@
+"""
+Bitácora estructurada sin bloqueo
+Los hilos de las peticiones solo encolan registros; un hilo en segundo
+plano los escribe por lotes como líneas JSON y rota el archivo por tamaño.
+
+- registrar(): nunca toca el disco; si la cola está llena el registro se
+  descarta y se cuenta
+- Los cuerpos de respuesta se guardan solo en una fracción de los
+  registros (tasa_muestreo_respuestas); siempre se guarda su longitud
+- Rotación estilo logging.handlers.RotatingFileHandler (ruta.1 ... ruta.N),
+  serializada entre los workers con flock cuando está disponible
+"""
+import atexit
+import json
+import os
+import queue
+import random
+import threading
+import time
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+
+class Bitacora:
+    """Escritor de registros JSON por lotes con rotación por tamaño"""
+
+    def __init__(self, ruta, max_bytes=10 * 1024 * 1024, copias=5,
+                 tasa_muestreo_respuestas=1.0, intervalo_escritura=0.5, max_pendientes=10000):
+        self.ruta = ruta
+        self.max_bytes = max_bytes
+        self.copias = copias
+        self.tasa_muestreo_respuestas = tasa_muestreo_respuestas
+        self.intervalo_escritura = intervalo_escritura
+        self._pendientes = queue.Queue(maxsize=max_pendientes)
+        self._escritura_lock = threading.Lock()
+        self.registros_escritos = 0
+        self.descartados = 0
+        self.rotaciones = 0
+
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+
+        threading.Thread(target=self._escribir_en_fondo, daemon=True, name="bitacora").start()
+        atexit.register(self.vaciar)
+
+    def registrar(self, evento, respuesta=None, **campos):
+        """Encola un registro; `respuesta` se incluye según la tasa de muestreo"""
+        registro = {'ts': datetime.now().isoformat(timespec='milliseconds'), 'evento': evento, 'pid': os.getpid()}
+        registro.update(campos)
+        if respuesta is not None:
+            registro['longitud_respuesta'] = len(respuesta)
+            if self.tasa_muestreo_respuestas >= 1 or random.random() < self.tasa_muestreo_respuestas:
+                registro['respuesta'] = respuesta
+        try:
+            self._pendientes.put_nowait(registro)
+        except queue.Full:
+            self.descartados += 1
+
+    # --- Escritura diferida ---
+
+    def _escribir_en_fondo(self):
+        while True:
+            time.sleep(self.intervalo_escritura)
+            try:
+                self.vaciar()
+            except Exception as e:
+                print(f"❌ Error escribiendo la bitácora: {e}")
+
+    def vaciar(self):
+        """Escribe en un solo lote todos los registros pendientes de este proceso"""
+        with self._escritura_lock:
+            registros = []
+            while True:
+                try:
+                    registros.append(self._pendientes.get_nowait())
+                except queue.Empty:
+                    break
+            if not registros:
+                return
+
+            lote = ''.join(json.dumps(registro, ensure_ascii=False, default=str) + '\n' for registro in registros)
+            with open(self.ruta + '.lock', 'a') as candado:
+                if fcntl:
+                    fcntl.flock(candado, fcntl.LOCK_EX)
+                try:
+                    self._rotar_si_hace_falta()
+                    with open(self.ruta, 'a', encoding='utf-8') as archivo:
+                        archivo.write(lote)
+                finally:
+                    if fcntl:
+                        fcntl.flock(candado, fcntl.LOCK_UN)
+            self.registros_escritos += len(registros)
+
+    def _rotar_si_hace_falta(self):
+        try:
+            tamano = os.path.getsize(self.ruta)
+        except OSError:
+            return
+        if tamano < self.max_bytes:
+            return
+        for n in range(self.copias - 1, 0, -1):
+            origen = f"{self.ruta}.{n}"
+            if os.path.exists(origen):
+                os.replace(origen, f"{self.ruta}.{n + 1}")
+        if self.copias > 0:
+            os.replace(self.ruta, f"{self.ruta}.1")
+        else:
+            os.remove(self.ruta)
+        self.rotaciones += 1
+
+    def estadisticas(self):
+        return {
+            'pendientes': self._pendientes.qsize(),
+            'escritos': self.registros_escritos,
+            'descartados': self.descartados,
+            'rotaciones': self.rotaciones,
+        }
@@ -0,0 +1,376 @@
+"""
+Caché persistente de respuestas finales
+Las preguntas que se repiten (definiciones, tablas, flujogramas) se
+responden desde un archivo SQLite (WAL) compartido por todos los workers de
+gunicorn del nodo, sin volver a llamar al modelo. Sobrevive reinicios.
+
+- clave: espacio (p. ej. 'legal', 'especialistas') + pregunta normalizada
+  (minúsculas, sin acentos ni signos, espacios colapsados)
+- versión del corpus: huella de los archivos de data/, recalculada cada
+  intervalo de revalidación; si alguno cambia, las respuestas anteriores
+  dejan de coincidir y se purgan
+- TTL por entrada y límite de entradas y de bytes con expulsión LRU
+- preguntas casi iguales ('qué es la calificación' / 'que es calificacion
+  por favor'): firma MinHash de los términos de la pregunta (sin acentos ni
+  palabras vacías) e índice LSH por bandas en la misma base; se reutiliza la
+  respuesta si la similitud estimada supera el umbral, los números citados
+  (tomo, sección), las negaciones y los interrogativos coinciden, y las dos
+  preguntas tienen los mismos términos (ni uno de más ni uno de menos)
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from itertools import combinations
+
+import numpy as np
+
+from almacen_conversaciones import codificar_contenido, decodificar_contenido
+from indices_busqueda import normalizar_texto, terminos_pregunta
+
+PATRON_NO_PALABRA = re.compile(r'[^\w]+')
+
+# MinHash: PERMUTACIONES funciones hash agrupadas en BANDAS para el índice LSH.
+# Con 16 bandas de 4 filas, dos preguntas con similitud 0.7 son candidatas con
+# probabilidad ~0.98 y con similitud 0.3 ~0.12 (luego se comprueba la firma completa)
+PERMUTACIONES = 64
+BANDAS = 16
+FILAS_POR_BANDA = PERMUTACIONES // BANDAS
+_generador = np.random.default_rng(20250729)
+# Coeficientes fijos: todos los workers calculan las mismas firmas
+_MULTIPLICADORES = _generador.integers(1, 2 ** 63, size=PERMUTACIONES, dtype=np.uint64) | np.uint64(1)
+_SUMANDOS = _generador.integers(0, 2 ** 63, size=PERMUTACIONES, dtype=np.uint64)
+
+# Resultado de una consulta a la caché: respuesta, similitud (1.0 si es exacta) y
+# segundos que tardó en generarse la respuesta original
+AciertoCache = namedtuple('AciertoCache', 'valor similitud segundos')
+
+# Palabras que cambian el sentido de una pregunta sin cambiar casi su firma
+NEGACIONES = {'no', 'ni', 'nunca', 'jamas', 'tampoco', 'sin', 'excepto', 'salvo', 'prohibido', 'prohibida'}
+INTERROGATIVOS = {'que', 'cual', 'cuales', 'cuando', 'como', 'cuanto', 'cuanta', 'cuantos', 'cuantas',
+                  'donde', 'adonde', 'quien', 'quienes', 'porque'}
+MARCAS_SENTIDO = NEGACIONES | INTERROGATIVOS
+
+# Archivos derivados de data/ que no forman parte de la versión del corpus
+ARCHIVOS_DERIVADOS = {'corpus.pack', 'texto_extraido.idx'}
+
+
+def normalizar_pregunta(pregunta):
+    """'¿Qué es un Permiso de Uso?' y 'que es un permiso de uso' dan la misma clave"""
+    return ' '.join(PATRON_NO_PALABRA.sub(' ', normalizar_texto(pregunta)).split())
+
+
+def shingles_pregunta(terminos):
+    """Términos de la pregunta y todos sus pares: no depende del orden de las cláusulas,
+    pero un término de más o de menos pesa más que en la similitud de términos sueltos"""
+    unicos = sorted(set(terminos))
+    return set(unicos) | {f"{a} {b}" for a, b in combinations(unicos, 2)}
+
+
+def firma_minhash(shingles):
+    """Firma MinHash (PERMUTACIONES valores de 32 bits) de un conjunto de shingles"""
+    valores = np.array([int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little')
+                        for shingle in shingles], dtype=np.uint64)
+    hashes = (_MULTIPLICADORES[:, None] * valores[None, :] + _SUMANDOS[:, None]) >> np.uint64(32)
+    return hashes.min(axis=1).astype(np.uint32)
+
+
+def bandas_lsh(firma):
+    """Valor (entero de 64 bits con signo) de cada banda de la firma"""
+    return [int.from_bytes(hashlib.blake2b(banda.tobytes(), digest_size=8).digest(), 'little', signed=True)
+            for banda in firma.reshape(BANDAS, FILAS_POR_BANDA)]
+
+
+def numeros_pregunta(pregunta):
+    """Números citados ('tomo 3', 'sección 10.1.4'): deben coincidir para reutilizar una respuesta"""
+    return ' '.join(sorted(set(re.findall(r'\d+(?:\.\d+)*', pregunta))))
+
+
+def marcas_pregunta(pregunta):
+    """Negaciones e interrogativos ('no', 'cuándo', 'cuántos'): cambian el sentido y deben coincidir"""
+    return ' '.join(sorted(set(normalizar_pregunta(pregunta).split()) & MARCAS_SENTIDO))
+
+
+def version_corpus(directorio_datos):
+    """Huella (ruta, mtime, tamaño) de todos los archivos de datos"""
+    huella = hashlib.sha256()
+    for raiz, directorios, archivos in os.walk(directorio_datos):
+        directorios.sort()
+        for nombre in sorted(archivos):
+            if nombre in ARCHIVOS_DERIVADOS:
+                continue
+            ruta = os.path.join(raiz, nombre)
+            try:
+                estado = os.stat(ruta)
+            except OSError:
+                continue
+            relativa = os.path.relpath(ruta, directorio_datos)
+            huella.update(f"{relativa}\0{estado.st_mtime_ns}\0{estado.st_size}\n".encode('utf-8'))
+    return huella.hexdigest()[:16]
+
+
+class CacheRespuestas:
+    """Respuestas finales en SQLite por (espacio, pregunta normalizada) y versión del corpus
+
+    `version` es la versión del corpus o una función que la calcula; en ese caso se
+    recalcula como mucho cada `intervalo_revalidacion` segundos, así un archivo de
+    datos modificado invalida las respuestas anteriores sin reiniciar la app.
+    """
+
+    def __init__(self, ruta, version, ttl_segundos=7 * 24 * 3600, max_entradas=5000,
+                 max_bytes=64 * 1024 * 1024, umbral_similitud=0.7, min_terminos_similares=2,
+                 max_terminos_similares=20, intervalo_revalidacion=30):
+        self.ruta = ruta
+        self._calcular_version = version if callable(version) else (lambda: version)
+        self.intervalo_revalidacion = intervalo_revalidacion
+        self._lock_version = threading.Lock()
+        self._version = self._calcular_version()
+        self._ultima_revalidacion = time.monotonic()
+        self.ttl_segundos = ttl_segundos
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        # umbral_similitud=None desactiva la búsqueda de preguntas casi iguales
+        self.umbral_similitud = umbral_similitud
+        # Solo preguntas con entre min y max términos distintos (las muy largas rara vez se repiten)
+        self.min_terminos_similares = min_terminos_similares
+        self.max_terminos_similares = max_terminos_similares
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._ultima_limpieza = 0.0
+        self.aciertos = 0
+        self.aciertos_similares = 0
+        self.fallos = 0
+        self.segundos_ahorrados = 0.0
+
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        conexion = self._conexion()
+        conexion.executescript("""
+            CREATE TABLE IF NOT EXISTS respuestas (
+                clave TEXT PRIMARY KEY,
+                version TEXT NOT NULL,
+                valor BLOB NOT NULL,
+                bytes INTEGER NOT NULL,
+                creada REAL NOT NULL,
+                ultimo_acceso REAL NOT NULL,
+                segundos REAL NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_respuestas_acceso ON respuestas(ultimo_acceso);
+            CREATE TABLE IF NOT EXISTS firmas (
+                clave TEXT PRIMARY KEY,
+                firma BLOB NOT NULL,
+                numeros TEXT NOT NULL,
+                marcas TEXT NOT NULL DEFAULT '',
+                terminos TEXT NOT NULL DEFAULT ''
+            );
+            CREATE TABLE IF NOT EXISTS bandas (
+                espacio TEXT NOT NULL,
+                banda INTEGER NOT NULL,
+                valor INTEGER NOT NULL,
+                clave TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_bandas ON bandas(espacio, banda, valor);
+            CREATE INDEX IF NOT EXISTS idx_bandas_clave ON bandas(clave);
+        """)
+        # Bases creadas antes de guardar lo que tardó cada respuesta
+        columnas = {fila[1] for fila in conexion.execute("PRAGMA table_info(respuestas)")}
+        if 'segundos' not in columnas:
+            conexion.execute("ALTER TABLE respuestas ADD COLUMN segundos REAL NOT NULL DEFAULT 0")
+        # Firmas guardadas antes de comparar negaciones y términos: sin términos nunca coinciden
+        columnas = {fila[1] for fila in conexion.execute("PRAGMA table_info(firmas)")}
+        for columna in ('marcas', 'terminos'):
+            if columna not in columnas:
+                conexion.execute(f"ALTER TABLE firmas ADD COLUMN {columna} TEXT NOT NULL DEFAULT ''")
+        # Respuestas de otra versión del corpus ya no pueden coincidir
+        conexion.execute("DELETE FROM respuestas WHERE version != ?", (self.version,))
+        self._borrar_firmas_huerfanas(conexion)
+
+    @property
+    def version(self):
+        """Versión del corpus vigente, revalidada cada intervalo_revalidacion segundos"""
+        if time.monotonic() - self._ultima_revalidacion >= self.intervalo_revalidacion:
+            with self._lock_version:
+                if time.monotonic() - self._ultima_revalidacion >= self.intervalo_revalidacion:
+                    version = self._calcular_version()
+                    if version != self._version:
+                        print(f"🔄 Datos modificados: la caché de respuestas pasa a la versión {version}")
+                        self._version = version
+                    self._ultima_revalidacion = time.monotonic()
+        return self._version
+
+    def _conexion(self):
+        """Conexión SQLite propia de cada hilo"""
+        conexion = getattr(self._local, 'conexion', None)
+        if conexion is None:
+            conexion = sqlite3.connect(self.ruta, timeout=10, isolation_level=None)
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute("PRAGMA synchronous=NORMAL")
+            self._local.conexion = conexion
+        return conexion
+
+    def _clave(self, espacio, pregunta):
+        texto = f"{self.version}\0{espacio}\0{normalizar_pregunta(pregunta)}"
+        return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+    def obtener(self, espacio, pregunta):
+        """AciertoCache de la misma pregunta o de una casi igual, o None si no hay o expiró"""
+        ahora = time.time()
+        conexion = self._conexion()
+        clave = self._clave(espacio, pregunta)
+        exacta, similitud = True, 1.0
+        fila = conexion.execute(
+            "SELECT valor, segundos FROM respuestas WHERE clave = ? AND version = ? AND creada >= ?",
+            (clave, self.version, ahora - self.ttl_segundos)
+        ).fetchone()
+        if fila is None:
+            exacta = False
+            clave, similitud = self._buscar_similar(conexion, espacio, pregunta, ahora)
+            if clave is not None:
+                fila = conexion.execute("SELECT valor, segundos FROM respuestas WHERE clave = ?", (clave,)).fetchone()
+        if fila is None:
+            self.fallos += 1
+            return None
+        conexion.execute("UPDATE respuestas SET ultimo_acceso = ? WHERE clave = ?", (ahora, clave))
+        if exacta:
+            self.aciertos += 1
+        else:
+            self.aciertos_similares += 1
+        self.segundos_ahorrados += fila[1]
+        return AciertoCache(json.loads(decodificar_contenido(fila[0])), similitud, fila[1])
+
+    def _firma(self, pregunta):
+        """(firma MinHash, bandas LSH, términos) de la pregunta, o None si tiene muy pocos términos"""
+        if self.umbral_similitud is None:
+            return None
+        terminos = set(terminos_pregunta(pregunta))
+        if not self.min_terminos_similares <= len(terminos) <= self.max_terminos_similares:
+            return None
+        firma = firma_minhash(shingles_pregunta(terminos))
+        return firma, bandas_lsh(firma), terminos
+
+    def _buscar_similar(self, conexion, espacio, pregunta, ahora):
+        """(clave, similitud) de la pregunta guardada más parecida por encima del umbral, o (None, 0)"""
+        firma_bandas = self._firma(pregunta)
+        if firma_bandas is None:
+            return None, 0.0
+        firma, bandas, terminos = firma_bandas
+        condicion = ' OR '.join(['(b.banda = ? AND b.valor = ?)'] * len(bandas))
+        parametros = [espacio] + [valor for banda, hash_banda in enumerate(bandas) for valor in (banda, hash_banda)]
+        candidatas = conexion.execute(
+            "SELECT DISTINCT f.clave, f.firma, f.numeros, f.marcas, f.terminos FROM bandas b "
+            "JOIN firmas f ON f.clave = b.clave JOIN respuestas r ON r.clave = f.clave "
+            f"WHERE b.espacio = ? AND ({condicion}) AND r.version = ? AND r.creada >= ?",
+            parametros + [self.version, ahora - self.ttl_segundos]
+        ).fetchall()
+
+        numeros, marcas = numeros_pregunta(pregunta), marcas_pregunta(pregunta)
+        mejor, mejor_similitud = None, 0.0
+        for clave, firma_guardada, numeros_guardados, marcas_guardadas, terminos_guardados in candidatas:
+            if numeros_guardados != numeros or marcas_guardadas != marcas:
+                continue
+            # 'zona residencial' y 'zona residencial agrícola' no comparten respuesta, en ningún sentido
+            if terminos != set(terminos_guardados.split()):
+                continue
+            similitud = float(np.mean(np.frombuffer(firma_guardada, dtype=np.uint32) == firma))
+            if similitud > mejor_similitud:
+                mejor, mejor_similitud = clave, similitud
+        if mejor is None or mejor_similitud < self.umbral_similitud:
+            return None, 0.0
+        return mejor, mejor_similitud
+
+    def guardar(self, espacio, pregunta, valor, segundos=0.0):
+        """Guarda la respuesta (str o dict serializable en JSON) y lo que tardó en generarse"""
+        ahora = time.time()
+        contenido = codificar_contenido(json.dumps(valor, ensure_ascii=False))
+        if len(contenido) > self.max_bytes:
+            return
+        clave = self._clave(espacio, pregunta)
+        firma_bandas = self._firma(pregunta)
+        conexion = self._conexion()
+        conexion.execute("BEGIN IMMEDIATE")
+        try:
+            conexion.execute(
+                "INSERT OR REPLACE INTO respuestas (clave, version, valor, bytes, creada, ultimo_acceso, segundos) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (clave, self.version, contenido, len(contenido), ahora, ahora, segundos)
+            )
+            if firma_bandas is not None:
+                firma, bandas, terminos = firma_bandas
+                conexion.execute(
+                    "INSERT OR REPLACE INTO firmas (clave, firma, numeros, marcas, terminos) VALUES (?, ?, ?, ?, ?)",
+                    (clave, firma.tobytes(), numeros_pregunta(pregunta), marcas_pregunta(pregunta),
+                     ' '.join(sorted(terminos)))
+                )
+                conexion.execute("DELETE FROM bandas WHERE clave = ?", (clave,))
+                conexion.executemany("INSERT INTO bandas (espacio, banda, valor, clave) VALUES (?, ?, ?, ?)",
+                                     [(espacio, banda, hash_banda, clave) for banda, hash_banda in enumerate(bandas)])
+            conexion.execute("COMMIT")
+        except Exception:
+            conexion.execute("ROLLBACK")
+            raise
+        if ahora - self._ultima_limpieza >= 60:
+            with self._lock:
+                if ahora - self._ultima_limpieza >= 60:
+                    self._limpiar(conexion, ahora)
+
+    @staticmethod
+    def _borrar_firmas_huerfanas(conexion):
+        conexion.execute("DELETE FROM firmas WHERE clave NOT IN (SELECT clave FROM respuestas)")
+        conexion.execute("DELETE FROM bandas WHERE clave NOT IN (SELECT clave FROM respuestas)")
+
+    def _limpiar(self, conexion, ahora):
+        """Expira por TTL y expulsa las menos usadas por encima de max_entradas o max_bytes (LRU)"""
+        self._ultima_limpieza = ahora
+        conexion.execute("BEGIN IMMEDIATE")
+        try:
+            conexion.execute(
+                "DELETE FROM respuestas WHERE version != ? OR creada < ? OR clave IN "
+                "(SELECT clave FROM respuestas ORDER BY ultimo_acceso DESC LIMIT -1 OFFSET ?)",
+                (self.version, ahora - self.ttl_segundos, self.max_entradas)
+            )
+            exceso = conexion.execute("SELECT COALESCE(SUM(bytes), 0) FROM respuestas").fetchone()[0] - self.max_bytes
+            if exceso > 0:
+                # Las menos recientes hasta liberar el exceso
+                conexion.execute(
+                    "DELETE FROM respuestas WHERE clave IN (SELECT clave FROM ("
+                    "SELECT clave, SUM(bytes) OVER (ORDER BY ultimo_acceso, clave) AS acumulado FROM respuestas"
+                    ") WHERE acumulado - bytes < ?)",
+                    (exceso,)
+                )
+            self._borrar_firmas_huerfanas(conexion)
+            conexion.execute("COMMIT")
+        except Exception:
+            conexion.execute("ROLLBACK")
+            raise
+
+    def vaciar(self):
+        """Elimina todas las respuestas guardadas"""
+        conexion = self._conexion()
+        conexion.execute("DELETE FROM respuestas")
+        self._borrar_firmas_huerfanas(conexion)
+
+    def estadisticas(self):
+        entradas, bytes_respuestas = self._conexion().execute(
+            "SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM respuestas"
+        ).fetchone()
+        consultas = self.aciertos + self.aciertos_similares + self.fallos
+        return {
+            'version_corpus': self.version,
+            'entradas': entradas,
+            'max_entradas': self.max_entradas,
+            'bytes': bytes_respuestas,
+            'max_bytes': self.max_bytes,
+            'ttl_segundos': self.ttl_segundos,
+            'umbral_similitud': self.umbral_similitud,
+            'aciertos': self.aciertos,
+            'aciertos_similares': self.aciertos_similares,
+            'fallos': self.fallos,
+            'tasa_aciertos': round((self.aciertos + self.aciertos_similares) / consultas, 3) if consultas else None,
+            'segundos_ahorrados': round(self.segundos_ahorrados, 1),
+        }
@@ -0,0 +1,227 @@
+"""
+Pasarela compartida hacia la API de OpenAI
+Un solo cliente por proceso para app.py y los mini-especialistas:
+- pool HTTP con keep-alive, reutilizado por todas las llamadas del worker
+- plazo total por sitio de llamada (la función que llama), que acota
+  también la espera de cupo y los reintentos
+- reintentos con espera exponencial y jitter ante 429, 5xx y errores de
+  conexión, respetando Retry-After
+- cupo de llamadas simultáneas por worker, repartido por el gobernador
+  (cola acotada con turnos por sesión y rechazo rápido; gobernador_llm.py)
+- métricas betaia_llm_* por intento, con el sitio de llamada como etiqueta
+
+Los sitios de llamada siguen usando client.chat.completions.create(...);
+el cliente de OpenAI se crea en el primer uso dentro de cada worker.
+"""
+import os
+import random
+import sys
+import threading
+import time
+
+import openai
+from openai import OpenAI
+
+from gobernador_llm import GobernadorLLM, LLMSaturado, peticion_actual
+from metricas import metricas
+
+try:
+    import httpx
+except ImportError:  # Variantes del SDK sin httpx: se usa el pool predeterminado del SDK
+    httpx = None
+
+# Envoltorios que no cuentan como sitio de llamada: se atribuye a quien los invoca
+# (el vuelo único ejecuta la extracción de buscar_informacion_relevante)
+FUNCIONES_INTERMEDIAS = {'completar_chat_en_streaming', 'extraer_con_modelo', 'ejecutar'}
+
+# Estados HTTP que se reintentan: límite de peticiones, conflictos transitorios y errores del servidor
+ESTADOS_REINTENTABLES = {408, 409, 429, 500, 502, 503, 504}
+
+
+def _sitio_llamada(marco):
+    while marco.f_back is not None and marco.f_code.co_name in FUNCIONES_INTERMEDIAS:
+        marco = marco.f_back
+    return marco.f_code.co_name
+
+
+def _motivo_reintento(error):
+    if isinstance(error, openai.APIStatusError):
+        return str(error.status_code)
+    if isinstance(error, openai.APITimeoutError):
+        return 'timeout'
+    return 'conexion'
+
+
+class _Completados:
+    """chat.completions de la pasarela; el sitio es la función que hace la llamada"""
+
+    def __init__(self, pasarela):
+        self._pasarela = pasarela
+
+    def create(self, **parametros):
+        return self._pasarela.completar(_sitio_llamada(sys._getframe(1)), parametros)
+
+
+class PasarelaLLM:
+    """Cliente de OpenAI compartido con plazos, reintentos y cupo de concurrencia"""
+
+    def __init__(self):
+        self.api_key = None
+        self.base_url = None
+        self.plazos = {}
+        self.plazo_predeterminado = 30.0
+        self.reintentos = 2
+        self.espera_base = 0.5
+        self.espera_maxima = 8.0
+        self.max_conexiones = 20
+        self.gobernador = GobernadorLLM()
+        self._cliente = None
+        self._pid = None
+        self._lock = threading.Lock()
+        # Llamadas del proceso que terminaron sin respuesta (error definitivo o sin cupo)
+        self.fallos = 0
+        self.chat = type('Chat', (), {})()
+        self.chat.completions = _Completados(self)
+
+    def configurar(self, api_key=None, base_url=None, plazos=None, plazo_predeterminado=None,
+                   reintentos=None, max_concurrencia=None, max_conexiones=None, max_en_espera=None,
+                   espera_admision=None):
+        """Ajusta la pasarela; debe llamarse antes de la primera llamada al modelo"""
+        self.api_key = api_key or self.api_key
+        self.base_url = base_url or self.base_url
+        if plazos:
+            self.plazos.update(plazos)
+        if plazo_predeterminado is not None:
+            self.plazo_predeterminado = plazo_predeterminado
+        if reintentos is not None:
+            self.reintentos = reintentos
+        if max_conexiones is not None:
+            self.max_conexiones = max_conexiones
+        self.gobernador.configurar(max_en_curso=max_concurrencia, max_en_espera=max_en_espera,
+                                   espera_admision=espera_admision)
+        self._cliente = None
+
+    def _obtener_cliente(self):
+        """Cliente de OpenAI de este proceso (los workers no heredan conexiones del maestro)"""
+        if self._cliente is None or self._pid != os.getpid():
+            with self._lock:
+                if self._cliente is None or self._pid != os.getpid():
+                    opciones = {'api_key': self.api_key, 'base_url': self.base_url, 'max_retries': 0}
+                    if httpx is not None:
+                        opciones['http_client'] = httpx.Client(
+                            limits=httpx.Limits(max_connections=self.max_conexiones,
+                                                max_keepalive_connections=self.max_conexiones,
+                                                keepalive_expiry=60),
+                            timeout=httpx.Timeout(self.plazo_predeterminado, connect=5.0),
+                            follow_redirects=True,
+                        )
+                    self._cliente = OpenAI(**opciones)
+                    self._pid = os.getpid()
+        return self._cliente
+
+    def _registrar_fallo(self):
+        self.fallos += 1
+        peticion = peticion_actual()
+        if peticion is not None:
+            peticion.fallos += 1
+
+    def fallos_actuales(self):
+        """Llamadas fallidas de la petición en curso (del proceso, fuera de una petición)
+
+        Sirve para saber si una respuesta se generó sin fallos: los fallos de otras
+        peticiones simultáneas no cuentan.
+        """
+        peticion = peticion_actual()
+        return peticion.fallos if peticion is not None else self.fallos
+
+    def plazo(self, sitio):
+        return self.plazos.get(sitio, self.plazo_predeterminado)
+
+    def _espera_reintento(self, error, intento, limite):
+        """Segundos a esperar antes de reintentar, o None si no se reintenta"""
+        if intento >= self.reintentos:
+            return None
+        if isinstance(error, openai.APIStatusError):
+            if error.status_code not in ESTADOS_REINTENTABLES:
+                return None
+        elif not isinstance(error, openai.APIConnectionError):
+            return None
+
+        tope = min(self.espera_maxima, self.espera_base * 2 ** intento)
+        espera = tope / 2 + random.uniform(0, tope / 2)
+        cabeceras = getattr(getattr(error, 'response', None), 'headers', None) or {}
+        try:
+            espera = max(espera, float(cabeceras.get('retry-after', 0)))
+        except (TypeError, ValueError):
+            pass
+        # Sin margen para otro intento dentro del plazo: no tiene sentido esperar
+        if time.monotonic() + espera >= limite - 1.0:
+            return None
+        return espera
+
+    def completar(self, sitio, parametros):
+        """chat.completions.create con plazo, cupo y reintentos; mide cada intento"""
+        plazo = min(self.plazo(sitio), parametros.pop('timeout', None) or float('inf'))
+        limite = time.monotonic() + plazo
+        modelo = parametros.get('model', '')
+        stream = bool(parametros.get('stream'))
+        if stream:
+            parametros.setdefault('stream_options', {'include_usage': True})
+
+        intento = 0
+        while True:
+            inicio_espera = time.perf_counter()
+            try:
+                self.gobernador.adquirir(limite)
+            except LLMSaturado as e:
+                metricas.incrementar('betaia_llm_llamadas_total', sitio=sitio, modelo=modelo, resultado='saturado')
+                self._registrar_fallo()
+                raise LLMSaturado(f"{e} ({sitio})") from None
+            metricas.observar('betaia_llm_espera_cupo_segundos', time.perf_counter() - inicio_espera)
+
+            metricas.ajustar_indicador('betaia_llm_en_curso', 1)
+            inicio = time.perf_counter()
+            try:
+                respuesta = self._obtener_cliente().chat.completions.create(
+                    timeout=max(limite - time.monotonic(), 0.1), **parametros)
+            except Exception as e:
+                self.gobernador.liberar()
+                metricas.ajustar_indicador('betaia_llm_en_curso', -1)
+                metricas.registrar_llamada_llm(sitio, modelo, time.perf_counter() - inicio, None, 'error')
+                espera = self._espera_reintento(e, intento, limite)
+                if espera is None:
+                    self._registrar_fallo()
+                    raise
+                metricas.incrementar('betaia_llm_reintentos_total', sitio=sitio, motivo=_motivo_reintento(e))
+                print(f"🔁 Reintento {intento + 1} de la llamada al modelo ({sitio}) en {espera:.1f}s: {e}")
+                time.sleep(espera)
+                intento += 1
+                continue
+
+            if stream:
+                return self._medir_stream(respuesta, sitio, modelo, inicio)
+            self.gobernador.liberar()
+            metricas.ajustar_indicador('betaia_llm_en_curso', -1)
+            metricas.registrar_llamada_llm(sitio, modelo, time.perf_counter() - inicio,
+                                           getattr(respuesta, 'usage', None), 'ok')
+            return respuesta
+
+    def _medir_stream(self, fragmentos, sitio, modelo, inicio):
+        """Reenvía los fragmentos y libera el cupo cuando el stream termina o se abandona"""
+        uso, resultado = None, 'error'
+        try:
+            for fragmento in fragmentos:
+                uso = getattr(fragmento, 'usage', None) or uso
+                yield fragmento
+            resultado = 'ok'
+        except Exception:
+            self._registrar_fallo()
+            raise
+        finally:
+            self.gobernador.liberar()
+            metricas.ajustar_indicador('betaia_llm_en_curso', -1)
+            metricas.registrar_llamada_llm(sitio, modelo, time.perf_counter() - inicio, uso, resultado)
+
+
+# Instancia compartida por app.py y los mini-especialistas
+llm = PasarelaLLM()
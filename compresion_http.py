@@ -0,0 +1,42 @@
+"""
+Compresión de respuestas HTTP
+Codificaciones que entiende la app (br y gzip, en ese orden de preferencia) y la
+compresión de un cuerpo con cada una. La usan los recursos estáticos al compilar
+(máxima compresión, una sola vez) y /chat al responder (compresión rápida).
+
+Brotli es opcional: sin el módulo brotli solo se usa gzip.
+"""
+import gzip
+
+try:
+    import brotli
+except ImportError:  # Sin Brotli se sirve gzip
+    brotli = None
+
+# Codificación -> extensión de la variante precomprimida, en orden de preferencia
+EXTENSIONES_CODIFICACION = {'br': '.br', 'gzip': '.gz'}
+CODIFICACIONES_DISPONIBLES = tuple(c for c in EXTENSIONES_CODIFICACION if c != 'br' or brotli is not None)
+
+# Niveles (gzip, brotli): 'maximo' para compilar una vez, 'rapido' para cada respuesta
+NIVELES_COMPRESION = {'maximo': (9, 11), 'rapido': (6, 4)}
+
+
+def comprimir(datos, codificacion, nivel='rapido'):
+    """Cuerpo comprimido con 'br' o 'gzip'"""
+    nivel_gzip, nivel_brotli = NIVELES_COMPRESION[nivel]
+    if codificacion == 'gzip':
+        # mtime=0: la misma entrada produce los mismos bytes (ETag estable)
+        return gzip.compress(datos, compresslevel=nivel_gzip, mtime=0)
+    return brotli.compress(datos, quality=nivel_brotli)
+
+
+def elegir_codificacion(aceptadas, disponibles=CODIFICACIONES_DISPONIBLES):
+    """Primera codificación disponible que el cliente acepta (Accept-Encoding), o None
+
+    aceptadas es el objeto request.accept_encodings de werkzeug: la calidad de una
+    codificación que el cliente no nombra (o rechaza con q=0) es 0.
+    """
+    for codificacion in disponibles:
+        if aceptadas[codificacion]:
+            return codificacion
+    return None
@@ -0,0 +1,222 @@
+"""
+Enrutador de consultas
+Cada mensaje se analiza una sola vez: un autómata Aho-Corasick con todas las
+palabras clave del despacho (chat, mini-especialistas, consultas específicas,
+tablas, preguntas legales) recorre el texto en minúsculas en una sola pasada
+y marca los grupos de palabras presentes. Las expresiones regulares del tomo
+y de las tablas de cabida solo se evalúan si el autómata vio 'tomo', 'tabla'
+o 'cabida'.
+
+El resultado es un ContextoConsulta: el propio texto del mensaje (es un str,
+así que sirve tal cual en prompts y registros) con el texto en minúsculas,
+el texto normalizado, el tomo mencionado y los grupos detectados. Las
+funciones de despacho reciben el contexto en lugar de volver a recorrer el
+mensaje con sus propias listas.
+"""
+import re
+
+from indices_busqueda import normalizar_texto
+
+# Grupo → palabras clave (se buscan como subcadenas del texto en minúsculas, igual que `palabra in texto`)
+GRUPOS_PALABRAS = {
+    # Respuestas fijas de responder_mensaje
+    'cuantos_tomos': ['cuantos tomos', 'cuántos tomos'],
+    'division_ambiental': ['división de cumplimiento ambiental', 'division de cumplimiento ambiental'],
+
+    # Detección de preguntas legales y de consultas específicas en responder_mensaje
+    'legal': [
+        'permiso', 'planificación', 'construcción', 'zonificación', 'desarrollo',
+        'urbanización', 'reglamento', 'licencia', 'certificación', 'calificación',
+        'tomo', 'junta', 'ambiental', 'infraestructura',
+        'conservación', 'histórico', 'querella', 'edificabilidad', 'lotificación'
+    ],
+    'consulta_especifica': ['índice', 'indice', 'flujograma', 'tabla', 'cabida', 'resolución', 'lista'],
+    'contexto_legal': ['puerto rico', 'pr', 'planificación', 'planificacion', 'ley', 'legal', 'gobierno'],
+    'tomo': ['tomo'],
+    'tabla': ['tabla'],
+    'cabida': ['cabida'],
+
+    # Mini-especialistas
+    'conservacion_especifica': [
+        'sitio histórico', 'sitios históricos',
+        'designación histórica', 'nominación histórica',
+        'conservación histórica', 'patrimonio histórico',
+        'icp', 'instituto de cultura',
+        'sección 10.1.1', 'criterios históricos'
+    ],
+    'calificaciones': ['calificaciones'],
+    'permisos': ['permisos'],
+    'agencias': ['agencias'],
+
+    # detectar_consulta_especifica / procesar_consulta_especifica
+    'indice_completo': ['índice', 'indice', 'lista completa', 'todos los recursos', 'qué recursos', 'recursos disponibles'],
+    'flujograma': ['flujograma', 'proceso', 'trámite', 'procedimiento'],
+    'flujograma_terrenos': ['terreno', 'terrenos', 'público', 'públicos'],
+    'flujograma_calificacion': ['calificación', 'cambio', 'cambios'],
+    'flujograma_historicos': ['histórico', 'historicos', 'sitio', 'sitios'],
+    'resoluciones': ['resolución', 'resoluciones'],
+    'tema_ambiente': ['ambiente', 'ambiental'],
+    'tema_construccion': ['construcción', 'construccion'],
+    'tema_zonificacion': ['zonificación', 'zonificacion'],
+
+    # detectar_y_generar_tabla_automatica
+    'solicita_tabla': [
+        'tabla', 'tablas', 'generar tabla', 'mostrar tabla', 'crear tabla',
+        'tabla de', 'tabla con', 'resumen tabla', 'formato tabla'
+    ],
+    'tabla_cabida': ['cabida', 'superficie', 'área'],
+    'tabla_calificaciones': ['calificación', 'calificacion', 'zonificación', 'zonificacion', 'distrito', 'distritos'],
+    'tabla_permisos': ['permiso', 'permisos', 'licencia', 'licencias', 'trámite', 'tramite'],
+    'tabla_agencias': ['agencia', 'agencias', 'entidad', 'entidades', 'organización', 'organizacion'],
+
+    # Sitios históricos (Tomo 10)
+    'sitios_historicos': [
+        'sitio histórico', 'sitios históricos', 'sitio historico', 'sitios historicos',
+        'zona histórica', 'zonas históricas', 'zona historica', 'zonas historicas',
+        'conservación histórica', 'conservacion historica', 'patrimonio histórico',
+        'designación histórica', 'designacion historica', 'nominación histórica'
+    ],
+
+    # Títulos de los tomos en procesar_pregunta_legal
+    'titulos': ["titulo", "títulos", "titulos", "nombre", "nombres", "llamar", "llama", "indices", "indice", "índice", "índices"],
+    'tomos': ["tomo", "tomos", "11 tomos", "once tomos", "todos los tomos", "cada tomo"],
+    'listado': ["dame", "dime", "muestra", "muéstra", "lista", "listado", "cuales", "cuáles"],
+
+    # detectar_tipo_pregunta y comparaciones del glosario
+    'comparacion': ['diferencia', 'diferencias', 'comparar', 'comparación'],
+    'requisitos': ['requisito', 'requisitos', 'proceso', 'procedimiento', 'pasos', 'como', 'cómo',
+                   'necesito', 'solicitar', 'obtener', 'tramitar', 'aplicar'],
+    'definicion': ['qué es', 'que es', 'define', 'definición', 'definicion', 'significado', 'explica',
+                   'explícame', 'explicame', 'concepto', 'término', 'termino', 'significa'],
+    'tipo_permisos': ['permiso', 'autorización', 'licencia', 'trámite'],
+    'accion': ['requisito', 'como', 'cómo', 'proceso', 'solicitar', 'obtener', 'tramitar'],
+    'construccion': ['construcción', 'edificar', 'estructura', 'obra'],
+    'planificacion': ['plan', 'zonificación', 'ordenación', 'uso de suelo'],
+    'ambiental': ['ambiental', 'conservación', 'aguas', 'desperdicios'],
+
+    # es_pregunta_simple
+    'compleja': ["todos", "lista", "cantidad", "cuantos", "cuántos", "comparar", "diferencia",
+                 "análisis", "resumen", "procedimiento completo", "proceso completo"],
+    'simple': ["qué es", "que es", "define", "definición", "significa",
+               "cómo se", "como se", "para qué", "para que"],
+}
+
+# Número de tomo ('tomo 3', 'tomo3', 'del tomo 3')
+PATRON_TOMO = re.compile(r'tomo\s*(\d+)')
+
+# Consultas sobre tablas de cabida, en una sola expresión
+PATRON_TABLA_CABIDA = re.compile('|'.join([
+    r'tabla.*cabida',
+    r'cabida.*tabla',
+    r'cabida.*distrito',
+    r'cabida.*tomo',
+    r'tabla.*tomo',
+    r'tabla.*distrito',
+    r'muestra.*tabla.*cabida',
+    r'ver.*tabla.*cabida',
+    r'información.*cabida',
+]))
+
+
+class AutomataPalabras:
+    """Autómata de Aho-Corasick sobre grupos de palabras clave
+
+    buscar(texto) devuelve una máscara de bits con los grupos que tienen al
+    menos una palabra contenida en el texto, en una sola pasada.
+    """
+
+    def __init__(self, grupos):
+        self.nombres = list(grupos)
+        self.bits = {nombre: 1 << i for i, nombre in enumerate(self.nombres)}
+
+        # Trie: transiciones y máscara de grupos de las palabras que terminan en cada estado
+        transiciones = [{}]
+        salida = [0]
+        for nombre, palabras in grupos.items():
+            for palabra in palabras:
+                estado = 0
+                for caracter in palabra:
+                    siguiente = transiciones[estado].get(caracter)
+                    if siguiente is None:
+                        siguiente = len(transiciones)
+                        transiciones[estado][caracter] = siguiente
+                        transiciones.append({})
+                        salida.append(0)
+                    estado = siguiente
+                salida[estado] |= self.bits[nombre]
+
+        # Enlaces de fallo por niveles y tabla de transiciones completa (autómata determinista)
+        alfabeto = {caracter for estado in transiciones for caracter in estado}
+        fallo = [0] * len(transiciones)
+        self._delta = [dict() for _ in transiciones]
+        self._delta[0] = {caracter: transiciones[0].get(caracter, 0) for caracter in alfabeto}
+        cola = list(transiciones[0].values())
+        for estado in cola:
+            fallo[estado] = 0
+        posicion = 0
+        while posicion < len(cola):
+            estado = cola[posicion]
+            posicion += 1
+            salida[estado] |= salida[fallo[estado]]
+            for caracter in alfabeto:
+                siguiente = transiciones[estado].get(caracter)
+                if siguiente is not None:
+                    fallo[siguiente] = self._delta[fallo[estado]][caracter]
+                    cola.append(siguiente)
+                    self._delta[estado][caracter] = siguiente
+                else:
+                    self._delta[estado][caracter] = self._delta[fallo[estado]][caracter]
+        # Los caracteres fuera del alfabeto vuelven al estado inicial: se omiten de las tablas
+        self._delta = [{c: s for c, s in fila.items() if s} for fila in self._delta]
+        self._salida = salida
+
+    def buscar(self, texto):
+        delta = self._delta
+        salida = self._salida
+        estado = 0
+        mascara = 0
+        for caracter in texto:
+            estado = delta[estado].get(caracter, 0)
+            mascara |= salida[estado]
+        return mascara
+
+    def grupos(self, mascara):
+        return {nombre for nombre, bit in self.bits.items() if mascara & bit}
+
+
+automata_consultas = AutomataPalabras(GRUPOS_PALABRAS)
+
+
+class ContextoConsulta(str):
+    """Mensaje del usuario ya analizado por el enrutador
+
+    Se comporta como el texto original; además lleva:
+    - texto_lower / normalizado: minúsculas y sin acentos
+    - grupos: grupos de GRUPOS_PALABRAS presentes en el mensaje
+    - tomo: número de tomo mencionado (o None)
+    - pide_tabla_cabida: coincide con alguno de los patrones de tabla de cabida
+    """
+
+    def tiene(self, *grupos):
+        """True si el mensaje contiene alguna palabra de alguno de los grupos"""
+        return any(grupo in self.grupos for grupo in grupos)
+
+
+def analizar_consulta(mensaje):
+    """Analiza el mensaje una sola vez; un ContextoConsulta se devuelve sin repetir el análisis"""
+    if isinstance(mensaje, ContextoConsulta):
+        return mensaje
+    consulta = ContextoConsulta(mensaje)
+    consulta.texto_lower = mensaje.lower()
+    consulta.normalizado = normalizar_texto(mensaje)
+    consulta.grupos = automata_consultas.grupos(automata_consultas.buscar(consulta.texto_lower))
+
+    consulta.tomo = None
+    if 'tomo' in consulta.grupos:
+        coincidencia = PATRON_TOMO.search(consulta.texto_lower)
+        if coincidencia:
+            consulta.tomo = int(coincidencia.group(1))
+
+    consulta.pide_tabla_cabida = (consulta.tiene('tabla', 'cabida')
+                                  and PATRON_TABLA_CABIDA.search(consulta.texto_lower) is not None)
+    return consulta
@@ -0,0 +1,172 @@
+"""
+Gobernador de llamadas al modelo
+Reparte los cupos de llamadas simultáneas a chat.completions del worker:
+
+- tope de llamadas en curso para todos los sitios de llamada juntos
+- las peticiones que no llaman al modelo (tablas, índice, /health) nunca
+  pasan por aquí: no esperan detrás de las preguntas lentas
+- cola de espera acotada, atendida por turnos entre sesiones: una sesión con
+  varias fuentes en paralelo no adelanta a las demás
+- una petición nueva que encuentra la cola llena, o que no obtiene cupo en
+  espera_admision segundos, se rechaza enseguida (LLMSaturado) y /chat
+  responde 429 'intenta de nuevo'; las llamadas de una petición ya admitida
+  esperan su turno hasta el plazo del sitio, para no desperdiciar lo hecho
+
+La petición en curso se identifica con peticion(sesion), un contexto que viaja
+con contextvars (los hilos del ejecutor de fuentes lo reciben con copy_context).
+"""
+import contextvars
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from metricas import metricas
+
+_peticion_actual = contextvars.ContextVar('peticion_llm', default=None)
+
+
+class LLMSaturado(RuntimeError):
+    """No hubo cupo para llamar al modelo antes de que venciera el plazo"""
+
+
+class PeticionLLM:
+    """Estado de una petición: sesión, si ya obtuvo cupo, si se rechazó y sus llamadas fallidas"""
+
+    __slots__ = ('sesion', 'admitida', 'rechazada', 'fallos')
+
+    def __init__(self, sesion):
+        self.sesion = sesion
+        self.admitida = False
+        self.rechazada = False
+        self.fallos = 0
+
+
+class _Turno:
+    __slots__ = ('concedido',)
+
+    def __init__(self):
+        self.concedido = False
+
+
+def peticion_actual():
+    """PeticionLLM del contexto actual, o None fuera de una petición (precalentamiento, CLI)"""
+    return _peticion_actual.get()
+
+
+class GobernadorLLM:
+    """Cupos de llamadas al modelo con cola acotada y turnos por sesión"""
+
+    def __init__(self, max_en_curso=16, max_en_espera=32, espera_admision=10.0):
+        self.max_en_curso = max_en_curso
+        self.max_en_espera = max_en_espera
+        self.espera_admision = espera_admision
+        self.en_curso = 0
+        self.en_espera = 0
+        self.rechazos = 0
+        # sesión -> turnos en espera; el orden del diccionario es el orden de atención
+        self._colas = OrderedDict()
+        self._condicion = threading.Condition()
+
+    def configurar(self, max_en_curso=None, max_en_espera=None, espera_admision=None):
+        with self._condicion:
+            if max_en_curso is not None:
+                self.max_en_curso = max_en_curso
+            if max_en_espera is not None:
+                self.max_en_espera = max_en_espera
+            if espera_admision is not None:
+                self.espera_admision = espera_admision
+            self._despachar()
+
+    @contextmanager
+    def peticion(self, sesion):
+        """Marca las llamadas al modelo hechas dentro del bloque como de esta sesión"""
+        estado = PeticionLLM(sesion)
+        token = _peticion_actual.set(estado)
+        try:
+            yield estado
+        finally:
+            _peticion_actual.reset(token)
+
+    def _rechazar(self, peticion, motivo):
+        self.rechazos += 1
+        if peticion is not None:
+            peticion.rechazada = True
+        metricas.incrementar('betaia_llm_rechazadas_total', motivo=motivo)
+
+    def adquirir(self, limite):
+        """Espera un cupo hasta `limite` (time.monotonic); lanza LLMSaturado si no lo obtiene"""
+        peticion = peticion_actual()
+        nueva = peticion is not None and not peticion.admitida
+        with self._condicion:
+            if peticion is not None and peticion.rechazada:
+                raise LLMSaturado("La petición ya fue rechazada por saturación")
+            if self.en_curso < self.max_en_curso and not self.en_espera:
+                self.en_curso += 1
+                if peticion is not None:
+                    peticion.admitida = True
+                return
+            if nueva and self.en_espera >= self.max_en_espera:
+                self._rechazar(peticion, 'cola_llena')
+                raise LLMSaturado(f"Cola de llamadas al modelo llena ({self.en_espera} en espera)")
+
+            if nueva:
+                limite = min(limite, time.monotonic() + self.espera_admision)
+            sesion = peticion.sesion if peticion is not None else None
+            turno = _Turno()
+            self._colas.setdefault(sesion, deque()).append(turno)
+            self.en_espera += 1
+            metricas.ajustar_indicador('betaia_llm_en_espera', 1)
+            try:
+                while not turno.concedido:
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        break
+                    self._condicion.wait(restante)
+            finally:
+                if not turno.concedido:
+                    self._quitar(sesion, turno)
+            if not turno.concedido:
+                if nueva:
+                    self._rechazar(peticion, 'espera')
+                raise LLMSaturado(f"Sin cupo para llamar al modelo ({self.en_curso} en curso, "
+                                  f"{self.en_espera} en espera)")
+            if peticion is not None:
+                peticion.admitida = True
+
+    def _quitar(self, sesion, turno):
+        cola = self._colas.get(sesion)
+        if cola is not None and turno in cola:
+            cola.remove(turno)
+            if not cola:
+                del self._colas[sesion]
+            self.en_espera -= 1
+            metricas.ajustar_indicador('betaia_llm_en_espera', -1)
+
+    def _despachar(self):
+        """Concede los cupos libres por turnos: el primer turno de cada sesión, y la sesión pasa al final"""
+        concedidos = 0
+        while self.en_curso < self.max_en_curso and self._colas:
+            sesion, cola = next(iter(self._colas.items()))
+            cola.popleft().concedido = True
+            if cola:
+                self._colas.move_to_end(sesion)
+            else:
+                del self._colas[sesion]
+            self.en_curso += 1
+            self.en_espera -= 1
+            concedidos += 1
+        if concedidos:
+            metricas.ajustar_indicador('betaia_llm_en_espera', -concedidos)
+            self._condicion.notify_all()
+
+    def liberar(self):
+        with self._condicion:
+            self.en_curso -= 1
+            self._despachar()
+
+    def estadisticas(self):
+        with self._condicion:
+            return {'en_curso': self.en_curso, 'en_espera': self.en_espera, 'sesiones_en_espera': len(self._colas),
+                    'max_en_curso': self.max_en_curso, 'max_en_espera': self.max_en_espera,
+                    'espera_admision': self.espera_admision, 'rechazos': self.rechazos}
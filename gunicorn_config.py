@@ -1,3 +1,9 @@
+import os
+
 bind = "0.0.0.0:$PORT"
 workers = 2
+# Hilos por worker: mientras unas peticiones esperan al modelo, las que no lo
+# necesitan (tablas, índice, /health, estáticos) se atienden en otros hilos
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
 timeout = 120
@@ -0,0 +1,411 @@
+"""
+Índice del texto extraído de los tomos
+Los archivos texto_extraido_Tomo_N.txt de RespuestasParaChatBot (texto OCR
+completo de cada tomo, unos 2 MB en total) se indexan sin cargarlos en la
+memoria de los workers:
+
+- fragmentar_texto_extraido() lee cada archivo línea a línea y genera
+  ventanas solapadas que no cruzan encabezados de sección ('SECCIÓN 6.1.1.3',
+  'REGLA 6.1.1', 'CAPÍTULO 6.1') y prefieren cortar en los saltos de página
+  ('308 |', 'REGLAMENTO CONJUNTO 2020 | 309'). Cada fragmento lleva tomo,
+  sección, página y su posición en bytes dentro del archivo.
+- construir_indice_texto_extraido() escribe el índice invertido en un archivo
+  binario con el mismo formato de bloques alineados que el paquete de corpus:
+  tabla de fragmentos, vocabulario ordenado y postings (fragmento, frecuencia).
+- IndiceTextoExtraido proyecta el archivo con mmap en la primera búsqueda,
+  busca los términos en el vocabulario por bisección y puntúa con BM25; el
+  texto de los fragmentos elegidos se lee del archivo original por posición.
+
+El índice guarda la firma (mtime, tamaño) de cada archivo; si alguno cambió,
+apareció o desapareció, el índice no se usa hasta volver a construirlo.
+
+Uso:
+    python indice_texto_extraido.py [--datos data/RespuestasParaChatBot] [--salida data/texto_extraido.idx]
+    flask --app app build-corpus   (construye también este índice)
+"""
+import argparse
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import time
+from array import array
+from collections import namedtuple
+
+import numpy as np
+
+from indices_busqueda import tokenizar
+from paquete_corpus import ALINEACION, _Escritor, firma_archivo
+from registro_recursos import PATRON_CARPETA_TOMO
+
+MAGICO = b'BETAIX01'
+VERSION_INDICE = 1
+
+CARACTERES_POR_VENTANA = 1200
+CARACTERES_SOLAPAMIENTO = 200
+
+# Columnas de la tabla de fragmentos (uint32 por columna)
+COLUMNAS_FRAGMENTO = ('tomo', 'inicio_byte', 'fin_byte', 'pagina', 'id_seccion', 'longitud')
+
+# Encabezados que abren una sección nueva; se guarda el número más específico visto
+PATRON_ENCABEZADO = re.compile(r'^\s*(?:SECCI[OÓ]N|REGLA|CAP[IÍ]TULO)\s+(\d+(?:\.\d+)*)', re.IGNORECASE)
+# Pie o cabecera de página del OCR: '308 |', '312 | REGLAMENTO CONJUNTO 2020', 'REGLAMENTO CONJUNTO 2020 | 309'
+PATRON_PAGINA = re.compile(
+    r'^\s*(?:(\d{1,4})\s*\|(?:\s*REGLAMENTO CONJUNTO \d{4})?|REGLAMENTO CONJUNTO \d{4}\s*\|?\s*(\d{1,4}))\s*$',
+    re.IGNORECASE)
+
+FragmentoTexto = namedtuple('FragmentoTexto', 'tomo seccion pagina inicio_byte fin_byte texto')
+PasajeExtraido = namedtuple('PasajeExtraido', 'tomo seccion pagina texto puntuacion')
+
+
+def archivos_texto_extraido(directorio_respuestas):
+    """[(tomo, ruta)] de los texto_extraido_Tomo_N.txt, directos en RespuestasIA_TomoN/ o en TomoN/"""
+    archivos = []
+    try:
+        carpetas = sorted(os.listdir(directorio_respuestas))
+    except FileNotFoundError:
+        return archivos
+    for carpeta in carpetas:
+        coincidencia = PATRON_CARPETA_TOMO.match(carpeta)
+        if not coincidencia:
+            continue
+        tomo = int(coincidencia.group(1))
+        nombre = f"texto_extraido_Tomo_{tomo}.txt"
+        for ruta in (os.path.join(directorio_respuestas, carpeta, nombre),
+                     os.path.join(directorio_respuestas, carpeta, f"Tomo{tomo}", nombre)):
+            if os.path.isfile(ruta):
+                archivos.append((tomo, ruta))
+                break
+    return sorted(archivos)
+
+
+def _origenes(directorio_respuestas):
+    """{tomo: [ruta relativa, firma]} de los archivos presentes, para detectar cambios"""
+    return {str(tomo): [os.path.relpath(ruta, directorio_respuestas), firma_archivo(ruta)]
+            for tomo, ruta in archivos_texto_extraido(directorio_respuestas)}
+
+
+def fragmentar_texto_extraido(ruta, tomo, caracteres=CARACTERES_POR_VENTANA, solapamiento=CARACTERES_SOLAPAMIENTO):
+    """Genera los FragmentoTexto de un archivo, leyéndolo línea a línea
+
+    Una ventana se cierra al llegar a `caracteres`, en un encabezado de sección
+    que sigue a texto (sin solapamiento: la sección siguiente empieza limpia;
+    los encabezados seguidos quedan juntos en una ventana) o en un salto de
+    página si ya tiene al menos la mitad del tamaño. Al cerrar por tamaño o por
+    página, la ventana siguiente empieza con las últimas líneas de la anterior
+    hasta sumar `solapamiento` caracteres. Las líneas de número de página no se
+    incluyen en el texto.
+    """
+    # Líneas de la ventana actual: (inicio_byte, fin_byte, texto, pagina)
+    ventana = []
+    largo = 0
+    # Líneas de la ventana que no venían arrastradas de la anterior, y si alguna no es encabezado
+    nuevas = 0
+    con_contenido = False
+    seccion, pagina = '', 0
+    posicion = 0
+
+    def cerrar():
+        texto = ''.join(linea for _, _, linea, _ in ventana).strip()
+        if not nuevas or not texto:
+            return None
+        return FragmentoTexto(tomo, seccion, ventana[0][3], ventana[0][0], ventana[-1][1], texto)
+
+    def solapar():
+        """Últimas líneas de la ventana hasta sumar `solapamiento` (nunca la ventana entera)"""
+        arrastre, acumulado = [], 0
+        for linea in reversed(ventana[1:]):
+            if acumulado >= solapamiento:
+                break
+            arrastre.append(linea)
+            acumulado += len(linea[2])
+        return arrastre[::-1], acumulado, 0
+
+    with open(ruta, 'rb') as archivo:
+        for linea_bytes in archivo:
+            inicio, posicion = posicion, posicion + len(linea_bytes)
+            linea = linea_bytes.decode('utf-8', errors='replace')
+
+            marca_pagina = PATRON_PAGINA.match(linea)
+            if marca_pagina:
+                pagina = int(marca_pagina.group(1) or marca_pagina.group(2))
+                if largo >= caracteres // 2:
+                    fragmento = cerrar()
+                    if fragmento:
+                        yield fragmento
+                    ventana, largo, nuevas = solapar()
+                continue
+
+            encabezado = PATRON_ENCABEZADO.match(linea)
+            if encabezado:
+                # Los encabezados seguidos (el OCR los agrupa al inicio de página) van en la misma ventana
+                if con_contenido:
+                    fragmento = cerrar()
+                    if fragmento:
+                        yield fragmento
+                    ventana, largo, nuevas, con_contenido = [], 0, 0, False
+                seccion = encabezado.group(1)
+            elif linea.strip():
+                con_contenido = True
+
+            ventana.append((inicio, posicion, linea, pagina))
+            largo += len(linea)
+            nuevas += 1
+            if largo >= caracteres:
+                fragmento = cerrar()
+                if fragmento:
+                    yield fragmento
+                ventana, largo, nuevas = solapar()
+
+    fragmento = cerrar()
+    if fragmento:
+        yield fragmento
+
+
+def construir_indice_texto_extraido(directorio_respuestas, ruta_salida):
+    """Fragmenta todos los texto_extraido_Tomo_N.txt y escribe el índice invertido en ruta_salida"""
+    inicio = time.perf_counter()
+    escritor = _Escritor()
+    tabla = array('I')
+    secciones = ['']
+    ids_seccion = {'': 0}
+    postings = {}
+    longitudes_total = 0
+
+    for tomo, ruta in archivos_texto_extraido(directorio_respuestas):
+        for fragmento in fragmentar_texto_extraido(ruta, tomo):
+            id_fragmento = len(tabla) // len(COLUMNAS_FRAGMENTO)
+            tokens = tokenizar(fragmento.texto)
+            frecuencias = {}
+            for token in tokens:
+                frecuencias[token] = frecuencias.get(token, 0) + 1
+            for token, frecuencia in frecuencias.items():
+                postings.setdefault(token, []).append((id_fragmento, frecuencia))
+            id_seccion = ids_seccion.setdefault(fragmento.seccion, len(secciones))
+            if id_seccion == len(secciones):
+                secciones.append(fragmento.seccion)
+            tabla.extend((tomo, fragmento.inicio_byte, fragmento.fin_byte, fragmento.pagina, id_seccion, len(tokens)))
+            longitudes_total += len(tokens)
+
+    total_fragmentos = len(tabla) // len(COLUMNAS_FRAGMENTO)
+    vocabulario = sorted(postings)
+    vocabulario_bytes = bytearray()
+    vocabulario_inicios = array('I', [0])
+    inicios_postings = array('I', [0])
+    ids_postings = array('I')
+    frecuencias_postings = array('I')
+    for token in vocabulario:
+        vocabulario_bytes += token.encode('utf-8')
+        vocabulario_inicios.append(len(vocabulario_bytes))
+        for id_fragmento, frecuencia in postings[token]:
+            ids_postings.append(id_fragmento)
+            frecuencias_postings.append(frecuencia)
+        inicios_postings.append(len(ids_postings))
+
+    directorio = {
+        'version': VERSION_INDICE,
+        'orden_bytes': sys.byteorder,
+        'columnas_fragmento': COLUMNAS_FRAGMENTO,
+        'caracteres_por_ventana': CARACTERES_POR_VENTANA,
+        'caracteres_solapamiento': CARACTERES_SOLAPAMIENTO,
+        'construido': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'origenes': _origenes(directorio_respuestas),
+        'fragmentos': total_fragmentos,
+        'terminos': len(vocabulario),
+        'longitud_promedio': longitudes_total / total_fragmentos if total_fragmentos else 1.0,
+        'secciones': secciones,
+        'bloques': {
+            'fragmentos': escritor.agregar(tabla.tobytes()),
+            'vocabulario': escritor.agregar(vocabulario_bytes),
+            'vocabulario_inicios': escritor.agregar(vocabulario_inicios.tobytes()),
+            'postings_inicios': escritor.agregar(inicios_postings.tobytes()),
+            'postings_ids': escritor.agregar(ids_postings.tobytes()),
+            'postings_frecuencias': escritor.agregar(frecuencias_postings.tobytes()),
+        },
+    }
+
+    datos_directorio = json.dumps(directorio, ensure_ascii=False).encode('utf-8')
+    cabecera = MAGICO + struct.pack('<Q', len(datos_directorio)) + datos_directorio
+    cabecera += b'\0' * (-len(cabecera) % ALINEACION)
+
+    # Escritura atómica, como el paquete de corpus
+    os.makedirs(os.path.dirname(os.path.abspath(ruta_salida)), exist_ok=True)
+    temporal = f"{ruta_salida}.{os.getpid()}.tmp"
+    with open(temporal, 'wb') as f:
+        f.write(cabecera)
+        for parte in escritor.partes:
+            f.write(parte)
+    os.replace(temporal, ruta_salida)
+
+    return {
+        'tomos': len(directorio['origenes']),
+        'fragmentos': total_fragmentos,
+        'terminos': len(vocabulario),
+        'bytes': len(cabecera) + escritor.posicion,
+        'segundos': round(time.perf_counter() - inicio, 3),
+    }
+
+
+class IndiceTextoExtraido:
+    """Índice invertido del texto extraído, proyectado con mmap en la primera búsqueda"""
+
+    K1 = 1.5
+    B = 0.75
+
+    def __init__(self, ruta, directorio_respuestas):
+        self.ruta = ruta
+        self.directorio_respuestas = directorio_respuestas
+        self.directorio = None
+        self._abierto = False
+        self._lock = threading.Lock()
+
+    def _abrir(self):
+        """Proyecta el índice la primera vez; False si falta o está desactualizado"""
+        if not self._abierto:
+            with self._lock:
+                if not self._abierto:
+                    self._cargar()
+                    self._abierto = True
+        return self.directorio is not None
+
+    def _cargar(self):
+        if not os.path.exists(self.ruta):
+            print(f"⚠️ Índice del texto extraído no encontrado en {self.ruta} "
+                  "(genéralo con 'flask --app app build-corpus')")
+            return
+        try:
+            with open(self.ruta, 'rb') as f:
+                mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            print(f"❌ Error abriendo el índice del texto extraído: {e}")
+            return
+        vista = memoryview(mapa)
+        if bytes(vista[:len(MAGICO)]) != MAGICO:
+            print(f"❌ {self.ruta} no es un índice del texto extraído")
+            return
+        longitud, = struct.unpack_from('<Q', mapa, len(MAGICO))
+        inicio_directorio = len(MAGICO) + 8
+        directorio = json.loads(bytes(vista[inicio_directorio:inicio_directorio + longitud]))
+        if directorio.get('version') != VERSION_INDICE or directorio.get('orden_bytes') != sys.byteorder:
+            print(f"⚠️ {self.ruta} fue construido con otro formato; vuelve a ejecutar build-corpus")
+            return
+        if directorio['origenes'] != _origenes(self.directorio_respuestas):
+            print("⚠️ Índice del texto extraído desactualizado; vuelve a ejecutar build-corpus")
+            return
+
+        base = inicio_directorio + longitud + (-(inicio_directorio + longitud) % ALINEACION)
+
+        def bloque(nombre):
+            desplazamiento, largo = directorio['bloques'][nombre]
+            return vista[base + desplazamiento:base + desplazamiento + largo]
+
+        def enteros(nombre):
+            return np.frombuffer(bloque(nombre), dtype=np.uint32)
+
+        self._mapa = mapa
+        self._fragmentos = enteros('fragmentos').reshape(-1, len(COLUMNAS_FRAGMENTO))
+        self._vocabulario = bloque('vocabulario')
+        self._vocabulario_inicios = enteros('vocabulario_inicios')
+        self._postings_inicios = enteros('postings_inicios')
+        self._postings_ids = enteros('postings_ids')
+        self._postings_frecuencias = enteros('postings_frecuencias')
+        self.directorio = directorio
+        print(f"✅ Índice del texto extraído proyectado: {directorio['fragmentos']} fragmentos, "
+              f"{directorio['terminos']} términos, {len(mapa) // 1024} KB")
+
+    def _termino(self, posicion):
+        inicios = self._vocabulario_inicios
+        return bytes(self._vocabulario[inicios[posicion]:inicios[posicion + 1]])
+
+    def _posicion(self, termino):
+        """Posición del término en el vocabulario ordenado (bisección sobre el bloque), o None"""
+        clave = termino.encode('utf-8')
+        bajo, alto = 0, len(self._vocabulario_inicios) - 1
+        while bajo < alto:
+            medio = (bajo + alto) // 2
+            if self._termino(medio) < clave:
+                bajo = medio + 1
+            else:
+                alto = medio
+        if bajo < len(self._vocabulario_inicios) - 1 and self._termino(bajo) == clave:
+            return bajo
+        return None
+
+    def puntuar(self, pregunta):
+        """Puntuación BM25 de cada fragmento (arreglo de numpy, 0 si no comparte términos)"""
+        total = self.directorio['fragmentos']
+        puntuaciones = np.zeros(total)
+        longitudes = self._fragmentos[:, COLUMNAS_FRAGMENTO.index('longitud')]
+        for token in set(tokenizar(pregunta)):
+            posicion = self._posicion(token)
+            if posicion is None:
+                continue
+            inicio, fin = self._postings_inicios[posicion], self._postings_inicios[posicion + 1]
+            ids = self._postings_ids[inicio:fin]
+            frecuencias = self._postings_frecuencias[inicio:fin].astype(np.float64)
+            idf = math.log(1 + (total - len(ids) + 0.5) / (len(ids) + 0.5))
+            norma = self.K1 * (1 - self.B + self.B * longitudes[ids] / self.directorio['longitud_promedio'])
+            puntuaciones[ids] += idf * frecuencias * (self.K1 + 1) / (frecuencias + norma)
+        return puntuaciones
+
+    def _leer(self, tomo, inicio_byte, fin_byte):
+        ruta = os.path.join(self.directorio_respuestas, self.directorio['origenes'][str(tomo)][0])
+        with open(ruta, 'rb') as archivo:
+            archivo.seek(inicio_byte)
+            return archivo.read(fin_byte - inicio_byte).decode('utf-8', errors='replace').strip()
+
+    def buscar(self, pregunta, top_k=3, tomos=None):
+        """Hasta top_k PasajeExtraido no solapados, por relevancia; `tomos` limita los tomos"""
+        if not self._abrir():
+            return []
+        puntuaciones = self.puntuar(pregunta)
+        if tomos:
+            puntuaciones[~np.isin(self._fragmentos[:, 0], list(tomos))] = 0
+        candidatos = np.flatnonzero(puntuaciones)
+        candidatos = candidatos[np.argsort(-puntuaciones[candidatos], kind='stable')]
+
+        elegidos = []
+        for id_fragmento in candidatos:
+            tomo, inicio, fin, pagina, id_seccion, _ = (int(valor) for valor in self._fragmentos[id_fragmento])
+            # Las ventanas vecinas se solapan: no se devuelven dos tramos del mismo texto
+            if any(t == tomo and inicio < f and i < fin for t, i, f, _ in elegidos):
+                continue
+            elegidos.append((tomo, inicio, fin, PasajeExtraido(
+                tomo, self.directorio['secciones'][id_seccion], pagina,
+                self._leer(tomo, inicio, fin), float(puntuaciones[id_fragmento]))))
+            if len(elegidos) >= top_k:
+                break
+        return [pasaje for _, _, _, pasaje in elegidos]
+
+    def estadisticas(self):
+        if self.directorio is None:
+            return {'ruta': self.ruta, 'proyectado': False}
+        return {
+            'ruta': self.ruta,
+            'proyectado': True,
+            'tomos': len(self.directorio['origenes']),
+            'fragmentos': self.directorio['fragmentos'],
+            'terminos': self.directorio['terminos'],
+            'bytes_proyectados': len(self._mapa),
+        }
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description='Construye el índice del texto extraído de los tomos')
+    parser.add_argument('--datos', default=os.path.join('data', 'RespuestasParaChatBot'),
+                        help='Directorio con las carpetas RespuestasIA_TomoN')
+    parser.add_argument('--salida', default=os.getenv('INDICE_TEXTO_EXTRAIDO', os.path.join('data', 'texto_extraido.idx')))
+    args = parser.parse_args(argumentos)
+
+    resumen = construir_indice_texto_extraido(args.datos, args.salida)
+    print(f"✅ Índice del texto extraído escrito en {args.salida}: {resumen['tomos']} tomos, "
+          f"{resumen['fragmentos']} fragmentos, {resumen['terminos']} términos, "
+          f"{resumen['bytes'] // 1024} KB en {resumen['segundos']}s")
+
+
+if __name__ == '__main__':
+    main()
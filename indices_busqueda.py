@@ -0,0 +1,667 @@
+"""
+Índices de búsqueda en memoria
+Se construyen una sola vez al cargar la aplicación para evitar recorrer
+los documentos completos en cada consulta
+"""
+import math
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+# Marcadores del glosario que no son términos
+ENCABEZADOS_NO_TERMINO = ('**DEFINICIÓN**:', '**CATEGORÍA**:')
+
+PATRON_PALABRA = re.compile(r'\w+')
+PATRON_FRAGMENTO = re.compile(r'^(?:=+|#+)?\s*FRAGMENTO\s+\d+')
+
+# Secciones numeradas de los tomos: líneas de '=' que enmarcan un título y encabezados 'SECCIÓN 10.1.4.1 - ...'
+PATRON_LINEA_SEPARADORA = re.compile(r'^=+$')
+PATRON_ENCABEZADO_SECCION = re.compile(r'^(?:secci[oó]n|regla)\s+\d+(?:\.\d+)+\s*[-–:]', re.IGNORECASE)
+PATRON_NUMERO_SECCION = re.compile(r'\b\d+(?:\.\d+){2,}\b')
+PATRON_TITULO_SECCION = re.compile(r'\b(?:secci[oó]n|regla)\s+(\d+(?:\.\d+){2,})\s*[-–:]\s*(.+)', re.IGNORECASE)
+# Estimación de tokens del modelo para los presupuestos de contexto
+CARACTERES_POR_TOKEN = 4
+
+
+class IndiceGlosario:
+    """Índice precompilado del glosario: término normalizado → definición
+
+    Conserva los mismos niveles de confianza que la búsqueda original
+    (100/95/90/70/60/50/40) pero resuelve cada consulta con búsquedas en
+    diccionarios en lugar de recorrer el archivo completo.
+    """
+
+    def __init__(self, texto):
+        # Entradas en orden del archivo: (término en minúsculas, definición completa)
+        self.entradas = []
+        # término exacto → ids de entradas
+        self.exactos = {}
+        # palabra → ids de entradas con términos compuestos
+        self.postings_palabras = {}
+        # trigrama → ids de entradas (para contención de subcadenas)
+        self.postings_trigramas = {}
+
+        if texto:
+            self._construir(texto)
+
+    def __len__(self):
+        return len(self.entradas)
+
+    @staticmethod
+    def _extraer_termino(linea):
+        """Extrae el término de una línea de encabezado (**Término**: o **TÉRMINO**:)"""
+        if not (linea.startswith('**') and '**:' in linea):
+            return ""
+        if linea.startswith('**TÉRMINO**:'):
+            return linea.replace('**TÉRMINO**:', '').strip().lower()
+        if linea.startswith(ENCABEZADOS_NO_TERMINO):
+            return ""
+        inicio = linea.find('**') + 2
+        fin = linea.find('**:', inicio)
+        if fin > inicio:
+            return linea[inicio:fin].strip().lower()
+        return ""
+
+    @staticmethod
+    def _extraer_definicion(lineas, i):
+        """Reúne las líneas de definición/categoría que siguen al encabezado i"""
+        contenido_definicion = []
+        j = i + 1
+        while j < len(lineas) and j < i + 15:
+            linea_sig = lineas[j].strip()
+
+            # Si encontramos otra definición de término, parar
+            if linea_sig.startswith('**TÉRMINO**:'):
+                break
+            # Si encontramos líneas que no son de definición/categoría, parar
+            elif (linea_sig.startswith('**') and '**:' in linea_sig and
+                  not linea_sig.startswith('**DEFINICIÓN') and
+                  not linea_sig.startswith('**CATEGORÍA')):
+                break
+            # Si encontramos una línea vacía seguida de otra definición, parar
+            elif not linea_sig and j + 1 < len(lineas) and lineas[j + 1].strip().startswith('**TÉRMINO**:'):
+                break
+            # Incluir definiciones y categorías
+            elif (linea_sig.startswith('**DEFINICIÓN') or
+                  linea_sig.startswith('**CATEGORÍA') or
+                  (linea_sig and len(linea_sig) > 3 and not linea_sig.startswith('**'))):
+                contenido_definicion.append(linea_sig)
+            j += 1
+        return contenido_definicion
+
+    def _construir(self, texto):
+        lineas = texto.split('\n')
+        for i, linea_original in enumerate(lineas):
+            linea = linea_original.strip()
+            termino = self._extraer_termino(linea)
+            if not termino:
+                continue
+
+            contenido_definicion = self._extraer_definicion(lineas, i)
+            if not contenido_definicion:
+                continue
+            definicion_completa = (linea + '\n' + '\n'.join(contenido_definicion)).strip()
+            if len(definicion_completa) <= 10:
+                continue
+
+            id_entrada = len(self.entradas)
+            self.entradas.append((termino, definicion_completa))
+            self.exactos.setdefault(termino, []).append(id_entrada)
+
+            if ' ' in termino:
+                for palabra in set(termino.split()):
+                    self.postings_palabras.setdefault(palabra, []).append(id_entrada)
+
+            for trigrama in {termino[k:k + 3] for k in range(len(termino) - 2)}:
+                self.postings_trigramas.setdefault(trigrama, []).append(id_entrada)
+
+    def _candidatos_contencion(self, termino):
+        """Entradas cuyo término contiene la subcadena buscada (intersección de trigramas)"""
+        trigramas = {termino[k:k + 3] for k in range(len(termino) - 2)}
+        listas = [self.postings_trigramas.get(t) for t in trigramas]
+        if not listas or any(lista is None for lista in listas):
+            return []
+        listas.sort(key=len)
+        candidatos = set(listas[0])
+        for lista in listas[1:]:
+            candidatos.intersection_update(lista)
+            if not candidatos:
+                return []
+        return [c for c in candidatos if termino in self.entradas[c][0]]
+
+    def _puntuar(self, termino_lower):
+        """Devuelve {id_entrada: confianza} para todas las coincidencias"""
+        puntuaciones = {}
+
+        # 1. COINCIDENCIA EXACTA (máxima prioridad)
+        for id_entrada in self.exactos.get(termino_lower, []):
+            puntuaciones[id_entrada] = 100
+
+        if ' ' in termino_lower:
+            # 2. COINCIDENCIA DE TÉRMINOS COMPUESTOS - solo contra términos compuestos
+            palabras_busqueda = termino_lower.split()
+            candidatos = set()
+            for palabra in palabras_busqueda:
+                candidatos.update(self.postings_palabras.get(palabra, ()))
+
+            for id_entrada in candidatos:
+                termino_glosario = self.entradas[id_entrada][0]
+                if termino_glosario == termino_lower:
+                    continue
+                palabras_glosario = termino_glosario.split()
+                if len(palabras_busqueda) > len(palabras_glosario):
+                    continue
+
+                if palabras_glosario[:len(palabras_busqueda)] == palabras_busqueda:
+                    puntuaciones[id_entrada] = 95
+                    continue
+
+                palabras_coinciden = sum(
+                    1 for palabra in palabras_busqueda
+                    if len(palabra) > 2 and palabra in palabras_glosario
+                )
+                if palabras_coinciden == len(palabras_busqueda) and len(palabras_busqueda) >= 2:
+                    puntuaciones[id_entrada] = 90
+                elif palabras_coinciden >= max(1, len(palabras_busqueda) * 0.7):
+                    puntuaciones[id_entrada] = 70
+
+        if len(termino_lower) >= 5:
+            # 3. CONTENCIÓN SIGNIFICATIVA (no aplica entre dos términos compuestos)
+            compuesto = ' ' in termino_lower
+
+            # El término buscado está contenido en el término del glosario
+            for id_entrada in self._candidatos_contencion(termino_lower):
+                termino_glosario = self.entradas[id_entrada][0]
+                if id_entrada in puntuaciones or (compuesto and ' ' in termino_glosario):
+                    continue
+                ratio = len(termino_lower) / len(termino_glosario)
+                if ratio >= 0.6:
+                    puntuaciones[id_entrada] = 60
+                elif ratio >= 0.4:
+                    puntuaciones[id_entrada] = 40
+
+            # El término del glosario está contenido en la búsqueda (ratio >= 0.6)
+            longitud = len(termino_lower)
+            longitud_minima = -(-longitud * 3 // 5)  # ceil(0.6 * longitud)
+            for largo in range(longitud_minima, longitud):
+                for inicio in range(longitud - largo + 1):
+                    for id_entrada in self.exactos.get(termino_lower[inicio:inicio + largo], ()):
+                        termino_glosario = self.entradas[id_entrada][0]
+                        if id_entrada in puntuaciones or (compuesto and ' ' in termino_glosario):
+                            continue
+                        puntuaciones[id_entrada] = 50
+
+        return puntuaciones
+
+    def buscar(self, termino):
+        """Busca definiciones para un término con los mismos criterios de confianza del glosario"""
+        if not self.entradas:
+            return None
+
+        termino_lower = termino.lower().strip()
+        if not termino_lower:
+            return None
+
+        puntuaciones = self._puntuar(termino_lower)
+        if not puntuaciones:
+            return None
+
+        # Mismo orden que el recorrido del archivo: confianza descendente, luego posición
+        coincidencias_candidatas = sorted(
+            ((confianza, self.entradas[id_entrada][1], self.entradas[id_entrada][0], id_entrada)
+             for id_entrada, confianza in puntuaciones.items()),
+            key=lambda x: (-x[0], x[3])
+        )
+
+        # PRIORIDAD ESPECIAL: Si hay términos compuestos con confianza >=95, devolver solo esos
+        if coincidencias_candidatas[0][0] >= 95:
+            return [coincidencias_candidatas[0][1]]
+
+        # Si la mejor coincidencia tiene alta confianza (>=90), priorizar términos compuestos
+        if coincidencias_candidatas[0][0] >= 90:
+            mejores_compuestos = [c for c in coincidencias_candidatas if c[0] >= 90 and ' ' in c[2]]
+            if mejores_compuestos:
+                return [mejores_compuestos[0][1]]
+            return [coincidencias_candidatas[0][1]]
+
+        # Si no, devolver las mejores coincidencias (máximo 3)
+        mejores_coincidencias = [
+            definicion for confianza, definicion, _, _ in coincidencias_candidatas[:3]
+            if confianza >= 40
+        ]
+        return mejores_coincidencias if mejores_coincidencias else None
+
+
+def normalizar_texto(texto):
+    """Minúsculas y sin acentos, para comparar 'calificación' con 'calificacion'"""
+    texto = unicodedata.normalize('NFD', texto.lower())
+    return ''.join(c for c in texto if unicodedata.category(c) != 'Mn')
+
+
+def tokenizar(texto, longitud_minima=4):
+    """Divide el texto normalizado en palabras significativas (más de 3 letras por defecto)"""
+    return [t for t in PATRON_PALABRA.findall(normalizar_texto(texto)) if len(t) >= longitud_minima]
+
+
+# Palabras que se quitan del inicio de un término extraído de la pregunta ('qué es un permiso' → 'permiso')
+PALABRAS_ELIMINAR_TERMINO = ['qué es', 'que es', 'significa', 'es', 'un', 'una', 'el', 'la', 'los', 'las']
+
+# Palabras sin contenido para comparar preguntas: las de PALABRAS_ELIMINAR_TERMINO más
+# artículos, preposiciones, conjunciones y fórmulas de cortesía. Los interrogativos
+# ('que', 'como', 'cuales') y 'no' se conservan porque cambian lo que se pregunta.
+PALABRAS_VACIAS = {normalizar_texto(palabra) for palabra in PALABRAS_ELIMINAR_TERMINO if ' ' not in palabra} | {
+    'unos', 'unas', 'lo', 'al', 'del', 'de', 'en', 'a', 'por', 'para', 'con', 'sin', 'sobre', 'entre',
+    'y', 'e', 'o', 'u', 'se', 'me', 'mi', 'nos', 'le', 'les', 'su', 'sus', 'este', 'esta', 'esto',
+    'ese', 'esa', 'eso', 'son', 'hay', 'ser', 'favor', 'gracias', 'hola', 'buenos', 'buenas', 'dias',
+    'tardes', 'noches', 'porfa', 'porfavor', 'podrias', 'puedes', 'podria', 'puede', 'quisiera',
+    'quiero', 'gustaria', 'saber', 'dime', 'decir', 'explicar', 'ayuda', 'ayudar', 'usted', 'tu',
+}
+
+
+def terminos_pregunta(texto):
+    """Palabras de contenido de la pregunta, sin acentos, sin palabras vacías y en singular aproximado"""
+    terminos = []
+    for palabra in PATRON_PALABRA.findall(normalizar_texto(texto)):
+        if palabra in PALABRAS_VACIAS:
+            continue
+        if len(palabra) > 4 and palabra.endswith('es') and not palabra.endswith('ces'):
+            palabra = palabra[:-2]
+        elif len(palabra) > 3 and palabra.endswith('s'):
+            palabra = palabra[:-1]
+        terminos.append(palabra)
+    return terminos
+
+
+class IndicePasajes:
+    """Índice BM25 de pasajes de tamaño fijo sobre un documento largo
+
+    Los pasajes se alinean a las líneas del texto y nunca cruzan un límite
+    'FRAGMENTO N', de modo que cada resultado pertenece a un solo fragmento.
+    Solo se guardan posiciones (inicio, fin) sobre el texto original.
+    """
+
+    K1 = 1.5
+    B = 0.75
+
+    def __init__(self, texto, caracteres_por_pasaje=1000):
+        self.texto = texto
+        # Pasajes: (inicio, fin, id_fragmento)
+        self.pasajes = []
+        # Encabezado 'FRAGMENTO N' de cada fragmento (o '' si no hay)
+        self.encabezados = []
+        # token → [(id_pasaje, frecuencia)]
+        self.postings = {}
+        self.longitudes = []
+        self.longitud_promedio = 0.0
+        self._construir(caracteres_por_pasaje)
+
+    @classmethod
+    def desde_datos(cls, texto, pasajes, encabezados, postings, longitudes, longitud_promedio):
+        """Índice con pasajes y postings ya calculados (p. ej. leídos del paquete de corpus)"""
+        indice = cls.__new__(cls)
+        indice.texto = texto
+        indice.pasajes = pasajes
+        indice.encabezados = encabezados
+        indice.postings = postings
+        indice.longitudes = longitudes
+        indice.longitud_promedio = longitud_promedio
+        return indice
+
+    def __len__(self):
+        return len(self.pasajes)
+
+    def _construir(self, caracteres_por_pasaje):
+        posicion = 0
+        id_fragmento = -1
+        inicio_pasaje = None
+
+        def cerrar_pasaje(fin):
+            if inicio_pasaje is not None and self.texto[inicio_pasaje:fin].strip():
+                self.pasajes.append((inicio_pasaje, fin, max(id_fragmento, 0)))
+
+        for linea in self.texto.splitlines(keepends=True):
+            es_encabezado = PATRON_FRAGMENTO.match(linea.strip()) is not None
+            if es_encabezado or id_fragmento < 0:
+                # Nuevo fragmento: cerrar el pasaje en curso
+                cerrar_pasaje(posicion)
+                id_fragmento += 1
+                self.encabezados.append(linea.strip() if es_encabezado else '')
+                inicio_pasaje = posicion
+            elif posicion - inicio_pasaje >= caracteres_por_pasaje:
+                cerrar_pasaje(posicion)
+                inicio_pasaje = posicion
+            posicion += len(linea)
+        cerrar_pasaje(posicion)
+        self._indexar_pasajes()
+
+    def _indexar_pasajes(self):
+        for id_pasaje, (inicio, fin, _) in enumerate(self.pasajes):
+            frecuencias = {}
+            tokens = tokenizar(self.texto[inicio:fin])
+            for token in tokens:
+                frecuencias[token] = frecuencias.get(token, 0) + 1
+            for token, frecuencia in frecuencias.items():
+                self.postings.setdefault(token, []).append((id_pasaje, frecuencia))
+            self.longitudes.append(len(tokens))
+
+        if self.longitudes:
+            self.longitud_promedio = sum(self.longitudes) / len(self.longitudes) or 1.0
+
+    def puntuar(self, pregunta):
+        """Puntuación BM25 de cada pasaje que contiene alguna palabra de la pregunta"""
+        total = len(self.pasajes)
+        puntuaciones = {}
+        for token in set(tokenizar(pregunta)):
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for id_pasaje, frecuencia in postings:
+                norma = self.K1 * (1 - self.B + self.B * self.longitudes[id_pasaje] / self.longitud_promedio)
+                puntuaciones[id_pasaje] = puntuaciones.get(id_pasaje, 0.0) + idf * frecuencia * (self.K1 + 1) / (frecuencia + norma)
+        return puntuaciones
+
+    def buscar(self, pregunta, top_k=2, max_chars=8000, contexto=1):
+        """Devuelve hasta top_k pasajes no solapados, ordenados por relevancia
+
+        Cada acierto se amplía con `contexto` pasajes vecinos del mismo
+        fragmento y los tramos que se solapan se fusionan en uno solo.
+        """
+        puntuaciones = self.puntuar(pregunta)
+        if not puntuaciones:
+            return []
+
+        # Tramos [primer_pasaje, ultimo_pasaje] con la mejor puntuación que contienen
+        tramos = []
+        for id_pasaje, puntuacion in puntuaciones.items():
+            fragmento = self.pasajes[id_pasaje][2]
+            primero = id_pasaje
+            while primero > 0 and id_pasaje - primero < contexto and self.pasajes[primero - 1][2] == fragmento:
+                primero -= 1
+            ultimo = id_pasaje
+            while (ultimo + 1 < len(self.pasajes) and ultimo - id_pasaje < contexto
+                   and self.pasajes[ultimo + 1][2] == fragmento):
+                ultimo += 1
+            tramos.append([primero, ultimo, puntuacion])
+
+        # Fusionar tramos solapados o contiguos dentro del mismo fragmento
+        tramos.sort()
+        fusionados = []
+        for tramo in tramos:
+            if (fusionados and tramo[0] <= fusionados[-1][1] + 1
+                    and self.pasajes[tramo[0]][2] == self.pasajes[fusionados[-1][1]][2]):
+                fusionados[-1][1] = max(fusionados[-1][1], tramo[1])
+                fusionados[-1][2] = max(fusionados[-1][2], tramo[2])
+            else:
+                fusionados.append(tramo)
+
+        fusionados.sort(key=lambda t: t[2], reverse=True)
+        resultados = []
+        restante = max_chars
+        for primero, ultimo, _ in fusionados[:top_k]:
+            inicio = self.pasajes[primero][0]
+            fin = self.pasajes[ultimo][1]
+            texto = self.texto[inicio:fin].strip()
+            encabezado = self.encabezados[self.pasajes[primero][2]]
+            if encabezado and not texto.startswith(encabezado):
+                texto = f"{encabezado}\n{texto}"
+            if len(texto) > restante:
+                texto = texto[:restante]
+            if texto:
+                resultados.append(texto)
+            restante -= len(texto)
+            if restante <= 0:
+                break
+        return resultados
+
+
+def seccion_contiene(a, b):
+    """True si la sección a es b o la contiene ('10.1.4' contiene '10.1.4.2')"""
+    return a == b or b.startswith(a + '.')
+
+
+class IndiceSecciones(IndicePasajes):
+    """Índice de un tomo dividido por secciones en lugar de pasajes de tamaño fijo
+
+    Cada pasaje es una sección completa: un título enmarcado por líneas de
+    '=' o un encabezado 'SECCIÓN 10.1.4.1 - ...'. Además del BM25 heredado,
+    guarda los números de sección de cada encabezado y los títulos que el
+    texto da a cada número ('Regla 10.1.1: Criterios de elegibilidad'), de
+    modo que una sección citada por número se encuentra aunque su encabezado
+    solo tenga el título.
+    """
+
+    def __init__(self, texto):
+        super().__init__(texto)
+
+    def _construir(self, caracteres_por_pasaje):
+        # Números de sección de cada encabezado y título de cada número citado en el texto
+        self.numeros_encabezado = []
+        self.titulos = {}
+        lineas = self.texto.splitlines(keepends=True)
+        desplazamientos = [0]
+        for linea in lineas:
+            desplazamientos.append(desplazamientos[-1] + len(linea))
+
+        def es_separadora(i):
+            return 0 <= i < len(lineas) and PATRON_LINEA_SEPARADORA.match(lineas[i].strip()) is not None
+
+        inicios = []
+        for i, linea in enumerate(lineas):
+            limpia = linea.strip()
+            for numero, titulo in PATRON_TITULO_SECCION.findall(limpia):
+                self.titulos.setdefault(numero, titulo.strip())
+            if limpia and not es_separadora(i) and es_separadora(i - 1) and es_separadora(i + 1):
+                inicios.append((i - 1, limpia))
+            elif PATRON_ENCABEZADO_SECCION.match(limpia):
+                inicios.append((i, limpia))
+        if not inicios or inicios[0][0] > 0:
+            inicios.insert(0, (0, ''))
+
+        for id_seccion, (linea_inicio, titulo) in enumerate(inicios):
+            linea_fin = inicios[id_seccion + 1][0] if id_seccion + 1 < len(inicios) else len(lineas)
+            inicio, fin = desplazamientos[linea_inicio], desplazamientos[linea_fin]
+            if not self.texto[inicio:fin].strip('=\n\t '):
+                continue
+            self.pasajes.append((inicio, fin, len(self.encabezados)))
+            self.encabezados.append(titulo)
+            self.numeros_encabezado.append(set(PATRON_NUMERO_SECCION.findall(titulo)))
+        self._indexar_pasajes()
+
+    def texto_seccion(self, id_seccion):
+        inicio, fin, _ = self.pasajes[id_seccion]
+        lineas = self.texto[inicio:fin].strip().splitlines()
+        return '\n'.join(linea for linea in lineas if not PATRON_LINEA_SEPARADORA.match(linea.strip())).strip()
+
+    def seleccionar(self, pregunta, citadas=(), max_tokens=1500):
+        """Texto de las secciones relevantes para la pregunta dentro de max_tokens
+
+        Primero van las secciones que contienen un número citado (en la pregunta
+        o en `citadas`), por su número o por el título que el texto le da;
+        después sus subsecciones y luego las demás por BM25. La consulta se
+        amplía con esos títulos. Las secciones elegidas se devuelven en el
+        orden del documento.
+        """
+        numeros = set(citadas) | set(PATRON_NUMERO_SECCION.findall(pregunta))
+        # Títulos de las secciones que contienen un número citado (nivel 2) o que este contiene (nivel 1)
+        titulos = {}
+        for numero in numeros:
+            for citado, titulo in self.titulos.items():
+                if seccion_contiene(citado, numero):
+                    titulos[normalizar_texto(titulo)] = 2
+                elif seccion_contiene(numero, citado):
+                    titulos.setdefault(normalizar_texto(titulo), 1)
+        puntuaciones = self.puntuar(' '.join([pregunta] + list(titulos)))
+
+        candidatas = []
+        for id_seccion in range(len(self.pasajes)):
+            encabezado = normalizar_texto(self.encabezados[id_seccion])
+            niveles = [0]
+            for numero in numeros:
+                for propio in self.numeros_encabezado[id_seccion]:
+                    if seccion_contiene(propio, numero):
+                        niveles.append(2)
+                    elif seccion_contiene(numero, propio):
+                        niveles.append(1)
+            niveles.extend(nivel for titulo, nivel in titulos.items() if titulo in encabezado)
+            nivel = max(niveles)
+            puntuacion = puntuaciones.get(id_seccion, 0.0)
+            if nivel or puntuacion > 0:
+                candidatas.append((nivel, puntuacion, id_seccion))
+        candidatas.sort(reverse=True)
+
+        restante = max_tokens * CARACTERES_POR_TOKEN
+        elegidas = {}
+        for _, _, id_seccion in candidatas:
+            texto = self.texto_seccion(id_seccion)
+            if len(texto) > restante:
+                if elegidas:
+                    continue
+                texto = texto[:restante]
+            elegidas[id_seccion] = texto
+            restante -= len(texto)
+            if restante <= 0:
+                break
+        return '\n\n'.join(elegidas[id_seccion] for id_seccion in sorted(elegidas))
+
+
+class IndiceVectorial:
+    """Matriz TF-IDF dispersa sobre los pasajes de varios documentos
+
+    Reutiliza los pasajes y postings de un IndicePasajes por documento (sin
+    volver a tokenizar). Cada fila es un pasaje con pesos (1 + log tf) · idf
+    normalizados a norma 1; las columnas se guardan comprimidas (CSC) en
+    arreglos de NumPy. Puntuar una pregunta es un solo producto
+    matriz-vector disperso: la similitud coseno de cada pasaje de todos los
+    documentos a la vez.
+    """
+
+    def __init__(self, documentos):
+        # documentos: {nombre: IndicePasajes}
+        self.documentos = documentos
+        # Fila → (nombre del documento, id del pasaje en su índice)
+        self.pasajes = []
+        self.vocabulario = {}
+        filas, columnas, frecuencias = [], [], []
+        for nombre, indice in documentos.items():
+            base = len(self.pasajes)
+            for token, postings in indice.postings.items():
+                columna = self.vocabulario.setdefault(token, len(self.vocabulario))
+                for id_pasaje, frecuencia in postings:
+                    filas.append(base + id_pasaje)
+                    columnas.append(columna)
+                    frecuencias.append(frecuencia)
+            self.pasajes.extend((nombre, id_pasaje) for id_pasaje in range(len(indice)))
+
+        filas = np.asarray(filas, dtype=np.int32)
+        columnas = np.asarray(columnas, dtype=np.int32)
+        total = max(len(self.pasajes), 1)
+        frecuencia_documental = np.bincount(columnas, minlength=len(self.vocabulario))
+        self.idf = np.log((1 + total) / (1 + frecuencia_documental)) + 1.0
+
+        pesos = (1.0 + np.log(np.asarray(frecuencias, dtype=np.float64))) * self.idf[columnas]
+        normas = np.sqrt(np.bincount(filas, weights=pesos * pesos, minlength=len(self.pasajes)))
+        pesos /= normas[filas]
+
+        orden = np.argsort(columnas, kind='stable')
+        self.filas = filas[orden]
+        self.pesos = pesos[orden]
+        self.punteros = np.zeros(len(self.vocabulario) + 1, dtype=np.int64)
+        np.cumsum(frecuencia_documental, out=self.punteros[1:])
+
+    def __len__(self):
+        return len(self.pasajes)
+
+    def puntuar(self, pregunta):
+        """Similitud de la pregunta con cada pasaje (arreglo de len(self) puntuaciones)"""
+        frecuencias = {}
+        for token in tokenizar(pregunta):
+            columna = self.vocabulario.get(token)
+            if columna is not None:
+                frecuencias[columna] = frecuencias.get(columna, 0) + 1
+        if not frecuencias:
+            return np.zeros(len(self.pasajes))
+
+        columnas = np.fromiter(frecuencias, dtype=np.int64, count=len(frecuencias))
+        pesos_pregunta = (1.0 + np.log(np.fromiter(frecuencias.values(), dtype=np.float64))) * self.idf[columnas]
+        pesos_pregunta /= np.linalg.norm(pesos_pregunta)
+        inicios, fines = self.punteros[columnas], self.punteros[columnas + 1]
+        tramos = [slice(inicio, fin) for inicio, fin in zip(inicios, fines)]
+        filas = np.concatenate([self.filas[tramo] for tramo in tramos])
+        pesos = np.concatenate([self.pesos[tramo] * peso for tramo, peso in zip(tramos, pesos_pregunta)])
+        return np.bincount(filas, weights=pesos, minlength=len(self.pasajes))
+
+    def buscar(self, pregunta, top_k=8):
+        """Mejores pasajes de todos los documentos: [(puntuación, nombre, id_pasaje)]"""
+        puntuaciones = self.puntuar(pregunta)
+        candidatos = np.flatnonzero(puntuaciones > 0)
+        if len(candidatos) > top_k:
+            candidatos = candidatos[np.argpartition(-puntuaciones[candidatos], top_k - 1)[:top_k]]
+        candidatos = candidatos[np.argsort(-puntuaciones[candidatos], kind='stable')]
+        return [(float(puntuaciones[fila]),) + self.pasajes[fila] for fila in candidatos]
+
+    def buscar_por_documento(self, pregunta, max_documentos=2, top_k=8, max_chars=8000):
+        """Texto de los mejores pasajes agrupado por documento: [(nombre, texto)]
+
+        Los documentos se ordenan por su mejor pasaje; dentro de cada uno los
+        pasajes se unen en el orden del documento hasta max_chars.
+        """
+        por_documento = {}
+        for _, nombre, id_pasaje in self.buscar(pregunta, top_k):
+            if nombre in por_documento or len(por_documento) < max_documentos:
+                por_documento.setdefault(nombre, []).append(id_pasaje)
+
+        resultados = []
+        for nombre, ids in por_documento.items():
+            indice = self.documentos[nombre]
+            partes = []
+            restante = max_chars
+            for id_pasaje in sorted(ids):
+                inicio, fin, _ = indice.pasajes[id_pasaje]
+                texto = indice.texto[inicio:fin].strip()[:restante]
+                partes.append(texto)
+                restante -= len(texto)
+                if restante <= 0:
+                    break
+            resultados.append((nombre, '\n\n'.join(partes)))
+        return resultados
+
+
+# Índices de los documentos completos registrados al arrancar (clave → índice); nunca se expulsan
+_indices_registrados = {}
+# Índices construidos bajo demanda para otros contenidos largos (extractos armados para una
+# pregunta), por (clave, hash del contenido) y con expulsión LRU
+MAX_INDICES_PASAJES = 64
+_indices_pasajes = OrderedDict()
+_lock_indices_pasajes = threading.Lock()
+
+
+def registrar_indice_pasajes(clave, indice):
+    """Registra el índice de un documento completo para que obtener_indice_pasajes lo reutilice"""
+    _indices_registrados[clave] = indice
+
+
+def obtener_indice_pasajes(contenido, clave):
+    """Devuelve el índice de pasajes de `contenido`, construyéndolo una sola vez por contenido
+
+    Si `contenido` es el documento registrado con esa clave se usa su índice; un
+    extracto distinto tiene su propio índice y no reemplaza al registrado.
+    """
+    registrado = _indices_registrados.get(clave)
+    if registrado is not None and registrado.texto == contenido:
+        return registrado
+    clave_contenido = (clave, hash(contenido))
+    with _lock_indices_pasajes:
+        indice = _indices_pasajes.get(clave_contenido)
+        if indice is not None and indice.texto == contenido:
+            _indices_pasajes.move_to_end(clave_contenido)
+            return indice
+    indice = IndicePasajes(contenido)
+    with _lock_indices_pasajes:
+        _indices_pasajes[clave_contenido] = indice
+        while len(_indices_pasajes) > MAX_INDICES_PASAJES:
+            _indices_pasajes.popitem(last=False)
+    return indice
@@ -0,0 +1,271 @@
+"""
+Métricas de latencia, tokens y cachés en formato Prometheus
+Sin dependencias externas: contadores, histogramas e indicadores con
+etiquetas, expuestos como texto en /metrics.
+
+- medir(etapa): histograma de duración por etapa del pipeline
+- registrar_llamada_llm(...): lo usa la pasarela de cliente_llm.py para
+  medir cada llamada a chat.completions por sitio de llamada (función que
+  la hace) y modelo: tiempo, tokens de prompt y de respuesta y errores
+- registrar_cache(nombre, funcion): aciertos/fallos leídos al exportar
+- peticion(ruta): agrupa las etapas de una petición para la cabecera
+  Server-Timing
+
+Cada worker de gunicorn publica su instantánea en un directorio compartido
+y /metrics suma las de todos, así el resultado no depende de qué worker
+atienda la petición.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+DEFINICIONES = {
+    'betaia_peticion_segundos': ('histogram', 'Duración total de las peticiones por ruta'),
+    'betaia_etapa_segundos': ('histogram', 'Duración de cada etapa del pipeline de /chat'),
+    'betaia_fuentes_omitidas_total': ('counter', 'Fuentes que excedieron su tiempo límite'),
+    'betaia_llm_segundos': ('histogram', 'Duración de las llamadas a chat.completions por sitio y modelo'),
+    'betaia_llm_llamadas_total': ('counter', 'Llamadas a chat.completions por sitio, modelo y resultado'),
+    'betaia_llm_tokens_total': ('counter', 'Tokens consumidos por sitio, modelo y tipo (prompt/completion)'),
+    'betaia_llm_en_curso': ('gauge', 'Llamadas a chat.completions en curso'),
+    'betaia_llm_reintentos_total': ('counter', 'Reintentos de chat.completions por sitio y motivo (estado HTTP, timeout, conexión)'),
+    'betaia_llm_espera_cupo_segundos': ('histogram', 'Espera por un cupo de llamada al modelo en el worker'),
+    'betaia_llm_en_espera': ('gauge', 'Llamadas al modelo esperando cupo en la cola del gobernador'),
+    'betaia_vuelo_unico_total': ('counter', 'Trabajos con el modelo por etapa: ejecutados (lider) o compartidos (seguidor/reciente/sin_esperar)'),
+    'betaia_llm_rechazadas_total': ('counter', 'Preguntas rechazadas por saturación del modelo (cola llena o espera agotada)'),
+    'betaia_cache_total': ('counter', 'Consultas a cachés internas por resultado (acierto/fallo)'),
+    'betaia_cache_segundos_ahorrados_total': ('counter', 'Segundos de generación evitados por aciertos de caché'),
+    'betaia_pipeline_legal_total': ('counter', 'Preguntas legales respondidas por modo de pipeline (extraccion/directo)'),
+    'betaia_respuestas_preparadas_total': ('counter', 'Preguntas respondidas con una respuesta preparada, por fuente (tomo/resumen/general)'),
+    'betaia_chat_no_modificadas_total': ('counter', 'Respuestas 304 de /chat a recursos que el cliente ya tenía, antes o después de construirlas'),
+    'betaia_chat_comprimidas_total': ('counter', 'Cuerpos de /chat enviados comprimidos, por codificación'),
+    'betaia_chat_bytes_ahorrados_total': ('counter', 'Bytes de /chat que la compresión dejó de enviar'),
+}
+
+
+def _clave(nombre, etiquetas):
+    return (nombre, tuple(sorted(etiquetas.items())))
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _formatear_etiquetas(etiquetas, extra=None):
+    pares = list(etiquetas) + ([extra] if extra else [])
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{k}="{_escapar(v)}"' for k, v in pares) + '}'
+
+
+class TiemposPeticion:
+    """Etapas medidas durante una petición, para la cabecera Server-Timing"""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.etapas = []
+
+    def agregar(self, nombre, segundos):
+        self.etapas.append((nombre, segundos))
+
+    def server_timing(self):
+        partes = [f'{nombre};dur={segundos * 1000:.1f}' for nombre, segundos in self.etapas]
+        partes.append(f'total;dur={(time.perf_counter() - self.inicio) * 1000:.1f}')
+        return ', '.join(partes)
+
+
+class Metricas:
+    """Registro de métricas del proceso con publicación para los demás workers"""
+
+    def __init__(self, intervalo_publicacion=5):
+        self.directorio = None
+        self.intervalo_publicacion = intervalo_publicacion
+        self._lock = threading.Lock()
+        self._contadores = {}
+        self._indicadores = {}
+        self._histogramas = {}
+        self._caches = {}
+        self._local = threading.local()
+
+    def iniciar_publicacion(self, directorio):
+        """Publica periódicamente la instantánea de este proceso en `directorio`"""
+        os.makedirs(directorio, exist_ok=True)
+        self.directorio = directorio
+        threading.Thread(target=self._publicar_en_fondo, daemon=True, name="metricas").start()
+        atexit.register(self.publicar)
+
+    # --- Primitivas ---
+
+    def incrementar(self, nombre, valor=1, **etiquetas):
+        clave = _clave(nombre, etiquetas)
+        with self._lock:
+            self._contadores[clave] = self._contadores.get(clave, 0) + valor
+
+    def ajustar_indicador(self, nombre, delta, **etiquetas):
+        clave = _clave(nombre, etiquetas)
+        with self._lock:
+            self._indicadores[clave] = self._indicadores.get(clave, 0) + delta
+
+    def observar(self, nombre, valor, **etiquetas):
+        clave = _clave(nombre, etiquetas)
+        with self._lock:
+            cubetas = self._histogramas.get(clave)
+            if cubetas is None:
+                cubetas = self._histogramas[clave] = [0] * len(BUCKETS_SEGUNDOS) + [0.0, 0]
+            for i, limite in enumerate(BUCKETS_SEGUNDOS):
+                if valor <= limite:
+                    cubetas[i] += 1
+            cubetas[-2] += valor
+            cubetas[-1] += 1
+
+    def registrar_cache(self, nombre, funcion):
+        """`funcion()` devuelve (aciertos, fallos) acumulados de la caché `nombre`"""
+        self._caches[nombre] = funcion
+
+    # --- Etapas y peticiones ---
+
+    @contextmanager
+    def peticion(self, ruta):
+        """Mide una petición completa y recoge sus etapas para Server-Timing"""
+        tiempos = TiemposPeticion()
+        anterior = getattr(self._local, 'tiempos', None)
+        self._local.tiempos = tiempos
+        try:
+            yield tiempos
+        finally:
+            self._local.tiempos = anterior
+            self.observar('betaia_peticion_segundos', time.perf_counter() - tiempos.inicio, ruta=ruta)
+
+    def registrar_etapa(self, etapa, segundos, nombre_timing=None):
+        self.observar('betaia_etapa_segundos', segundos, etapa=etapa)
+        tiempos = getattr(self._local, 'tiempos', None)
+        if tiempos is not None:
+            tiempos.agregar(nombre_timing or etapa, segundos)
+
+    @contextmanager
+    def medir(self, etapa):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.registrar_etapa(etapa, time.perf_counter() - inicio)
+
+    # --- Llamadas al modelo ---
+
+    def registrar_llamada_llm(self, sitio, modelo, segundos, uso, resultado):
+        self.observar('betaia_llm_segundos', segundos, sitio=sitio, modelo=modelo)
+        self.incrementar('betaia_llm_llamadas_total', sitio=sitio, modelo=modelo, resultado=resultado)
+        if uso is not None:
+            self.incrementar('betaia_llm_tokens_total', getattr(uso, 'prompt_tokens', 0) or 0,
+                             sitio=sitio, modelo=modelo, tipo='prompt')
+            self.incrementar('betaia_llm_tokens_total', getattr(uso, 'completion_tokens', 0) or 0,
+                             sitio=sitio, modelo=modelo, tipo='completion')
+        tiempos = getattr(self._local, 'tiempos', None)
+        if tiempos is not None:
+            tiempos.agregar(f'llm_{sitio}', segundos)
+
+    # --- Exportación ---
+
+    def instantanea(self):
+        with self._lock:
+            contadores = dict(self._contadores)
+            indicadores = dict(self._indicadores)
+            histogramas = {clave: list(cubetas) for clave, cubetas in self._histogramas.items()}
+        for nombre, funcion in self._caches.items():
+            aciertos, fallos = funcion()
+            contadores[_clave('betaia_cache_total', {'cache': nombre, 'resultado': 'acierto'})] = aciertos
+            contadores[_clave('betaia_cache_total', {'cache': nombre, 'resultado': 'fallo'})] = fallos
+        return {
+            'pid': os.getpid(),
+            'actualizado': time.time(),
+            'contadores': [[n, list(e), v] for (n, e), v in contadores.items()],
+            'indicadores': [[n, list(e), v] for (n, e), v in indicadores.items()],
+            'histogramas': [[n, list(e), v] for (n, e), v in histogramas.items()],
+        }
+
+    def _ruta_publicacion(self, pid):
+        return os.path.join(self.directorio, f"{pid}.json")
+
+    def publicar(self):
+        """Escribe la instantánea de este proceso para que la lean los demás workers"""
+        if not self.directorio:
+            return
+        ruta = self._ruta_publicacion(os.getpid())
+        temporal = ruta + '.tmp'
+        with open(temporal, 'w', encoding='utf-8') as archivo:
+            json.dump(self.instantanea(), archivo)
+        os.replace(temporal, ruta)
+
+    def _publicar_en_fondo(self):
+        while True:
+            time.sleep(self.intervalo_publicacion)
+            try:
+                self.publicar()
+            except Exception as e:
+                print(f"❌ Error publicando métricas: {e}")
+
+    def _instantaneas(self):
+        """La instantánea propia (al día) más las publicadas por los otros workers"""
+        propias = self.instantanea()
+        instantaneas = [propias]
+        if not self.directorio:
+            return instantaneas
+        # Los workers que dejaron de publicar (terminados o de un arranque anterior) no cuentan;
+        # para Prometheus equivale a un reinicio de sus contadores
+        vigencia = time.time() - 3 * self.intervalo_publicacion
+        for nombre in os.listdir(self.directorio):
+            if not nombre.endswith('.json') or nombre == f"{propias['pid']}.json":
+                continue
+            ruta = os.path.join(self.directorio, nombre)
+            try:
+                if os.path.getmtime(ruta) < vigencia:
+                    os.remove(ruta)
+                    continue
+                with open(ruta, encoding='utf-8') as archivo:
+                    instantaneas.append(json.load(archivo))
+            except (OSError, ValueError):
+                continue
+        return instantaneas
+
+    def texto_prometheus(self):
+        """Todas las métricas de todos los workers en formato de exposición de Prometheus"""
+        contadores, indicadores, histogramas = {}, {}, {}
+        for instantanea in self._instantaneas():
+            for nombre, etiquetas, valor in instantanea['contadores']:
+                clave = (nombre, tuple(map(tuple, etiquetas)))
+                contadores[clave] = contadores.get(clave, 0) + valor
+            for nombre, etiquetas, valor in instantanea['indicadores']:
+                clave = (nombre, tuple(map(tuple, etiquetas)))
+                indicadores[clave] = indicadores.get(clave, 0) + valor
+            for nombre, etiquetas, cubetas in instantanea['histogramas']:
+                clave = (nombre, tuple(map(tuple, etiquetas)))
+                acumuladas = histogramas.setdefault(clave, [0] * len(cubetas))
+                for i, valor in enumerate(cubetas):
+                    acumuladas[i] += valor
+
+        series = {}
+        for (nombre, etiquetas), valor in list(contadores.items()) + list(indicadores.items()):
+            series.setdefault(nombre, []).append((etiquetas, [f'{nombre}{_formatear_etiquetas(etiquetas)} {valor:g}']))
+        for (nombre, etiquetas), cubetas in histogramas.items():
+            lineas = [f'{nombre}_bucket{_formatear_etiquetas(etiquetas, ("le", f"{limite:g}"))} {cuenta}'
+                      for limite, cuenta in zip(BUCKETS_SEGUNDOS, cubetas)]
+            lineas.append(f'{nombre}_bucket{_formatear_etiquetas(etiquetas, ("le", "+Inf"))} {cubetas[-1]}')
+            lineas.append(f'{nombre}_sum{_formatear_etiquetas(etiquetas)} {cubetas[-2]:.6f}')
+            lineas.append(f'{nombre}_count{_formatear_etiquetas(etiquetas)} {cubetas[-1]}')
+            series.setdefault(nombre, []).append((etiquetas, lineas))
+
+        salida = []
+        for nombre, (tipo, ayuda) in DEFINICIONES.items():
+            if nombre in series:
+                salida.append(f'# HELP {nombre} {ayuda}')
+                salida.append(f'# TYPE {nombre} {tipo}')
+                for _, lineas in sorted(series[nombre]):
+                    salida.extend(lineas)
+        return '\n'.join(salida) + '\n'
+
+
+metricas = Metricas()
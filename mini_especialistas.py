@@ -3,12 +3,20 @@ ALTERNATIVA INTELIGENTE: Mini-Especialistas
 Solo para casos muy específicos que realmente lo necesitan
 """
 import re
-from openai import OpenAI
-import os
 from dotenv import load_dotenv
+from tablas_html import motor_tablas
+from cliente_llm import llm
+from paquete_corpus import corpus
+from enrutador import analizar_consulta
 
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+# Secciones del Tomo 10 que las respuestas de conservación histórica deben citar
+SECCIONES_CONSERVACION = ('10.1.1.1', '10.1.1.2', '10.1.4')
+# Tokens del Tomo 10 que se envían al modelo en el mini-especialista de conservación
+PRESUPUESTO_TOKENS_CONSERVACION = 1000
+# Cliente compartido con app.py (plazos, reintentos y cupo de la pasarela)
+client = llm
 
 class MiniEspecialistaConservacion:
     """Mini especialista SOLO para conservación histórica"""
@@ -16,29 +24,21 @@ class MiniEspecialistaConservacion:
     @staticmethod
     def es_mi_consulta(entrada):
         """Detecta si es específicamente sobre conservación histórica"""
-        entrada_lower = entrada.lower()
-        
-        # Palabras de ALTA PRECISIÓN - solo casos muy específicos
-        palabras_especificas = [
-            'sitio histórico', 'sitios históricos',
-            'designación histórica', 'nominación histórica',
-            'conservación histórica', 'patrimonio histórico',
-            'icp', 'instituto de cultura',
-            'sección 10.1.1', 'criterios históricos'
-        ]
-        
-        return any(palabra in entrada_lower for palabra in palabras_especificas)
+        # Palabras de ALTA PRECISIÓN (grupo 'conservacion_especifica' del enrutador)
+        return analizar_consulta(entrada).tiene('conservacion_especifica')
     
     @staticmethod
-    def procesar(entrada, tomo_10_contenido):
+    def procesar(entrada, indice_tomo_10):
         """Procesamiento ultra-específico para conservación"""
         try:
+            # Solo las secciones citadas y las que coinciden con la consulta, dentro del presupuesto
+            secciones = indice_tomo_10.seleccionar(entrada, SECCIONES_CONSERVACION, PRESUPUESTO_TOKENS_CONSERVACION)
             prompt_especifico = f"""Eres especialista en conservación histórica de Puerto Rico.
 
 CONSULTA ESPECÍFICA: {entrada}
 
 INFORMACIÓN TOMO 10:
-{tomo_10_contenido[:2000]}
+{secciones}
 
 INSTRUCCIONES:
 - Menciona secciones específicas (10.1.1.1, 10.1.1.2, 10.1.4)
@@ -71,28 +71,27 @@ class MiniEspecialistaTablas:
     @staticmethod
     def es_mi_consulta(entrada):
         """Detecta cualquier solicitud de tabla"""
-        entrada_lower = entrada.lower()
-        return 'tabla' in entrada_lower
+        return analizar_consulta(entrada).tiene('tabla')
     
     @staticmethod
     def procesar(entrada):
         """Procesa cualquier tipo de tabla según la solicitud"""
-        entrada_lower = entrada.lower()
+        consulta = analizar_consulta(entrada)
         
         # 1. TABLA DE CABIDA
-        if 'cabida' in entrada_lower:
-            return MiniEspecialistaTablas._generar_tabla_cabida(entrada)
+        if consulta.tiene('cabida'):
+            return MiniEspecialistaTablas._generar_tabla_cabida(consulta)
         
         # 2. TABLA DE CALIFICACIONES
-        elif 'calificaciones' in entrada_lower:
+        elif consulta.tiene('calificaciones'):
             return MiniEspecialistaTablas._generar_tabla_calificaciones()
         
         # 3. TABLA DE PERMISOS
-        elif 'permisos' in entrada_lower:
+        elif consulta.tiene('permisos'):
             return MiniEspecialistaTablas._generar_tabla_permisos()
         
         # 4. TABLA DE AGENCIAS
-        elif 'agencias' in entrada_lower:
+        elif consulta.tiene('agencias'):
             return MiniEspecialistaTablas._generar_tabla_agencias()
         
         # 5. MENÚ DE OPCIONES (cuando solo dice "tabla" o "generar tabla")
@@ -253,81 +252,25 @@ def limpiar_contenido_tabla(contenido):
     return '\n'.join(lineas_tabla) if lineas_tabla else None
 
 def convertir_tabla_a_html(texto):
-    """Convierte texto tabular a HTML - Función mejorada basada en app.py"""
-    # Limpiar texto
-    texto = texto.strip()
-    
-    # Eliminar líneas vacías
-    lineas = [l.strip() for l in texto.strip().split('\n') if l.strip()]
-    
-    if not lineas or len(lineas) < 2:
-        return f'<pre>{texto}</pre>'
-    
-    # Detectar tablas Markdown (con | al principio o fin de línea)
-    es_markdown = False
-    for l in lineas[:3]:
-        if l.strip().startswith('|') or l.strip().endswith('|'):
-            es_markdown = True
-            break
-    
-    # Limpiar líneas markdown
-    if es_markdown:
-        lineas_limpias = []
-        for l in lineas:
-            l = l.strip()
-            if l.startswith('|'):
-                l = l[1:]
-            if l.endswith('|'):
-                l = l[:-1]
-            # Ignorar líneas separadoras
-            if not re.match(r'^[\s\-:|\+]+$', l):
-                lineas_limpias.append(l)
-        if lineas_limpias:
-            lineas = lineas_limpias
-    
-    # Detectar delimitador
-    delimitadores = ['\t', ';', ',', '|']
-    delimitador = None
-    for d in delimitadores:
-        if any(d in l for l in lineas[:3]):
-            delimitador = d
-            break
-    
-    if not delimitador:
-        return f'<pre>{texto}</pre>'
-    
-    # Procesar filas
-    filas = []
-    max_celdas = 0
-    
-    for linea in lineas:
-        celdas = [c.strip() for c in linea.split(delimitador)]
-        if not any(c for c in celdas):
+    """Convierte texto tabular a HTML con el motor de tablas compartido con app.py"""
+    return motor_tablas.renderizar(texto, clases_por_tipo=False, espacios_multiples=False)
+
+def precalentar_tablas_especialista():
+    """Pre-renderiza las tablas fijas del especialista y las tablas de cabida de cada tomo"""
+    MiniEspecialistaTablas._generar_tabla_calificaciones()
+    MiniEspecialistaTablas._generar_tabla_permisos()
+    MiniEspecialistaTablas._generar_tabla_agencias()
+    MiniEspecialistaTablas._mostrar_menu_tablas()
+    MiniEspecialistaTablas._generar_tabla_cabida("tabla de cabida")
+    for tomo in range(1, 12):
+        archivo_tomo = f"data/RespuestasParaChatBot/RespuestasIA_Tomo{tomo}/TablaCabida_Tomo_{tomo}.txt"
+        try:
+            with open(archivo_tomo, 'r', encoding='utf-8') as f:
+                contenido_limpio = limpiar_contenido_tabla(f.read())
+        except FileNotFoundError:
             continue
-        filas.append(celdas)
-        max_celdas = max(max_celdas, len(celdas))
-    
-    # Normalizar longitud de filas
-    for i, fila in enumerate(filas):
-        if len(fila) < max_celdas:
-            filas[i] = fila + [''] * (max_celdas - len(fila))
-    
-    if not filas:
-        return f'<pre>{texto}</pre>'
-    
-    # Determinar encabezado y cuerpo
-    encabezado = filas[0]
-    cuerpo = filas[1:] if len(filas) > 1 else []
-    
-    # Crear HTML limpio sin espacios extras
-    html = '<div class="tabla-container"><table class="tabla-moderna">'
-    html += '<thead><tr>' + ''.join(f'<th>{col}</th>' for col in encabezado) + '</tr></thead>'
-    html += '<tbody>'
-    for fila in cuerpo:
-        html += '<tr>' + ''.join(f'<td>{celda}</td>' for celda in fila) + '</tr>'
-    html += '</tbody></table></div>'
-    
-    return html
+        if contenido_limpio:
+            convertir_tabla_a_html(contenido_limpio)
 
 def procesar_con_mini_especialistas(entrada):
     """
@@ -341,10 +284,10 @@ def procesar_con_mini_especialistas(entrada):
         print("🏛️ Usando mini-especialista: Conservación Histórica")
         
         try:
-            with open("data/Tomo_10_Conservacion_Historica.txt", 'r', encoding='utf-8') as f:
-                tomo_10_contenido = f.read()
+            # Mismo índice por secciones que usa app.py, construido desde el paquete de corpus
+            indice_tomo_10 = corpus.indice_secciones("tomo_10_conservacion")
             
-            resultado = MiniEspecialistaConservacion.procesar(entrada, tomo_10_contenido)
+            resultado = MiniEspecialistaConservacion.procesar(entrada, indice_tomo_10) if len(indice_tomo_10) else None
             if resultado:
                 return {
                     'usar_especialista': True,
@@ -375,10 +318,5 @@ def procesar_con_mini_especialistas(entrada):
 
 # Función para extraer número de tomo (helper)
 def extraer_numero_tomo(texto):
-    """Extrae número de tomo del texto"""
-    match = re.search(r'tomo\s*(\d+)|del\s+tomo\s*(\d+)', texto.lower())
-    if match:
-        for grupo in match.groups():
-            if grupo is not None:
-                return int(grupo)
-    return None
+    """Extrae número de tomo del texto (detectado una sola vez por el enrutador)"""
+    return analizar_consulta(texto).tomo
@@ -0,0 +1,416 @@
+"""
+Paquete de corpus preprocesado
+El comando build-corpus recorre una sola vez las fuentes de data/ (glosario,
+Reglamento de Emergencia JP-RP-41, Tomo 10 de Conservación Histórica y
+tomos 1-11) y escribe un único archivo binario con, por fuente:
+- el texto original en UTF-8
+- los pasajes BM25 alineados a 'FRAGMENTO N' con su número de fragmento,
+  secciones citadas y posiciones en caracteres y en bytes
+- los postings por token (pasaje, frecuencia) y la longitud de cada pasaje
+
+Formato: 'BETAIA01' + longitud del directorio (uint64) + directorio JSON +
+bloques alineados a 8 bytes. La aplicación proyecta el archivo con mmap al
+arrancar: las tablas de pasajes y postings se leen directamente de las
+páginas proyectadas, que los workers de gunicorn comparten a través de la
+caché del sistema operativo en lugar de reconstruirlas cada uno. El texto,
+en cambio, se decodifica a un str propio de cada worker (una vez por fuente).
+
+El paquete guarda el mtime y el tamaño de cada archivo de origen; si alguno
+cambió (o falta el paquete) se vuelve a leer el archivo original.
+
+Uso:
+    python paquete_corpus.py build-corpus [--datos data] [--salida data/corpus.pack]
+    flask --app app build-corpus
+"""
+import argparse
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import time
+from array import array
+
+from indices_busqueda import IndicePasajes, IndiceSecciones, normalizar_texto
+
+MAGICO = b'BETAIA01'
+VERSION_PAQUETE = 1
+ALINEACION = 8
+
+CARACTERES_POR_PASAJE = 1000
+
+# Fuente → (archivo dentro de data/, clave JSON de la que se toma el texto o None)
+FUENTES_CORPUS = {
+    'glosario': ('glosario.txt', None),
+    'reglamento_emergencia': ('reglamento_emergencia_jp41_chatbot_20250731_155845.json', 'analisis_completo'),
+    'division_ambiental': ('division_cumplimiento_ambiental.txt', None),
+    'tomo_10_conservacion': ('Tomo_10_Conservacion_Historica.txt', None),
+    **{f'tomo_{i}': (f'tomo_{i}.txt', None) for i in range(1, 12)},
+}
+
+# Columnas de la tabla de pasajes (uint32 por columna)
+COLUMNAS_PASAJE = ('inicio', 'fin', 'id_fragmento', 'numero_fragmento', 'inicio_byte', 'fin_byte')
+
+PATRON_NUMERO_FRAGMENTO = re.compile(r'FRAGMENTO\s+(\d+)')
+# Secciones y reglas citadas en un pasaje normalizado ('seccion 10.1.4.2', 'regla 10.1.1')
+PATRON_SECCION = re.compile(r'\b(?:seccion|regla)\s+(\d+(?:\.\d+)+)')
+
+
+def firma_archivo(ruta):
+    """(mtime_ns, tamaño) del archivo, o None si no existe"""
+    try:
+        estado = os.stat(ruta)
+    except OSError:
+        return None
+    return [estado.st_mtime_ns, estado.st_size]
+
+
+def leer_fuente(directorio_datos, fuente):
+    """Texto de una fuente leído del archivo original ('' si no existe)"""
+    archivo, clave_json = FUENTES_CORPUS[fuente]
+    ruta = os.path.join(directorio_datos, archivo)
+    if not os.path.exists(ruta):
+        return ''
+    with open(ruta, 'r', encoding='utf-8') as f:
+        if clave_json:
+            return json.load(f).get(clave_json, '')
+        return f.read()
+
+
+class _Escritor:
+    """Acumula bloques alineados y devuelve su (desplazamiento, longitud) relativo"""
+
+    def __init__(self):
+        self.partes = []
+        self.posicion = 0
+
+    def agregar(self, datos):
+        datos = bytes(datos)
+        desplazamiento = self.posicion
+        relleno = -len(datos) % ALINEACION
+        self.partes.append(datos + b'\0' * relleno)
+        self.posicion += len(datos) + relleno
+        return [desplazamiento, len(datos)]
+
+
+def _preprocesar_fuente(texto, escritor):
+    """Bloques y metadatos de una fuente para el directorio del paquete"""
+    texto_bytes = texto.encode('utf-8')
+    indice = IndicePasajes(texto, caracteres_por_pasaje=CARACTERES_POR_PASAJE)
+
+    # Posición en bytes de cada posición en caracteres usada por los pasajes
+    limites = sorted({p for inicio, fin, _ in indice.pasajes for p in (inicio, fin)})
+    bytes_por_caracter = {}
+    acumulado = 0
+    anterior = 0
+    for limite in limites:
+        acumulado += len(texto[anterior:limite].encode('utf-8'))
+        bytes_por_caracter[limite] = acumulado
+        anterior = limite
+
+    tabla_pasajes = array('I')
+    secciones = {}
+    for id_pasaje, (inicio, fin, id_fragmento) in enumerate(indice.pasajes):
+        numero = PATRON_NUMERO_FRAGMENTO.search(indice.encabezados[id_fragmento])
+        tabla_pasajes.extend((inicio, fin, id_fragmento, int(numero.group(1)) if numero else 0,
+                              bytes_por_caracter[inicio], bytes_por_caracter[fin]))
+        for seccion in PATRON_SECCION.findall(normalizar_texto(texto[inicio:fin])):
+            pasajes_seccion = secciones.setdefault(seccion, [])
+            if not pasajes_seccion or pasajes_seccion[-1] != id_pasaje:
+                pasajes_seccion.append(id_pasaje)
+
+    vocabulario = sorted(indice.postings)
+    inicios_postings = array('I', [0])
+    ids_postings = array('I')
+    frecuencias_postings = array('I')
+    for token in vocabulario:
+        for id_pasaje, frecuencia in indice.postings[token]:
+            ids_postings.append(id_pasaje)
+            frecuencias_postings.append(frecuencia)
+        inicios_postings.append(len(ids_postings))
+
+    return {
+        'caracteres': len(texto),
+        'longitud_promedio': indice.longitud_promedio,
+        'encabezados': indice.encabezados,
+        'vocabulario': vocabulario,
+        'secciones': secciones,
+        'bloques': {
+            'texto': escritor.agregar(texto_bytes),
+            'pasajes': escritor.agregar(tabla_pasajes.tobytes()),
+            'longitudes': escritor.agregar(array('I', indice.longitudes).tobytes()),
+            'postings_inicios': escritor.agregar(inicios_postings.tobytes()),
+            'postings_ids': escritor.agregar(ids_postings.tobytes()),
+            'postings_frecuencias': escritor.agregar(frecuencias_postings.tobytes()),
+        },
+    }
+
+
+def construir_paquete(directorio_datos, ruta_salida):
+    """Preprocesa todas las fuentes de FUENTES_CORPUS y escribe el paquete en ruta_salida"""
+    inicio = time.perf_counter()
+    escritor = _Escritor()
+    directorio = {
+        'version': VERSION_PAQUETE,
+        'orden_bytes': sys.byteorder,
+        'columnas_pasaje': COLUMNAS_PASAJE,
+        'caracteres_por_pasaje': CARACTERES_POR_PASAJE,
+        'construido': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        # Firma de todos los orígenes, también de los que faltan, para detectar cambios
+        'origenes': {},
+        'fuentes': {},
+    }
+    for fuente, (archivo, _) in FUENTES_CORPUS.items():
+        ruta = os.path.join(directorio_datos, archivo)
+        directorio['origenes'][fuente] = firma_archivo(ruta)
+        texto = leer_fuente(directorio_datos, fuente)
+        if texto:
+            directorio['fuentes'][fuente] = _preprocesar_fuente(texto, escritor)
+
+    datos_directorio = json.dumps(directorio, ensure_ascii=False).encode('utf-8')
+    cabecera = MAGICO + struct.pack('<Q', len(datos_directorio)) + datos_directorio
+    cabecera += b'\0' * (-len(cabecera) % ALINEACION)
+
+    # Escritura atómica: los workers que ya proyectaron el paquete anterior no lo ven truncado
+    os.makedirs(os.path.dirname(os.path.abspath(ruta_salida)), exist_ok=True)
+    temporal = f"{ruta_salida}.{os.getpid()}.tmp"
+    with open(temporal, 'wb') as f:
+        f.write(cabecera)
+        for parte in escritor.partes:
+            f.write(parte)
+    os.replace(temporal, ruta_salida)
+
+    return {
+        'fuentes': len(directorio['fuentes']),
+        'pasajes': sum(datos['bloques']['pasajes'][1] // (4 * len(COLUMNAS_PASAJE))
+                       for datos in directorio['fuentes'].values()),
+        'bytes': len(cabecera) + escritor.posicion,
+        'segundos': round(time.perf_counter() - inicio, 3),
+    }
+
+
+class _TablaPasajes:
+    """Vista de la tabla de pasajes proyectada: pasajes[i] → (inicio, fin, id_fragmento)"""
+
+    def __init__(self, columnas):
+        self._columnas = columnas
+        self._ancho = len(COLUMNAS_PASAJE)
+
+    def __len__(self):
+        return len(self._columnas) // self._ancho
+
+    def __getitem__(self, id_pasaje):
+        if id_pasaje < 0:
+            id_pasaje += len(self)
+        base = id_pasaje * self._ancho
+        return tuple(self._columnas[base:base + 3])
+
+    def fila(self, id_pasaje):
+        """Todas las columnas del pasaje como diccionario"""
+        base = id_pasaje * self._ancho
+        return dict(zip(COLUMNAS_PASAJE, self._columnas[base:base + self._ancho]))
+
+
+class _PostingsProyectados:
+    """Postings leídos del paquete: postings.get(token) → [(id_pasaje, frecuencia)]"""
+
+    def __init__(self, vocabulario, inicios, ids, frecuencias):
+        self._posiciones = {token: i for i, token in enumerate(vocabulario)}
+        self._inicios = inicios
+        self._ids = ids
+        self._frecuencias = frecuencias
+
+    def __len__(self):
+        return len(self._posiciones)
+
+    def __contains__(self, token):
+        return token in self._posiciones
+
+    def get(self, token, defecto=None):
+        posicion = self._posiciones.get(token)
+        if posicion is None:
+            return defecto
+        inicio, fin = self._inicios[posicion], self._inicios[posicion + 1]
+        return list(zip(self._ids[inicio:fin], self._frecuencias[inicio:fin]))
+
+    def items(self):
+        for token in self._posiciones:
+            yield token, self.get(token)
+
+
+class PaqueteCorpus:
+    """Paquete de corpus proyectado en memoria con mmap (solo lectura)"""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        with open(ruta, 'rb') as f:
+            self._mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._vista = memoryview(self._mapa)
+        if bytes(self._vista[:len(MAGICO)]) != MAGICO:
+            raise ValueError(f"{ruta} no es un paquete de corpus")
+        longitud, = struct.unpack_from('<Q', self._mapa, len(MAGICO))
+        inicio_directorio = len(MAGICO) + 8
+        self.directorio = json.loads(bytes(self._vista[inicio_directorio:inicio_directorio + longitud]))
+        if self.directorio.get('version') != VERSION_PAQUETE or self.directorio.get('orden_bytes') != sys.byteorder:
+            raise ValueError(f"{ruta} fue construido con otro formato; vuelve a ejecutar build-corpus")
+        self._base = inicio_directorio + longitud + (-(inicio_directorio + longitud) % ALINEACION)
+
+    def __contains__(self, fuente):
+        return fuente in self.directorio['fuentes']
+
+    def __len__(self):
+        return len(self._mapa)
+
+    def fuentes(self):
+        return list(self.directorio['fuentes'])
+
+    def bloque(self, fuente, nombre):
+        """memoryview sobre las páginas proyectadas de un bloque (sin copiar)"""
+        desplazamiento, longitud = self.directorio['fuentes'][fuente]['bloques'][nombre]
+        return self._vista[self._base + desplazamiento:self._base + desplazamiento + longitud]
+
+    def _enteros(self, fuente, nombre):
+        return self.bloque(fuente, nombre).cast('I')
+
+    def texto(self, fuente):
+        """Texto original de la fuente, decodificado a un str propio del proceso"""
+        return str(self.bloque(fuente, 'texto'), 'utf-8')
+
+    def desactualizadas(self, directorio_datos):
+        """Fuentes cuyo archivo de origen cambió desde que se construyó el paquete"""
+        return [fuente for fuente, (archivo, _) in FUENTES_CORPUS.items()
+                if firma_archivo(os.path.join(directorio_datos, archivo)) != self.directorio['origenes'].get(fuente)]
+
+    def pasajes(self, fuente):
+        return _TablaPasajes(self._enteros(fuente, 'pasajes'))
+
+    def secciones(self, fuente):
+        """Sección citada ('10.1.4.2') → ids de los pasajes que la mencionan"""
+        return self.directorio['fuentes'][fuente]['secciones']
+
+    def indice_pasajes(self, fuente, texto):
+        """IndicePasajes sobre `texto` con los pasajes y postings ya calculados en el paquete"""
+        datos = self.directorio['fuentes'][fuente]
+        postings = _PostingsProyectados(
+            datos['vocabulario'],
+            self._enteros(fuente, 'postings_inicios'),
+            self._enteros(fuente, 'postings_ids'),
+            self._enteros(fuente, 'postings_frecuencias'),
+        )
+        return IndicePasajes.desde_datos(
+            texto, self.pasajes(fuente), datos['encabezados'], postings,
+            self._enteros(fuente, 'longitudes'), datos['longitud_promedio'],
+        )
+
+
+class CorpusConocimiento:
+    """Textos de las fuentes de data/, servidos desde el paquete si está al día
+
+    Cada texto se decodifica una sola vez por worker y se comparte entre app.py
+    y los mini-especialistas del mismo proceso; entre workers solo se comparten
+    las páginas proyectadas de pasajes y postings. Si no hay paquete, o alguna
+    fuente cambió desde que se construyó, se lee el archivo original como antes.
+    """
+
+    def __init__(self, directorio_datos='data'):
+        self.directorio_datos = directorio_datos
+        self.paquete = None
+        self._textos = {}
+        self._indices = {}
+        self._lock = threading.Lock()
+
+    def abrir(self, ruta_paquete, directorio_datos=None):
+        """Proyecta el paquete de ruta_paquete; devuelve False si se usarán los archivos"""
+        if directorio_datos:
+            self.directorio_datos = directorio_datos
+        self.paquete = None
+        if not os.path.exists(ruta_paquete):
+            print(f"⚠️ Paquete de corpus no encontrado en {ruta_paquete}; se leen los archivos de {self.directorio_datos}"
+                  " (genéralo con 'flask --app app build-corpus')")
+            return False
+        try:
+            paquete = PaqueteCorpus(ruta_paquete)
+        except (OSError, ValueError) as e:
+            print(f"❌ Error abriendo paquete de corpus: {e}")
+            return False
+        desactualizadas = paquete.desactualizadas(self.directorio_datos)
+        if desactualizadas:
+            print(f"⚠️ Paquete de corpus desactualizado ({', '.join(desactualizadas)}); se leen los archivos originales")
+            return False
+        self.paquete = paquete
+        print(f"✅ Paquete de corpus proyectado: {len(paquete.fuentes())} fuentes, {len(paquete) // 1024} KB")
+        return True
+
+    def ruta_origen(self, fuente):
+        return os.path.join(self.directorio_datos, FUENTES_CORPUS[fuente][0])
+
+    def _obtener(self, clave, crear):
+        """Valor en caché de la clave; crear() se ejecuta fuera del lock (puede pedir otros textos)
+
+        Si dos hilos lo crean a la vez, ambos se quedan con el primero que se publicó.
+        """
+        valor = self._textos.get(clave)
+        if valor is None:
+            valor = crear()
+            with self._lock:
+                valor = self._textos.setdefault(clave, valor)
+        return valor
+
+    def texto(self, fuente):
+        """Texto original de la fuente ('' si no existe)"""
+        def cargar():
+            if self.paquete is not None:
+                return self.paquete.texto(fuente) if fuente in self.paquete else ''
+            try:
+                return leer_fuente(self.directorio_datos, fuente)
+            except Exception as e:
+                print(f"❌ Error cargando {self.ruta_origen(fuente)}: {e}")
+                return ''
+        return self._obtener(fuente, cargar)
+
+    def indice_pasajes(self, fuente):
+        """Índice BM25 de la fuente: leído del paquete o construido a partir del texto"""
+        indice = self._indices.get(fuente)
+        if indice is None:
+            texto = self.texto(fuente)
+            if self.paquete is not None and fuente in self.paquete:
+                indice = self.paquete.indice_pasajes(fuente, texto)
+            else:
+                indice = IndicePasajes(texto, caracteres_por_pasaje=CARACTERES_POR_PASAJE)
+            self._indices[fuente] = indice
+        return indice
+
+    def indice_secciones(self, fuente):
+        """Índice de la fuente por secciones numeradas, construido una sola vez"""
+        texto = self.texto(fuente)
+        return self._obtener((fuente, 'secciones'), lambda: IndiceSecciones(texto))
+
+    def estadisticas(self):
+        return {
+            'paquete': self.paquete.ruta if self.paquete is not None else None,
+            'bytes_proyectados': len(self.paquete) if self.paquete is not None else 0,
+            'fuentes_cargadas': len([clave for clave in self._textos if isinstance(clave, str)]),
+        }
+
+
+# Instancia compartida por app.py y los mini-especialistas
+corpus = CorpusConocimiento()
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description='Herramientas del corpus de BetaIA')
+    subcomandos = parser.add_subparsers(dest='comando', required=True)
+    construir = subcomandos.add_parser('build-corpus', help='Construye el paquete de corpus proyectable')
+    construir.add_argument('--datos', default='data', help='Directorio con las fuentes')
+    construir.add_argument('--salida', default=os.getenv('PAQUETE_CORPUS', os.path.join('data', 'corpus.pack')))
+    args = parser.parse_args(argumentos)
+
+    resumen = construir_paquete(args.datos, args.salida)
+    print(f"✅ Paquete de corpus escrito en {args.salida}: {resumen['fuentes']} fuentes, "
+          f"{resumen['pasajes']} pasajes, {resumen['bytes'] // 1024} KB en {resumen['segundos']}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+"""
+Recursos estáticos versionados
+'build-static' copia cada archivo de static/ a static/dist/ con la huella de su
+contenido en el nombre (css/simple.css -> css/simple.3f9a1c2b7d4e.css), junto con
+variantes precomprimidas .gz y .br de los formatos de texto, y escribe el manifiesto:
+
+    static/dist/manifest.json
+        {"version": 1, "recursos": {"css/simple.css": {
+            "ruta": "css/simple.3f9a1c2b7d4e.css", "huella": "3f9a1c2b7d4e",
+            "origen": [mtime_ns, tamaño], "codificaciones": ["br", "gzip"]}}}
+
+Las plantillas piden las URL con recurso('css/simple.css'). Como el nombre cambia
+con el contenido, esas URL se sirven con caché de un año 'immutable' y las visitas
+repetidas no vuelven a pedirlas. Si falta el manifiesto, o un archivo cambió desde
+la compilación, se usa la URL sin huella de /static/ (revalidada con ETag).
+
+Brotli es opcional: sin el módulo brotli solo se escriben las variantes .gz.
+"""
+import argparse
+import hashlib
+import json
+import mimetypes
+import os
+import threading
+import time
+
+from compresion_http import CODIFICACIONES_DISPONIBLES, EXTENSIONES_CODIFICACION, brotli, comprimir
+from paquete_corpus import firma_archivo
+
+VERSION_MANIFIESTO = 1
+NOMBRE_MANIFIESTO = 'manifest.json'
+DIRECTORIO_VERSIONADOS = 'dist'
+LONGITUD_HUELLA = 12
+# Formatos de texto que vale la pena precomprimir (las imágenes ya vienen comprimidas)
+EXTENSIONES_COMPRIMIBLES = {'.css', '.js', '.svg', '.ico', '.html', '.json', '.txt', '.map'}
+# Solo se guarda una variante si ahorra al menos este porcentaje del original
+AHORRO_MINIMO = 0.1
+
+
+def _huella(ruta):
+    digest = hashlib.sha256()
+    with open(ruta, 'rb') as archivo:
+        for bloque in iter(lambda: archivo.read(1 << 16), b''):
+            digest.update(bloque)
+    return digest.hexdigest()[:LONGITUD_HUELLA]
+
+
+def _nombre_versionado(nombre, huella):
+    base, extension = os.path.splitext(nombre)
+    return f"{base}.{huella}{extension}"
+
+
+def _escribir_atomico(ruta, datos):
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    with open(temporal, 'wb') as archivo:
+        archivo.write(datos)
+    os.replace(temporal, ruta)
+
+
+def _recursos_origen(directorio, excluido=None):
+    """(ruta relativa con '/', ruta) de cada archivo del directorio, sin la carpeta excluida"""
+    excluido = os.path.abspath(excluido) if excluido else None
+    for raiz, carpetas, archivos in os.walk(directorio):
+        carpetas[:] = sorted(c for c in carpetas if os.path.abspath(os.path.join(raiz, c)) != excluido)
+        for archivo in sorted(archivos):
+            if archivo.startswith('.'):
+                continue
+            ruta = os.path.join(raiz, archivo)
+            yield os.path.relpath(ruta, directorio).replace(os.sep, '/'), ruta
+
+
+def construir_recursos_estaticos(directorio_estatico, directorio_salida=None):
+    """Escribe las copias con huella, sus variantes comprimidas y el manifiesto; devuelve un resumen"""
+    inicio = time.perf_counter()
+    directorio_salida = directorio_salida or os.path.join(directorio_estatico, DIRECTORIO_VERSIONADOS)
+    codificaciones = list(CODIFICACIONES_DISPONIBLES)
+
+    recursos, escritos = {}, {NOMBRE_MANIFIESTO}
+    bytes_originales = bytes_comprimidos = 0
+    for nombre, ruta in _recursos_origen(directorio_estatico, directorio_salida):
+        origen = firma_archivo(ruta)
+        huella = _huella(ruta)
+        versionado = _nombre_versionado(nombre, huella)
+        destino = os.path.join(directorio_salida, versionado)
+        with open(ruta, 'rb') as archivo:
+            datos = archivo.read()
+        _escribir_atomico(destino, datos)
+        escritos.add(versionado)
+
+        disponibles, menor = [], len(datos)
+        if os.path.splitext(nombre)[1].lower() in EXTENSIONES_COMPRIMIBLES:
+            for codificacion in codificaciones:
+                comprimido = comprimir(datos, codificacion, nivel='maximo')
+                if len(comprimido) > len(datos) * (1 - AHORRO_MINIMO):
+                    continue
+                _escribir_atomico(destino + EXTENSIONES_CODIFICACION[codificacion], comprimido)
+                escritos.add(versionado + EXTENSIONES_CODIFICACION[codificacion])
+                disponibles.append(codificacion)
+                menor = min(menor, len(comprimido))
+            if disponibles:
+                bytes_originales += len(datos)
+                bytes_comprimidos += menor
+        recursos[nombre] = {'ruta': versionado, 'huella': huella, 'origen': origen,
+                            'codificaciones': disponibles}
+
+    manifiesto = {'version': VERSION_MANIFIESTO, 'recursos': recursos}
+    _escribir_atomico(os.path.join(directorio_salida, NOMBRE_MANIFIESTO),
+                      json.dumps(manifiesto, ensure_ascii=False, indent=1).encode('utf-8'))
+
+    # Copias de compilaciones anteriores que ya no aparecen en el manifiesto
+    eliminados = 0
+    for nombre, ruta in list(_recursos_origen(directorio_salida)):
+        if nombre not in escritos:
+            os.remove(ruta)
+            eliminados += 1
+
+    return {'recursos': len(recursos), 'comprimidos': sum(1 for r in recursos.values() if r['codificaciones']),
+            'codificaciones': codificaciones, 'bytes_texto': bytes_originales,
+            'bytes_texto_comprimidos': bytes_comprimidos, 'eliminados': eliminados,
+            'segundos': round(time.perf_counter() - inicio, 2)}
+
+
+class ManifiestoEstaticos:
+    """Manifiesto de 'build-static': URL con huella y variante comprimida de cada recurso
+
+    Cada intervalo_revalidacion segundos se comprueba que los archivos de static/
+    no cambiaron desde la compilación; un recurso modificado vuelve a servirse sin
+    huella hasta que se recompile.
+    """
+
+    def __init__(self, directorio_estatico, directorio_salida=None, intervalo_revalidacion=30.0):
+        self.directorio_estatico = directorio_estatico
+        self.directorio_salida = directorio_salida or os.path.join(directorio_estatico, DIRECTORIO_VERSIONADOS)
+        self.intervalo_revalidacion = intervalo_revalidacion
+        self._recursos = {}
+        self._por_ruta = {}
+        self._vigentes = {}
+        self._ultima_revalidacion = 0.0
+        self._lock = threading.Lock()
+        self.cargar()
+
+    def cargar(self):
+        """Lee el manifiesto; sin manifiesto (o de otra versión) todas las URL quedan sin huella"""
+        ruta = os.path.join(self.directorio_salida, NOMBRE_MANIFIESTO)
+        try:
+            with open(ruta, 'r', encoding='utf-8') as archivo:
+                manifiesto = json.load(archivo)
+        except (OSError, ValueError):
+            manifiesto = {}
+        if manifiesto.get('version') != VERSION_MANIFIESTO:
+            manifiesto = {}
+
+        recursos = {nombre: datos for nombre, datos in manifiesto.get('recursos', {}).items()
+                    if os.path.exists(os.path.join(self.directorio_salida, datos['ruta']))}
+        with self._lock:
+            self._recursos = recursos
+            self._por_ruta = {datos['ruta']: datos for datos in recursos.values()}
+            self._revalidar()
+        return len(recursos)
+
+    def _revalidar(self):
+        self._vigentes = {
+            nombre: datos['ruta'] for nombre, datos in self._recursos.items()
+            if firma_archivo(os.path.join(self.directorio_estatico, nombre)) == datos['origen']
+        }
+        self._ultima_revalidacion = time.monotonic()
+
+    def __len__(self):
+        return len(self._vigentes)
+
+    def ruta(self, nombre):
+        """Ruta con huella del recurso, o None si no está compilado o cambió desde la compilación"""
+        if time.monotonic() - self._ultima_revalidacion >= self.intervalo_revalidacion:
+            with self._lock:
+                if time.monotonic() - self._ultima_revalidacion >= self.intervalo_revalidacion:
+                    self._revalidar()
+        return self._vigentes.get(nombre)
+
+    def variante(self, ruta_versionada, aceptadas):
+        """(archivo, codificación o None, etag, mimetype) de la mejor variante aceptada, o None
+
+        La ETag es la huella del contenido más la codificación, así cada variante
+        se revalida por separado.
+        """
+        datos = self._por_ruta.get(ruta_versionada)
+        if datos is None:
+            return None
+        archivo = os.path.join(self.directorio_salida, ruta_versionada)
+        mimetype = mimetypes.guess_type(ruta_versionada)[0] or 'application/octet-stream'
+        for codificacion, extension in EXTENSIONES_CODIFICACION.items():
+            if codificacion in datos['codificaciones'] and aceptadas[codificacion]:
+                return archivo + extension, codificacion, f"{datos['huella']}-{codificacion}", mimetype
+        return archivo, None, datos['huella'], mimetype
+
+    def estadisticas(self):
+        return {'recursos': len(self._recursos), 'vigentes': len(self._vigentes),
+                'brotli': brotli is not None}
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description='Recursos estáticos versionados de BetaIA')
+    parser.add_argument('--estaticos', default='static', help='Directorio con los recursos')
+    parser.add_argument('--salida', default=None, help='Directorio de las copias con huella (static/dist)')
+    args = parser.parse_args(argumentos)
+
+    resumen = construir_recursos_estaticos(args.estaticos, args.salida)
+    print(f"✅ Recursos estáticos versionados: {resumen['recursos']} archivos, {resumen['comprimidos']} "
+          f"precomprimidos ({', '.join(resumen['codificaciones'])}), texto {resumen['bytes_texto'] // 1024} KB -> "
+          f"{resumen['bytes_texto_comprimidos'] // 1024} KB en {resumen['segundos']}s")
+
+
+if __name__ == '__main__':
+    main()
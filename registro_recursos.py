@@ -0,0 +1,179 @@
+"""
+Registro de recursos de RespuestasParaChatBot
+Escanea data/RespuestasParaChatBot una sola vez al arrancar y mantiene en
+memoria el contenido de flujogramas, tablas de cabida, resoluciones y
+respuestas, indexado por (tipo, tomo).
+
+Soporta las dos estructuras de carpetas:
+- Tomos 1-7: archivos directos en RespuestasIA_TomoN/
+- Tomos 8-11: subcarpetas Flujogramas/, Tablas/, Resoluciones/, Respuestas/
+
+Las entradas se invalidan por mtime: como mucho cada
+`intervalo_revalidacion` segundos se hace stat() de las rutas candidatas y
+solo se releen los archivos que cambiaron, aparecieron o desaparecieron.
+Entre revalidaciones, las consultas son búsquedas en un diccionario.
+La versión del registro (huella de las firmas de los archivos) cambia con
+cada archivo modificado, y sirve de base para las ETag de las respuestas
+construidas con los recursos.
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+
+# Tipo de recurso -> subcarpeta usada por los tomos 8-11
+SUBCARPETAS_RECURSOS = {
+    'flujogramaTerrPublicos': 'Flujogramas',
+    'flujogramaCambiosCalificacion': 'Flujogramas',
+    'flujogramaSitiosHistoricos': 'Flujogramas',
+    'TablaCabida': 'Tablas',
+    'Resoluciones': 'Resoluciones',
+    'Respuestas': 'Respuestas',
+}
+
+PATRON_CARPETA_TOMO = re.compile(r'^RespuestasIA_Tomo(\d+)$')
+
+
+class _Entrada:
+    """Contenido de un recurso y la firma (ruta, mtime, tamaño) de su archivo"""
+
+    __slots__ = ('ruta', 'firma', 'contenido')
+
+    def __init__(self, ruta, firma, contenido):
+        self.ruta = ruta
+        self.firma = firma
+        self.contenido = contenido
+
+
+class RegistroRecursos:
+    """Contenido de los recursos por (tipo, tomo), cargado una sola vez"""
+
+    def __init__(self, directorio_base, intervalo_revalidacion=30):
+        self.directorio_base = directorio_base
+        self.intervalo_revalidacion = intervalo_revalidacion
+        self._entradas = {}
+        self._firmas = {}
+        self._tomos = set()
+        self._lock = threading.Lock()
+        self._ultima_revalidacion = 0.0
+        self._version = None
+        self.recargas = 0
+        self._escanear()
+
+    def _tomos_en_disco(self):
+        """Números de tomo con carpeta RespuestasIA_TomoN"""
+        try:
+            nombres = os.listdir(self.directorio_base)
+        except FileNotFoundError:
+            return []
+        tomos = []
+        for nombre in nombres:
+            coincidencia = PATRON_CARPETA_TOMO.match(nombre)
+            if coincidencia and os.path.isdir(os.path.join(self.directorio_base, nombre)):
+                tomos.append(int(coincidencia.group(1)))
+        return sorted(tomos)
+
+    def _rutas_candidatas(self, tipo, tomo):
+        """Rutas en orden de preferencia: estructura directa y luego subcarpeta"""
+        carpeta_tomo = os.path.join(self.directorio_base, f"RespuestasIA_Tomo{tomo}")
+        nombre_archivo = f"{tipo}_Tomo_{tomo}.txt"
+        return (
+            os.path.join(carpeta_tomo, nombre_archivo),
+            os.path.join(carpeta_tomo, SUBCARPETAS_RECURSOS[tipo], nombre_archivo),
+        )
+
+    @staticmethod
+    def _firma(ruta):
+        try:
+            estado = os.stat(ruta)
+        except OSError:
+            return None
+        return (estado.st_mtime_ns, estado.st_size)
+
+    @staticmethod
+    def _leer(ruta):
+        try:
+            with open(ruta, 'r', encoding='utf-8') as archivo:
+                return archivo.read()
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"⚠️ No se pudo leer el recurso {ruta}: {e}")
+            return None
+
+    def _resolver(self, tipo, tomo, firmas_anteriores):
+        """Primer archivo candidato no vacío; reutiliza el contenido si su firma no cambió"""
+        for ruta in self._rutas_candidatas(tipo, tomo):
+            firma = self._firma(ruta)
+            self._firmas[ruta] = firma
+            if firma is None:
+                continue
+            anterior = self._entradas.get((tipo, tomo))
+            if anterior and anterior.ruta == ruta and anterior.firma == firma:
+                return anterior
+            if firmas_anteriores is not None:
+                self.recargas += 1
+            contenido = self._leer(ruta)
+            if contenido and contenido.strip():
+                return _Entrada(ruta, firma, contenido)
+        return None
+
+    def _escanear(self, firmas_anteriores=None):
+        entradas = {}
+        self._firmas = {}
+        self._tomos = set(self._tomos_en_disco())
+        for tomo in sorted(self._tomos):
+            for tipo in SUBCARPETAS_RECURSOS:
+                entrada = self._resolver(tipo, tomo, firmas_anteriores)
+                if entrada:
+                    entradas[(tipo, tomo)] = entrada
+        self._entradas = entradas
+        huella = hashlib.sha256()
+        for (tipo, tomo), entrada in sorted(entradas.items()):
+            huella.update(f"{tipo}\0{tomo}\0{entrada.ruta}\0{entrada.firma}\n".encode('utf-8'))
+        self._version = huella.hexdigest()[:12]
+        self._ultima_revalidacion = time.monotonic()
+
+    def _revalidar_si_toca(self):
+        if time.monotonic() - self._ultima_revalidacion < self.intervalo_revalidacion:
+            return
+        with self._lock:
+            if time.monotonic() - self._ultima_revalidacion < self.intervalo_revalidacion:
+                return
+            firmas_anteriores = self._firmas
+            cambios = any(self._firma(ruta) != firma for ruta, firma in firmas_anteriores.items())
+            if cambios or set(self._tomos_en_disco()) != self._tomos:
+                self._escanear(firmas_anteriores)
+                print(f"🔄 Registro de recursos actualizado: {len(self._entradas)} recursos")
+            else:
+                self._ultima_revalidacion = time.monotonic()
+
+    def contenido(self, tipo, tomo):
+        """Contenido del recurso (tipo, tomo) o None si no existe o está vacío"""
+        self._revalidar_si_toca()
+        entrada = self._entradas.get((tipo, int(tomo)))
+        return entrada.contenido if entrada else None
+
+    def ruta(self, tipo, tomo):
+        """Ruta del archivo que respalda el recurso (tipo, tomo)"""
+        self._revalidar_si_toca()
+        entrada = self._entradas.get((tipo, int(tomo)))
+        return entrada.ruta if entrada else None
+
+    def tomos_con(self, tipo):
+        """Tomos que tienen el recurso `tipo` con contenido, en orden"""
+        self._revalidar_si_toca()
+        return sorted(tomo for (tipo_entrada, tomo) in self._entradas if tipo_entrada == tipo)
+
+    def version(self):
+        """Huella de los recursos cargados; cambia cuando cambia cualquier archivo"""
+        self._revalidar_si_toca()
+        return self._version
+
+    def estadisticas(self):
+        entradas = list(self._entradas.values())
+        return {
+            'version': self._version,
+            'recursos': len(entradas),
+            'bytes': sum(len(entrada.contenido.encode('utf-8')) for entrada in entradas),
+            'recargas': self.recargas,
+        }
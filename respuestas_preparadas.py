@@ -0,0 +1,255 @@
+"""
+Respuestas preparadas
+Índice de preguntas y respuestas curadas que se sirven sin llamar al modelo:
+
+- Respuestas_Tomo_N.txt de RespuestasParaChatBot (leídos del registro de
+  recursos). Los tomos 6-11 traen preguntas numeradas ('1. ¿Qué es...?')
+  seguidas de su respuesta; los tomos 1-5 traen fragmentos con títulos en
+  negrita ('**1. PROYECTO DE URBANIZACIÓN:**'), que se usan como pregunta.
+- data/almacenamiento.txt: las PREGUNTAS GENERALES y las secciones
+  '## N. TÍTULO' de los resúmenes por tomo ('Propósito general del tomo',
+  'Agencias, funcionarios o entidades mencionadas', ...).
+
+Las preguntas se comparan por sus términos (terminos_pregunta), con peso
+IDF calculado sobre las preguntas del índice. La confianza promedia cuánto
+de la pregunta del usuario cubre la pregunta preparada y cuánto de la
+preparada aparece en la del usuario. Si el usuario cita un tomo solo se
+consideran respuestas de ese tomo o generales; las respuestas que dependen
+del tomo ('Otros trámites en este tomo') exigen que el tomo se cite.
+"""
+import math
+import re
+from collections import namedtuple
+
+from indices_busqueda import normalizar_texto, terminos_pregunta
+
+# Primera línea de los archivos de respuestas: 'TOMO VI - Distancia de calificación'
+PATRON_ENCABEZADO_TOMO = re.compile(r'^\s*tomo\s+[ivxlc\d]+\b', re.IGNORECASE)
+# Pregunta numerada: '1. ¿Qué es...?' o '4.    Otros trámites en este tomo'
+PATRON_PREGUNTA_NUMERADA = re.compile(r'^\s*\d+\.\s+(.+?)\s*$')
+# Título de un fragmento de los tomos 1-5: '**1. PROYECTO DE URBANIZACIÓN:**'
+PATRON_TITULO_FRAGMENTO = re.compile(r'^\*\*\s*\d+\.\s*(.+?):?\s*\*\*\s*$')
+PATRON_FRAGMENTO = re.compile(r'^\W*fragmento\s+\d+', re.IGNORECASE)
+# almacenamiento.txt: inicio de la sección de un tomo y subsecciones del resumen
+PATRON_TOMO_ALMACENAMIENTO = re.compile(r'^\s*tomo\s+(\d+)\b', re.IGNORECASE)
+PATRON_SECCION_RESUMEN = re.compile(r'^##\s+\d+\.\s+(.+?)\s*$')
+PATRON_PARENTESIS = re.compile(r'\s*\([^)]*\)')
+PATRON_PARTES_TITULO = re.compile(r',|\s+[yo]\s+', re.IGNORECASE)
+# Líneas que solo dicen que el fragmento no trae la información ('No se mencionan... en este fragmento')
+PATRON_SIN_INFORMACION = re.compile(
+    r'\bno (?:se )?(?:hay|encontrad|especific|mencion|defin|proporcion|detall|identific|describ)\w*')
+
+# Términos que no distinguen una pregunta de otra en este índice
+TERMINOS_IGNORADOS = {'tomo', 'esta', 'este', 'esto', 'dame', 'muestra', 'explica', 'describe', 'describir'}
+# Interrogativos (ya en singular): '¿Qué es...?' y '¿Cuántos...?' piden respuestas distintas
+INTERROGATIVOS = {'que', 'como', 'cual', 'cuanto', 'cuanta', 'donde', 'cuando', 'quien'}
+# Formas de un mismo pedido ('Resumir' en el Tomo 11, 'resume el tomo 11', 'resumen del tomo 11')
+SINONIMOS = {'resumir': 'resumen', 'resume': 'resumen', 'resumeme': 'resumen'}
+
+# Mínimo de líneas en blanco seguidas que cierran una sección del resumen
+LINEAS_BLANCAS_FIN_SECCION = 2
+
+# claves: textos con los que se compara la pregunta del usuario (la pregunta y, en los
+# títulos, cada parte de dos o más términos: 'Permisos de construcción y de uso' ->
+# 'Permisos de construcción', 'de uso' no cuenta)
+RespuestaPreparada = namedtuple('RespuestaPreparada', 'pregunta respuesta fuente tomo requiere_tomo claves')
+AciertoPreparado = namedtuple('AciertoPreparado', 'entrada confianza')
+
+
+def _terminos(texto, tomo=None):
+    """Términos de comparación: sin 'tomo' ni el número del tomo"""
+    ignorados = TERMINOS_IGNORADOS | ({str(tomo)} if tomo is not None else set())
+    return {SINONIMOS.get(termino, termino) for termino in terminos_pregunta(texto) if termino not in ignorados}
+
+
+def _claves_titulo(titulo):
+    """El título y cada una de sus partes separadas por comas, 'y' u 'o' que tenga dos o más términos
+
+    Una parte de una sola palabra ('Agencias') no basta para identificar la sección.
+    """
+    partes = [parte.strip() for parte in PATRON_PARTES_TITULO.split(titulo) if parte.strip()]
+    if len(partes) < 2:
+        return (titulo,)
+    return (titulo,) + tuple(parte for parte in partes if len(_terminos(parte)) >= 2)
+
+
+def _sin_informacion(respuesta):
+    """True si la mayoría de las líneas con contenido dicen que no hay información"""
+    lineas = [linea for linea in normalizar_texto(respuesta).splitlines()
+              if linea.strip() and not linea.rstrip().endswith(':')]
+    vacias = sum(1 for linea in lineas if PATRON_SIN_INFORMACION.search(linea))
+    return not lineas or vacias * 2 >= len(lineas)
+
+
+def _limpiar_respuesta(lineas):
+    texto = '\n'.join(lineas).strip()
+    return re.sub(r'\n{3,}', '\n\n', texto)
+
+
+def _es_pregunta(linea):
+    """Línea de pregunta en un archivo de respuestas (numerada o con signos de interrogación)"""
+    numerada = PATRON_PREGUNTA_NUMERADA.match(linea)
+    if numerada:
+        return numerada.group(1)
+    if '?' in linea and len(linea) <= 200:
+        return linea.strip()
+    # Instrucción corta sin puntuación final ('Resumir')
+    if len(linea) <= 80 and not linea.startswith('-') and linea[-1] not in '.:;,':
+        return linea.strip()
+    return None
+
+
+def extraer_respuestas_tomo(texto, tomo):
+    """Pares pregunta/respuesta de un Respuestas_Tomo_N.txt"""
+    entradas = []
+    pregunta, lineas = None, []
+
+    def cerrar():
+        respuesta = _limpiar_respuesta(lineas)
+        if pregunta and respuesta and not _sin_informacion(respuesta):
+            sin_signos = '?' not in pregunta and '¿' not in pregunta
+            menciona_tomo = 'tomo' in normalizar_texto(pregunta)
+            requiere_tomo = menciona_tomo or (sin_signos and len(_terminos(pregunta)) < 2)
+            titulo = pregunta if menciona_tomo or not requiere_tomo else f"{pregunta} (Tomo {tomo})"
+            claves = _claves_titulo(pregunta) if formato_fragmentos else (pregunta,)
+            entradas.append(RespuestaPreparada(titulo, respuesta, f'tomo-{tomo}', tomo, requiere_tomo, claves))
+
+    lineas_texto = texto.splitlines()
+    formato_fragmentos = any(PATRON_TITULO_FRAGMENTO.match(linea.strip()) for linea in lineas_texto)
+    encabezado_visto = False
+    for linea in lineas_texto:
+        limpia = linea.strip()
+        if not limpia:
+            lineas.append('')
+            continue
+        if not encabezado_visto and PATRON_ENCABEZADO_TOMO.match(limpia):
+            encabezado_visto = True
+            continue
+        encabezado_visto = True
+        if PATRON_FRAGMENTO.match(limpia):
+            continue
+
+        if formato_fragmentos:
+            titulo = PATRON_TITULO_FRAGMENTO.match(limpia)
+            nueva_pregunta = titulo.group(1).strip().capitalize() if titulo else None
+        else:
+            nueva_pregunta = _es_pregunta(limpia)
+        if nueva_pregunta:
+            cerrar()
+            pregunta, lineas = nueva_pregunta, []
+        else:
+            lineas.append(linea.rstrip())
+    cerrar()
+    return entradas
+
+
+def extraer_respuestas_almacenamiento(texto):
+    """Preguntas generales y secciones '## N. TÍTULO' de los resúmenes por tomo de almacenamiento.txt"""
+    entradas = []
+    tomo = None
+    pregunta, claves, lineas, blancas = None, (), [], 0
+
+    def cerrar():
+        respuesta = _limpiar_respuesta(lineas)
+        if pregunta and respuesta and not _sin_informacion(respuesta):
+            fuente = f'resumen-tomo-{tomo}' if tomo is not None else 'general'
+            entradas.append(RespuestaPreparada(pregunta, respuesta, fuente, tomo, tomo is not None,
+                                               claves or (pregunta,)))
+
+    for linea in texto.splitlines():
+        limpia = linea.strip()
+        blancas = blancas + 1 if not limpia else 0
+        inicio_tomo = PATRON_TOMO_ALMACENAMIENTO.match(limpia)
+        seccion = PATRON_SECCION_RESUMEN.match(limpia)
+
+        if inicio_tomo and len(limpia) <= 80 and not limpia.endswith('.'):
+            cerrar()
+            tomo, pregunta, lineas = int(inicio_tomo.group(1)), None, []
+        elif seccion and tomo is not None:
+            cerrar()
+            titulo = PATRON_PARENTESIS.sub('', seccion.group(1)).strip().capitalize()
+            pregunta, claves, lineas = f"{titulo} (Tomo {tomo})", _claves_titulo(titulo), []
+        elif tomo is None and limpia.endswith('?'):
+            cerrar()
+            pregunta, claves, lineas = limpia, (), []
+        elif limpia.startswith('#') or limpia.startswith('```') or limpia == 'Fin':
+            cerrar()
+            pregunta, lineas = None, []
+        elif pregunta:
+            if blancas >= LINEAS_BLANCAS_FIN_SECCION:
+                cerrar()
+                pregunta, lineas = None, []
+            elif tomo is None and limpia.startswith('- '):
+                lineas.append(limpia[2:])
+            else:
+                lineas.append(linea.rstrip())
+    cerrar()
+    return entradas
+
+
+class IndiceRespuestas:
+    """Índice de respuestas preparadas con búsqueda aproximada de la pregunta"""
+
+    def __init__(self, entradas, umbral=0.75):
+        self.entradas = list(entradas)
+        self.umbral = umbral
+        # Conjuntos de términos de cada clave de cada entrada
+        self._claves = [[_terminos(clave, entrada.tomo) for clave in entrada.claves] for entrada in self.entradas]
+
+        frecuencias = {}
+        for claves in self._claves:
+            for termino in set().union(*claves):
+                frecuencias[termino] = frecuencias.get(termino, 0) + 1
+        total = max(len(self.entradas), 1)
+        self._idf = {termino: math.log(1 + total / df) for termino, df in frecuencias.items()}
+        # Un término que ninguna pregunta preparada usa pesa como el más raro
+        self._idf_desconocido = math.log(1 + total)
+
+    def __len__(self):
+        return len(self.entradas)
+
+    def _peso(self, terminos):
+        return sum(self._idf.get(termino, self._idf_desconocido) for termino in terminos)
+
+    def buscar(self, pregunta, tomo=None):
+        """Mejor respuesta preparada con confianza >= umbral (AciertoPreparado) o None
+
+        La confianza de una clave es el promedio de la fracción (ponderada por IDF)
+        de la pregunta que cubre la clave y de la clave que aparece en la pregunta.
+        Una clave con interrogativos solo coincide si la pregunta trae los mismos, y
+        una clave de dos o más términos debe compartir al menos dos con la pregunta.
+        """
+        consulta = _terminos(pregunta, tomo)
+        if not consulta:
+            return None
+        peso_consulta = self._peso(consulta)
+        interrogativos = consulta & INTERROGATIVOS
+
+        mejor = None
+        for entrada, claves in zip(self.entradas, self._claves):
+            if tomo is not None and entrada.tomo not in (None, tomo):
+                continue
+            if entrada.requiere_tomo and tomo is None:
+                continue
+            for terminos in claves:
+                comunes = consulta & terminos
+                contenido_comun = comunes - INTERROGATIVOS
+                if not contenido_comun or len(contenido_comun) < min(2, len(terminos - INTERROGATIVOS)):
+                    continue
+                interrogativos_clave = terminos & INTERROGATIVOS
+                if interrogativos_clave and interrogativos_clave != interrogativos:
+                    continue
+                peso_comunes = self._peso(comunes)
+                confianza = (peso_comunes / peso_consulta + peso_comunes / self._peso(terminos)) / 2
+                if mejor is None or confianza > mejor.confianza:
+                    mejor = AciertoPreparado(entrada, confianza)
+
+        if mejor is None or mejor.confianza < self.umbral:
+            return None
+        return mejor
+
+    def estadisticas(self):
+        fuentes = {}
+        for entrada in self.entradas:
+            fuentes[entrada.fuente] = fuentes.get(entrada.fuente, 0) + 1
+        return {'respuestas': len(self.entradas), 'umbral': self.umbral, 'fuentes': fuentes}
@@ -98,14 +98,32 @@ async function handleSendMessage() {
     showTypingIndicator();
     
     try {
-        // Enviar a la API
-        const response = await sendToAPI(message);
+        // Enviar a la API y mostrar la respuesta a medida que llega
+        let botMessage = null;
+        let streamedText = '';
+        
+        const response = await sendToAPI(message, (type, data) => {
+            if (type === 'etapa') {
+                updateTypingStatus(data.mensaje);
+            } else if (type === 'token') {
+                if (!botMessage) {
+                    hideTypingIndicator();
+                    botMessage = addMessage('', 'bot');
+                }
+                streamedText += data.texto;
+                updateMessage(botMessage, streamedText);
+            }
+        });
         
         // Ocultar indicador de escritura
         hideTypingIndicator();
         
-        // Mostrar respuesta del bot
-        addMessage(response, 'bot');
+        // Mostrar respuesta final del bot (reemplaza el texto parcial)
+        if (botMessage) {
+            updateMessage(botMessage, response);
+        } else {
+            addMessage(response, 'bot');
+        }
         
         // Guardar en historial
         saveChatHistory();
@@ -120,24 +138,144 @@ async function handleSendMessage() {
     }
 }
 
-async function sendToAPI(message) {
-    const response = await fetch('/chat', {
+async function sendToAPI(message, onEvent) {
+    const headers = {
+        'Content-Type': 'application/json',
+        'Accept': 'text/event-stream'
+    };
+    // Respuesta de recurso ya recibida: el servidor contesta 304 si sigue vigente
+    const cached = getCachedResource(message);
+    if (cached) headers['If-None-Match'] = `"${cached.etag}"`;
+    
+    const response = await fetch('/chat/stream', {
         method: 'POST',
-        headers: {
-            'Content-Type': 'application/json',
-        },
+        headers: headers,
         body: JSON.stringify({
             message: message,
             session_id: currentSessionId
         })
     });
     
+    if (response.status === 304 && cached) {
+        return cached.response;
+    }
+    
+    // Servicio saturado: el servidor pide reintentar en unos segundos
+    if (response.status === 429) {
+        const data = await response.json().catch(() => ({}));
+        return data.response || '⏳ Hay muchas consultas en proceso. Intenta de nuevo en unos segundos.';
+    }
+    
     if (!response.ok) {
         throw new Error(`Error ${response.status}: ${response.statusText}`);
     }
     
-    const data = await response.json();
-    return data.response || 'Lo siento, no pude procesar tu consulta.';
+    // Navegadores sin ReadableStream o respuestas JSON: leer de una sola vez
+    const contentType = response.headers.get('Content-Type') || '';
+    const data = (!contentType.includes('text/event-stream') || !response.body)
+        ? await response.json()
+        : await readEventStream(response, onEvent);
+    
+    if (!data || !data.response) {
+        return 'Lo siento, no pude procesar tu consulta.';
+    }
+    if (data.etag) {
+        cacheResource(message, data.etag, data.response);
+    }
+    return data.response;
+}
+
+// ===== RESPUESTAS DE RECURSOS (tablas, flujogramas, índices) =====
+const RESOURCE_CACHE_KEY = 'chat_resource_cache';
+const RESOURCE_CACHE_MAX = 50;
+
+function resourceCacheKey(message) {
+    return message.trim().toLowerCase().replace(/\s+/g, ' ');
+}
+
+function loadResourceCache() {
+    try {
+        return JSON.parse(localStorage.getItem(RESOURCE_CACHE_KEY)) || {};
+    } catch (error) {
+        return {};
+    }
+}
+
+function getCachedResource(message) {
+    return loadResourceCache()[resourceCacheKey(message)] || null;
+}
+
+function cacheResource(message, etag, response) {
+    const cache = loadResourceCache();
+    const key = resourceCacheKey(message);
+    delete cache[key];
+    cache[key] = { etag, response };
+    
+    // Conservar solo las más recientes (los objetos mantienen el orden de inserción)
+    const keys = Object.keys(cache);
+    keys.slice(0, Math.max(keys.length - RESOURCE_CACHE_MAX, 0)).forEach(old => delete cache[old]);
+    
+    try {
+        localStorage.setItem(RESOURCE_CACHE_KEY, JSON.stringify(cache));
+    } catch (error) {
+        console.warn('No se pudo guardar la respuesta en caché:', error);
+    }
+}
+
+// ===== STREAMING (Server-Sent Events) =====
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder('utf-8');
+    let buffer = '';
+    let finalData = null;
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        
+        buffer += decoder.decode(value, { stream: true });
+        
+        // Los eventos SSE se separan con una línea en blanco
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            
+            const event = parseServerSentEvent(rawEvent);
+            if (!event) continue;
+            
+            if (event.type === 'fin') {
+                finalData = event.data;
+            } else if (onEvent) {
+                onEvent(event.type, event.data);
+            }
+        }
+    }
+    
+    return finalData;
+}
+
+function parseServerSentEvent(rawEvent) {
+    let type = 'message';
+    const dataLines = [];
+    
+    rawEvent.split('\n').forEach(line => {
+        if (line.startsWith('event:')) {
+            type = line.slice(6).trim();
+        } else if (line.startsWith('data:')) {
+            dataLines.push(line.slice(5).trimStart());
+        }
+    });
+    
+    // Comentarios de keep-alive (": ping") no traen datos
+    if (!dataLines.length) return null;
+    
+    try {
+        return { type, data: JSON.parse(dataLines.join('\n')) };
+    } catch (error) {
+        console.warn('Evento SSE inválido:', rawEvent);
+        return null;
+    }
 }
 
 function sendQuickMessage(message) {
@@ -178,6 +316,13 @@ function addMessage(content, sender, isError = false) {
     
     messagesContainer.appendChild(messageDiv);
     scrollToBottom();
+    return messageDiv;
+}
+
+function updateMessage(messageDiv, content) {
+    const textElement = messageDiv.querySelector('.message-text');
+    textElement.innerHTML = formatMessageContent(content);
+    scrollToBottom();
 }
 
 function formatMessageContent(content) {
@@ -198,6 +343,18 @@ function showTypingIndicator() {
 function hideTypingIndicator() {
     const indicator = document.getElementById('typingIndicator');
     indicator.style.display = 'none';
+    updateTypingStatus(null);
+}
+
+function updateTypingStatus(text) {
+    const typingText = document.querySelector('#typingIndicator .typing-text');
+    if (!typingText) return;
+    
+    // Guardar el texto original para restaurarlo al terminar
+    if (!typingText.dataset.defaultText) {
+        typingText.dataset.defaultText = typingText.textContent;
+    }
+    typingText.textContent = text || typingText.dataset.defaultText;
 }
 
 function scrollToBottom() {
@@ -0,0 +1,160 @@
+"""
+Motor único de tablas HTML
+Convierte texto tabular (Markdown, tabulaciones, punto y coma, comas, pipes
+o columnas separadas por espacios múltiples) a la tabla HTML de la interfaz.
+
+Lo usan texto_a_tabla_html (app.py) y convertir_tabla_a_html
+(mini_especialistas.py). El HTML generado se memoriza por hash del
+contenido, de modo que las tablas fijas y las TablaCabida_Tomo_N
+pre-renderizadas al arrancar se sirven con una búsqueda en diccionario.
+"""
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+PATRONES_MARCADOR_FRAGMENTO = (
+    re.compile(r'🔍\s*[Ff]ragmento\s*\d*\s*:'),
+    re.compile(r'[Ff]ragmento\s*\d*\s*:'),
+    re.compile(r'FRAGMENTO\s*\d*\s*:'),
+)
+PATRON_SEPARADOR_MARKDOWN = re.compile(r'^[\s\-:|\+]+$')
+PATRON_ESPACIOS_MULTIPLES = re.compile(r'\s{2,}')
+PATRON_NUMERO = re.compile(r'^(?:[\d\.,\$€£¥₹]+|\d+(\.\d+)?)$')
+PATRON_FECHA = re.compile(r'\d{1,2}[/-]\d{1,2}[/-]\d{2,4}|\d{2,4}[/-]\d{1,2}[/-]\d{1,2}')
+DELIMITADORES = ('\t', ';', ',', '|')
+
+ESTADOS_CELDA = {
+    **dict.fromkeys(['activo', 'aprobado', 'completado', 'si', 'sí', 'yes', 'vigente'], ' class="estado activo"'),
+    **dict.fromkeys(['pendiente', 'en proceso', 'tramitando', 'revisión'], ' class="estado pendiente"'),
+    **dict.fromkeys(['inactivo', 'rechazado', 'vencido', 'no', 'cancelado'], ' class="estado inactivo"'),
+}
+
+
+def limpiar_marcadores_fragmento(texto):
+    """Elimina los marcadores 'FRAGMENTO N:' que arrastran los textos extraídos"""
+    for patron in PATRONES_MARCADOR_FRAGMENTO:
+        texto = patron.sub('', texto)
+    return texto
+
+
+def detectar_tipo_celda(contenido):
+    """Atributo class de una celda según su contenido (número, fecha o estado)"""
+    contenido = contenido.strip()
+    if not contenido:
+        return ""
+    if PATRON_NUMERO.match(contenido):
+        return ' class="numero"'
+    if PATRON_FECHA.match(contenido):
+        return ' class="fecha"'
+    return ESTADOS_CELDA.get(contenido.lower(), "")
+
+
+def _extraer_lineas(texto):
+    """Líneas de la tabla, ignorando el texto previo al primer encabezado con |"""
+    lineas_originales = texto.split('\n')
+    for i, linea in enumerate(lineas_originales):
+        linea = linea.strip()
+        if linea.startswith('|') and '|' in linea[1:]:
+            lineas_originales = '\n'.join(lineas_originales[i:]).strip().split('\n')
+            break
+    return [l for l in lineas_originales if l.strip()]
+
+
+def _limpiar_lineas_markdown(lineas):
+    """Quita los pipes de los extremos y las líneas separadoras (|---|---|)"""
+    lineas_limpias = []
+    for l in lineas:
+        l = l.strip()
+        if l.startswith('|'):
+            l = l[1:]
+        if l.endswith('|'):
+            l = l[:-1]
+        if not PATRON_SEPARADOR_MARKDOWN.match(l):
+            lineas_limpias.append(l)
+    return lineas_limpias or lineas
+
+
+def renderizar_tabla(texto, clases_por_tipo=True, espacios_multiples=True):
+    """Convierte texto tabular a HTML; si no parece tabla lo devuelve en <pre>
+
+    clases_por_tipo marca las celdas numéricas, fechas y estados con clases CSS;
+    espacios_multiples acepta columnas separadas por dos o más espacios
+    cuando no hay otro delimitador.
+    """
+    texto = limpiar_marcadores_fragmento(texto.strip()).strip()
+    lineas = _extraer_lineas(texto)
+    if len(lineas) < 2:
+        return f'<pre>{texto}</pre>'
+
+    if any(l.strip().startswith('|') or l.strip().endswith('|') for l in lineas[:3]):
+        lineas = _limpiar_lineas_markdown(lineas)
+
+    delimitador = next((d for d in DELIMITADORES if any(d in l for l in lineas[:3])), None)
+    if delimitador:
+        dividir = lambda linea: linea.split(delimitador)
+    elif espacios_multiples and any(PATRON_ESPACIOS_MULTIPLES.search(l) for l in lineas[:3]):
+        dividir = PATRON_ESPACIOS_MULTIPLES.split
+    else:
+        return f'<pre>{texto}</pre>'
+
+    filas = []
+    for linea in lineas:
+        celdas = [c.strip() for c in dividir(linea)]
+        if any(celdas):
+            filas.append(celdas)
+    if not filas:
+        return f'<pre>{texto}</pre>'
+    max_celdas = max(len(fila) for fila in filas)
+    for fila in filas:
+        fila.extend([''] * (max_celdas - len(fila)))
+
+    partes = ['<div class="tabla-container"><table class="tabla-moderna"><thead><tr>']
+    partes.extend(f'<th>{col}</th>' for col in filas[0])
+    partes.append('</tr></thead><tbody>')
+    for fila in filas[1:]:
+        partes.append('<tr>')
+        if clases_por_tipo:
+            partes.extend(f'<td{detectar_tipo_celda(celda)}>{celda}</td>' for celda in fila)
+        else:
+            partes.extend(f'<td>{celda}</td>' for celda in fila)
+        partes.append('</tr>')
+    partes.append('</tbody></table></div>')
+    return ''.join(partes)
+
+
+class MotorTablas:
+    """Caché LRU de tablas renderizadas, indexada por hash del contenido"""
+
+    def __init__(self, max_entradas=512):
+        self.max_entradas = max_entradas
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    @staticmethod
+    def _clave(texto, opciones):
+        return (hashlib.blake2b(texto.encode('utf-8'), digest_size=16).digest(), opciones)
+
+    def renderizar(self, texto, clases_por_tipo=True, espacios_multiples=True):
+        clave = self._clave(texto, (clases_por_tipo, espacios_multiples))
+        with self._lock:
+            html = self._cache.get(clave)
+            if html is not None:
+                self._cache.move_to_end(clave)
+                self.aciertos += 1
+                return html
+            self.fallos += 1
+        html = renderizar_tabla(texto, clases_por_tipo, espacios_multiples)
+        with self._lock:
+            self._cache[clave] = html
+            while len(self._cache) > self.max_entradas:
+                self._cache.popitem(last=False)
+        return html
+
+    def estadisticas(self):
+        return {'tablas': len(self._cache), 'aciertos': self.aciertos, 'fallos': self.fallos}
+
+
+motor_tablas = MotorTablas()
@@ -0,0 +1,45 @@
+"""Almacén SQLite: las lecturas ven los mensajes pendientes sin escribir el lote en la petición"""
+import pytest
+
+from almacen_conversaciones import AlmacenConversacionesSQLite
+
+SISTEMA = {'role': 'system', 'content': 'Eres un asistente'}
+
+
+def _mensaje(rol, texto):
+    return {'role': rol, 'content': texto}
+
+
+@pytest.fixture
+def almacen(tmp_path):
+    # Intervalo largo: el hilo de fondo no escribe durante la prueba
+    return AlmacenConversacionesSQLite(str(tmp_path / 'conversaciones.db'), [SISTEMA], max_mensajes=4,
+                                       intervalo_escritura=3600)
+
+
+def test_lee_los_pendientes_sin_escribir(almacen):
+    almacen.agregar('a', _mensaje('user', 'hola'), _mensaje('assistant', 'buenas'))
+    assert 'a' in almacen
+    assert almacen.mensajes('a') == [SISTEMA, _mensaje('user', 'hola'), _mensaje('assistant', 'buenas')]
+    assert almacen._lotes_escritos == 0
+
+
+def test_combina_filas_escritas_y_pendientes_sin_duplicar(almacen):
+    almacen.agregar('a', _mensaje('user', 'uno'))
+    almacen.vaciar()
+    almacen.agregar('a', _mensaje('user', 'dos'))
+    assert [m['content'] for m in almacen.mensajes('a')[1:]] == ['uno', 'dos']
+    almacen.vaciar()
+    assert [m['content'] for m in almacen.mensajes('a')[1:]] == ['uno', 'dos']
+
+
+def test_eliminar_y_recorte_pendientes(almacen):
+    almacen.agregar('a', _mensaje('user', 'viejo'))
+    almacen.vaciar()
+    almacen.eliminar('a')
+    assert 'a' not in almacen
+    assert almacen.mensajes('a') == [SISTEMA]
+    almacen.agregar('a', *[_mensaje('user', str(i)) for i in range(6)])
+    assert [m['content'] for m in almacen.mensajes('a')[1:]] == ['2', '3', '4', '5']
+    almacen.vaciar()
+    assert [m['content'] for m in almacen.mensajes('a')[1:]] == ['2', '3', '4', '5']
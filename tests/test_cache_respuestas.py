@@ -0,0 +1,39 @@
+"""Preguntas casi iguales en la caché de respuestas: solo se reutiliza la respuesta de la misma pregunta"""
+import pytest
+
+from cache_respuestas import CacheRespuestas
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return CacheRespuestas(str(tmp_path / 'respuestas.db'), 'v1')
+
+
+@pytest.mark.parametrize('guardada, pregunta', [
+    # Pregunta más general que la guardada
+    ('requisitos para construir una casa de madera en zona costanera',
+     'requisitos para construir una casa en zona costanera'),
+    ('qué es la calificación de suelo rústico especialmente protegido',
+     'qué es la calificación de suelo rústico protegido'),
+    # Pregunta más específica que la guardada
+    ('¿Qué usos se permiten en una zona residencial?',
+     '¿Qué usos se permiten en una zona residencial agrícola?'),
+    # Negaciones e interrogativos
+    ('¿Qué requisitos necesito para un permiso de construcción en una zona histórica?',
+     '¿Qué requisitos NO necesito para un permiso de construcción en una zona histórica?'),
+    ('¿Cuándo se requiere una consulta de ubicación para un proyecto?',
+     '¿Cómo se requiere una consulta de ubicación para un proyecto?'),
+])
+def test_no_reutiliza_preguntas_distintas(cache, guardada, pregunta):
+    cache.guardar('legal', guardada, 'respuesta guardada')
+    assert cache.obtener('legal', pregunta) is None
+
+
+@pytest.mark.parametrize('guardada, pregunta', [
+    ('¿Qué es la calificación?', 'que es calificacion por favor'),
+    ('¿Qué criterios hay para un sitio histórico?', 'que criterios hay para sitios historicos por favor'),
+])
+def test_reutiliza_la_misma_pregunta_reformulada(cache, guardada, pregunta):
+    cache.guardar('legal', guardada, 'respuesta guardada')
+    acierto = cache.obtener('legal', pregunta)
+    assert acierto is not None and acierto.valor == 'respuesta guardada'
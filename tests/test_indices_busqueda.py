@@ -0,0 +1,26 @@
+"""Caché de índices de pasajes: los extractos no reemplazan el índice registrado del documento"""
+import indices_busqueda
+from indices_busqueda import IndicePasajes, obtener_indice_pasajes, registrar_indice_pasajes
+
+DOCUMENTO = "\n\n".join(f"Sección {i}. Requisitos del permiso número {i} para zonas históricas." for i in range(400))
+
+
+def test_extracto_no_expulsa_el_indice_registrado():
+    registrado = IndicePasajes(DOCUMENTO)
+    registrar_indice_pasajes("Tomo de prueba", registrado)
+
+    extracto = DOCUMENTO[:9000]
+    indice_extracto = obtener_indice_pasajes(extracto, "Tomo de prueba")
+    assert indice_extracto is not registrado
+    assert obtener_indice_pasajes(extracto, "Tomo de prueba") is indice_extracto
+    assert obtener_indice_pasajes(DOCUMENTO, "Tomo de prueba") is registrado
+
+
+def test_extractos_con_expulsion_lru(monkeypatch):
+    monkeypatch.setattr(indices_busqueda, 'MAX_INDICES_PASAJES', 2)
+    primero = obtener_indice_pasajes(DOCUMENTO[:9001], "Otro tomo")
+    obtener_indice_pasajes(DOCUMENTO[:9002], "Otro tomo")
+    assert obtener_indice_pasajes(DOCUMENTO[:9001], "Otro tomo") is primero
+    obtener_indice_pasajes(DOCUMENTO[:9003], "Otro tomo")
+    obtener_indice_pasajes(DOCUMENTO[:9004], "Otro tomo")
+    assert obtener_indice_pasajes(DOCUMENTO[:9001], "Otro tomo") is not primero
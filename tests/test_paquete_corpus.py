@@ -0,0 +1,32 @@
+"""Carga en frío del corpus: los índices que piden su propio texto no deben bloquearse"""
+import threading
+
+from paquete_corpus import CorpusConocimiento, construir_paquete
+
+ESPERA_MAXIMA = 30
+
+
+def _en_hilo(funcion):
+    """Resultado de funcion() en un hilo aparte; falla si no termina a tiempo"""
+    resultado = {}
+    hilo = threading.Thread(target=lambda: resultado.setdefault('valor', funcion()), daemon=True)
+    hilo.start()
+    hilo.join(ESPERA_MAXIMA)
+    assert not hilo.is_alive(), "la llamada quedó bloqueada"
+    return resultado['valor']
+
+
+def test_indice_secciones_en_frio_sin_paquete():
+    corpus = CorpusConocimiento('data')
+    indice = _en_hilo(lambda: corpus.indice_secciones('tomo_10_conservacion'))
+    assert indice.titulos
+    assert corpus.indice_secciones('tomo_10_conservacion') is indice
+
+
+def test_indice_secciones_en_frio_con_paquete(tmp_path):
+    ruta = str(tmp_path / 'corpus.pack')
+    construir_paquete('data', ruta)
+    corpus = CorpusConocimiento()
+    assert corpus.abrir(ruta, 'data')
+    indice = _en_hilo(lambda: corpus.indice_secciones('tomo_10_conservacion'))
+    assert indice.titulos
@@ -0,0 +1,75 @@
+"""Vuelo único: qué se comparte con las peticiones que esperan y quién repite el trabajo"""
+import threading
+import time
+
+import pytest
+
+from vuelo_unico import ResultadoDegradado, VueloUnico
+
+
+def _simultaneas(vuelos, funcion, cantidad, etapa='legal', clave='pregunta'):
+    """Resultados (o errores) de `cantidad` llamadas simultáneas con la misma clave"""
+    resultados = [None] * cantidad
+
+    def llamar(i):
+        try:
+            resultados[i] = vuelos.ejecutar(etapa, clave, funcion, i)
+        except Exception as e:
+            resultados[i] = e
+
+    hilos = [threading.Thread(target=llamar, args=(i,)) for i in range(cantidad)]
+    hilos[0].start()
+    time.sleep(0.05)
+    for hilo in hilos[1:]:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join(10)
+    return resultados
+
+
+def test_comparte_none():
+    llamadas = []
+
+    def extraer(i):
+        llamadas.append(i)
+        time.sleep(0.2)
+        return None
+
+    assert _simultaneas(VueloUnico(), extraer, 4, etapa='extraccion') == [None] * 4
+    assert llamadas == [0]
+
+
+@pytest.mark.parametrize('fallar', ['degradado', 'error'])
+def test_un_solo_relevo_tras_un_vuelo_fallido(fallar):
+    llamadas = []
+    lock = threading.Lock()
+
+    def responder(i):
+        with lock:
+            llamadas.append(i)
+            primera = len(llamadas) == 1
+        time.sleep(0.2)
+        if primera:
+            if fallar == 'error':
+                raise RuntimeError('sin cupo')
+            return ResultadoDegradado('respaldo')
+        return f'respuesta {i}'
+
+    vuelos = VueloUnico()
+    resultados = _simultaneas(vuelos, responder, 6)
+    # Solo el líder recibe su resultado degradado; un relevo responde a todos los demás
+    assert len(llamadas) == 2
+    relevo = llamadas[1]
+    assert all(r == f'respuesta {relevo}' for i, r in enumerate(resultados) if i != 0)
+    if fallar == 'error':
+        assert isinstance(resultados[0], RuntimeError)
+    else:
+        assert resultados[0] == 'respaldo'
+    assert vuelos.estadisticas()['relevos'] == 1
+
+
+def test_resultado_degradado_no_se_conserva():
+    vuelos = VueloUnico(ventana=5)
+    assert vuelos.ejecutar('legal', 'q', lambda: ResultadoDegradado('respaldo')) == 'respaldo'
+    assert vuelos.ejecutar('legal', 'q', lambda: 'completa') == 'completa'
+    assert vuelos.ejecutar('legal', 'q', lambda: 'otra') == 'completa'
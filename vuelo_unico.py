@@ -0,0 +1,126 @@
+"""
+Vuelo único (single-flight) para trabajo idéntico con el modelo
+Cuando varias peticiones hacen la misma pregunta a la vez, solo la primera
+ejecuta el trabajo para cada clave (etapa, pregunta normalizada); las demás
+esperan su resultado en lugar de repetir las mismas llamadas al modelo.
+
+Cada vuelo decide si su resultado se comparte: se comparte todo lo que
+devuelve la función (también None, p. ej. una fuente NO_RELEVANTE), salvo si
+lanza un error o si devuelve ResultadoDegradado(resultado), que es como el
+trabajo avisa de que alguna de sus llamadas falló y respondió con un texto de
+respaldo. Ese resultado solo lo recibe quien lo generó; de las peticiones que
+esperaban, una toma el relevo y repite el trabajo mientras las demás la
+esperan a ella, en lugar de repetirlo todas a la vez.
+
+Un resultado compartible se conserva `ventana` segundos después de terminar,
+para las peticiones que llegan justo después.
+
+Cada worker tiene su propio registro de vuelos: entre workers, la caché de
+respuestas en SQLite cubre las preguntas ya respondidas.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from metricas import metricas
+
+
+class ResultadoDegradado:
+    """Resultado que se devuelve a quien lo generó pero no se comparte con otras peticiones"""
+
+    __slots__ = ('resultado',)
+
+    def __init__(self, resultado):
+        self.resultado = resultado
+
+
+def _desenvolver(valor):
+    """(resultado, compartible) de lo que devolvió la función del vuelo"""
+    if isinstance(valor, ResultadoDegradado):
+        return valor.resultado, False
+    return valor, True
+
+
+class _Vuelo:
+    __slots__ = ('terminado', 'resultado', 'valido', 'fin')
+
+    def __init__(self):
+        self.terminado = threading.Event()
+        self.resultado = None
+        self.valido = False
+        self.fin = None
+
+
+class VueloUnico:
+    """Registro de trabajos en curso y recientes por (etapa, clave)"""
+
+    def __init__(self, ventana=5.0, espera_maxima=60.0):
+        self.ventana = ventana
+        self.espera_maxima = espera_maxima
+        self._en_curso = {}
+        # Vuelos terminados y válidos, en orden de finalización (los más viejos primero)
+        self._recientes = OrderedDict()
+        self._lock = threading.Lock()
+        self.lideres = 0
+        self.seguidores = 0
+        self.relevos = 0
+
+    def _purgar(self, ahora):
+        while self._recientes:
+            clave, vuelo = next(iter(self._recientes.items()))
+            if ahora - vuelo.fin < self.ventana:
+                break
+            del self._recientes[clave]
+
+    def ejecutar(self, etapa, clave, funcion, *args):
+        """Resultado de funcion(*args), compartido con las llamadas simultáneas de la misma (etapa, clave)"""
+        clave_completa = (etapa, clave)
+        limite = time.monotonic() + self.espera_maxima
+        relevo = False
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                self._purgar(ahora)
+                vuelo = self._recientes.get(clave_completa) or self._en_curso.get(clave_completa)
+                lider = vuelo is None
+                if lider:
+                    vuelo = _Vuelo()
+                    self._en_curso[clave_completa] = vuelo
+                    if relevo:
+                        self.relevos += 1
+                    else:
+                        self.lideres += 1
+                elif not relevo:
+                    self.seguidores += 1
+            if lider:
+                return self._liderar(etapa, clave_completa, vuelo, funcion, args, relevo)
+
+            reciente = vuelo.terminado.is_set()
+            if not vuelo.terminado.wait(max(limite - time.monotonic(), 0)):
+                # La primera petición no terminó a tiempo: se hace el trabajo sin esperarla más
+                metricas.incrementar('betaia_vuelo_unico_total', etapa=etapa, resultado='sin_esperar')
+                return _desenvolver(funcion(*args))[0]
+            if vuelo.valido:
+                metricas.incrementar('betaia_vuelo_unico_total', etapa=etapa,
+                                     resultado='reciente' if reciente else 'seguidor')
+                return vuelo.resultado
+            # El vuelo falló o quedó degradado: la primera que vuelva a entrar toma el relevo
+            relevo = True
+
+    def _liderar(self, etapa, clave_completa, vuelo, funcion, args, relevo):
+        metricas.incrementar('betaia_vuelo_unico_total', etapa=etapa, resultado='relevo' if relevo else 'lider')
+        try:
+            vuelo.resultado, vuelo.valido = _desenvolver(funcion(*args))
+        finally:
+            vuelo.fin = time.monotonic()
+            with self._lock:
+                self._en_curso.pop(clave_completa, None)
+                if vuelo.valido and self.ventana > 0:
+                    self._recientes[clave_completa] = vuelo
+            vuelo.terminado.set()
+        return vuelo.resultado
+
+    def estadisticas(self):
+        with self._lock:
+            return {'en_curso': len(self._en_curso), 'recientes': len(self._recientes), 'ventana': self.ventana,
+                    'lideres': self.lideres, 'seguidores': self.seguidores, 'relevos': self.relevos}